@@ -0,0 +1,199 @@
+"""
+Deterministic synthetic repositories for the benchmarks.
+
+The same parameters and seed always give the same files, the same
+history and the same object IDs: commits get fixed authors and
+timestamps, and history is written straight into the object store with
+tree_update instead of going through add/commit. Only the final
+checkout touches the worktree.
+
+Files are split into partitions: main changes partition 0 and feature
+branch k changes partition k+1. Branches therefore never conflict, and
+merging one back is just applying its changes on top of main. Every
+branch but the last is merged back into main. The last stays open as
+"feature" for the merge benchmark.
+"""
+
+import argparse
+import json
+import os
+import random
+import sys
+from datetime import datetime, timedelta, timezone
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from minigit.repository import repo_create, repo_file
+from minigit.objects.base import object_write
+from minigit.objects.blob import GitBlob
+from minigit.objects.tree import tree_update
+from minigit.commands.commit import _commit_create
+from minigit.worktree import checkout_trees
+
+AUTHOR = "Bench Mark <bench@example.com>"
+EPOCH = datetime(2024, 1, 1, tzinfo=timezone.utc)
+FILE_MODE = b"100644"
+# subdirectories per directory
+FANOUT = 8
+
+WORDS = ("alpha beta gamma delta epsilon zeta eta theta iota kappa lambda mu "
+         "nu xi omicron pi rho sigma tau upsilon phi chi psi omega").split()
+
+
+def _line(rng):
+    return (" ".join(rng.choice(WORDS) for _ in range(rng.randint(2, 12))) + "\n").encode()
+
+
+def _content(rng, size):
+    # text of roughly size bytes (half to one and a half times), so
+    # the line diff has real work to do
+    target = rng.randint(size // 2, size + size // 2)
+    lines, total = [], 0
+    while total < target:
+        line = _line(rng)
+        lines.append(line)
+        total += len(line)
+    return lines
+
+
+def _edit(rng, lines):
+    # rewrite, insert or drop a few lines
+    lines = list(lines)
+    for _ in range(rng.randint(1, 3)):
+        i = rng.randrange(len(lines) + 1)
+        op = rng.random()
+        if op < 0.5 and i < len(lines):
+            lines[i] = _line(rng)
+        elif op < 0.8 or len(lines) < 2:
+            lines.insert(i, _line(rng))
+        else:
+            del lines[min(i, len(lines) - 1)]
+    return lines
+
+
+def _layout(rng, files, depth):
+    dirs = [""]
+    level = [""]
+    for _ in range(depth):
+        level = [f"{parent}d{i:02d}/" for parent in level for i in range(FANOUT)]
+        dirs.extend(level)
+    return [f"{rng.choice(dirs)}f{n:05d}.txt" for n in range(files)]
+
+
+class _Builder:
+    def __init__(self, repo, rng, blob_size):
+        self.repo = repo
+        self.rng = rng
+        self.blob_size = blob_size
+        self.clock = 0
+
+    def blob(self, lines):
+        return object_write(GitBlob(b"".join(lines)), self.repo)
+
+    def commit(self, tree, parents, message):
+        self.clock += 1
+        ts = EPOCH + timedelta(minutes=self.clock)
+        return _commit_create(self.repo, tree, parents, AUTHOR, ts, message)
+
+    def step(self, head, tree, contents, paths, per_commit, message):
+        """
+        Edit per_commit files out of paths and commit on top of head.
+        Returns (commit, tree, {path: (mode, sha)} of the change).
+        """
+        changes = {}
+        for path in self.rng.sample(paths, min(per_commit, len(paths))):
+            contents[path] = _edit(self.rng, contents[path])
+            changes[path] = (FILE_MODE, self.blob(contents[path]))
+        tree = tree_update(self.repo, tree, changes)
+        return self.commit(tree, [head], message), tree, changes
+
+
+def generate_repo(path, files=1000, depth=2, blob_size=2048, commits=100, branches=2,
+                  branch_commits=5, per_commit=None, seed=0):
+    """
+    Create a repository at path: one initial commit with files files
+    spread over directories up to depth levels deep, then commits
+    further commits on main, each editing per_commit files (default 1%
+    of them). branches feature branches of branch_commits commits fork
+    from main at evenly spaced points. Returns a description of what
+    was built (parameters, branch names and commit IDs).
+    """
+    rng = random.Random(seed)
+    repo = repo_create(path)
+    if per_commit is None:
+        per_commit = max(1, files // 100)
+    names = _layout(rng, files, depth)
+    partitions = [names[k::branches + 1] for k in range(branches + 1)]
+    build = _Builder(repo, rng, blob_size)
+
+    contents = {name: _content(rng, blob_size) for name in names}
+    tree = tree_update(repo, None, {name: (FILE_MODE, build.blob(lines))
+                                    for name, lines in contents.items()})
+    main = build.commit(tree, [], "Initial commit")
+    root = main
+
+    forks = {(k + 1) * commits // (branches + 1): k for k in range(branches)}
+    pending = []  # merged back a few commits after forking
+    refs = {}
+    for n in range(1, commits + 1):
+        if n in forks:
+            k = forks[n]
+            name = "feature" if k == branches - 1 else f"topic-{k:02d}"
+            head, side_tree, side = main, tree, {}
+            branch_contents = {p: contents[p] for p in partitions[k + 1]}
+            for i in range(branch_commits):
+                head, side_tree, changes = build.step(
+                    head, side_tree, branch_contents, partitions[k + 1], per_commit,
+                    f"{name}: change {i + 1}")
+                side.update(changes)
+            refs[name] = head
+            if name != "feature":
+                pending.append((n + max(1, commits // (2 * (branches + 1))), name, head, side,
+                                branch_contents))
+        if pending and pending[0][0] <= n:
+            _, name, head, side, branch_contents = pending.pop(0)
+            contents.update(branch_contents)
+            tree = tree_update(repo, tree, side)
+            main = build.commit(tree, [main, head], f"Merge branch '{name}'")
+            continue
+        main, tree, _ = build.step(main, tree, contents, partitions[0], per_commit,
+                                   f"main: change {n}")
+    refs["main"] = main
+
+    for name, sha in refs.items():
+        with open(repo_file(repo, "refs", "heads", name), "w") as f:
+            f.write(sha + "\n")
+    checkout_trees(repo, None, tree)
+    return {
+        "params": {"files": files, "depth": depth, "blob_size": blob_size,
+                   "commits": commits, "branches": branches,
+                   "branch_commits": branch_commits, "per_commit": per_commit,
+                   "seed": seed},
+        "root": root,
+        "refs": refs,
+    }
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Generate a synthetic MiniGit repository.")
+    parser.add_argument("path", help="Directory to create (must not exist)")
+    parser.add_argument("--files", type=int, default=1000, help="Number of files")
+    parser.add_argument("--depth", type=int, default=2, help="Directory levels below the root")
+    parser.add_argument("--blob-size", type=int, default=2048, help="Average file size in bytes")
+    parser.add_argument("--commits", type=int, default=100, help="Commits on main after the first")
+    parser.add_argument("--branches", type=int, default=2, help="Feature branches forked from main")
+    parser.add_argument("--branch-commits", type=int, default=5, help="Commits on each feature branch")
+    parser.add_argument("--per-commit", type=int, default=None, help="Files edited per commit (default: 1%% of files)")
+    parser.add_argument("--seed", type=int, default=0, help="Random seed")
+    args = parser.parse_args(argv)
+    if os.path.exists(args.path):
+        raise Exception(f"{args.path} already exists")
+    info = generate_repo(args.path, files=args.files, depth=args.depth,
+                         blob_size=args.blob_size, commits=args.commits,
+                         branches=args.branches, branch_commits=args.branch_commits,
+                         per_commit=args.per_commit, seed=args.seed)
+    print(json.dumps(info, indent=2))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,292 @@
+"""
+Time MiniGit operations on generated repositories and compare the
+results with a stored baseline.
+
+    python benchmarks/run.py                        # small and medium
+    python benchmarks/run.py --scale large -r 3
+    python benchmarks/run.py --save-baseline        # record a baseline
+    python benchmarks/run.py --threshold 15         # exit 1 on >15% slowdowns
+
+Commands run in-process through minigit.cli.main, with output thrown
+away, against the minigit package next to this directory rather than
+any installed copy. Each operation gets its own copy of the generated
+repository, one untimed warm-up run and then --repeat timed runs.
+Medians are compared with the baseline. The baseline only means
+something on the machine that recorded it.
+"""
+
+import argparse
+import contextlib
+import json
+import os
+import platform
+import shutil
+import statistics
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from minigit.cli import main as minigit
+from minigit.repository import repo_find, repo_file
+from minigit.index import index_read
+from minigit.objects.base import object_read
+from minigit.objects.tree import mode_is_dir
+from minigit.refs import ref_resolve
+
+from generate import generate_repo
+
+HERE = os.path.dirname(os.path.abspath(__file__))
+DEFAULT_BASELINE = os.path.join(HERE, "baseline.json")
+DEFAULT_THRESHOLD = 10.0   # percent
+# differences below this many seconds are noise, whatever the ratio
+MIN_DELTA = 0.005
+
+SCALES = {
+    "small":  {"files": 200,   "depth": 1, "blob_size": 1024, "commits": 50,   "branches": 2},
+    "medium": {"files": 2000,  "depth": 2, "blob_size": 2048, "commits": 300,  "branches": 4},
+    "large":  {"files": 20000, "depth": 3, "blob_size": 4096, "commits": 2000, "branches": 8},
+}
+
+
+def _run(*argv):
+    with open(os.devnull, "w") as devnull, contextlib.redirect_stdout(devnull):
+        try:
+            minigit(list(argv))
+        except SystemExit as e:
+            # merge exits 1 on conflicts; anything else is a failure
+            if e.code not in (None, 0, 1):
+                raise
+
+
+def _touch(repo, count, round_):
+    """
+    Edit count tracked files on disk, differently in every round.
+    Returns their paths.
+    """
+    names = [e.name for e in index_read(repo).entries]
+    step = max(1, len(names) // count)
+    paths = names[round_ % step::step][:count]
+    for path in paths:
+        with open(os.path.join(repo.worktree, path), "ab") as f:
+            f.write(f"edit {round_}\n".encode())
+    return paths
+
+
+# Each benchmark is a function(repo) returning a (setup, timed) pair of
+# functions of the round number; setup runs before every timed call,
+# outside the clock.
+
+def bench_add(repo):
+    paths = []
+
+    def setup(n):
+        paths[:] = _touch(repo, 50, n)
+    return setup, lambda n: _run("add", *paths)
+
+
+def bench_commit(repo):
+    def setup(n):
+        _run("add", *_touch(repo, 50, n))
+    return setup, lambda n: _run("commit", "-m", f"bench {n}")
+
+
+def bench_status(repo):
+    _touch(repo, 10, 0)
+    return None, lambda n: _run("status")
+
+
+def bench_checkout(repo):
+    return None, lambda n: _run("checkout", "feature" if n % 2 == 0 else "main")
+
+
+def bench_diff(repo):
+    return None, lambda n: _run("diff", "main", "feature")
+
+
+def bench_diff_stat(repo):
+    return None, lambda n: _run("diff", "--stat", "main", "feature")
+
+
+def bench_log(repo):
+    return None, lambda n: _run("log")
+
+
+def bench_merge(repo):
+    main = ref_resolve(repo, "refs/heads/main")
+
+    def setup(n):
+        # a fresh branch at main to merge feature into
+        with open(repo_file(repo, "refs", "heads", f"bench-{n}"), "w") as f:
+            f.write(main + "\n")
+        _run("checkout", f"bench-{n}")
+    return setup, lambda n: _run("merge", "feature")
+
+
+def bench_index_read(repo):
+    return None, lambda n: index_read(repo_find(repo.worktree))
+
+
+def bench_object_read(repo):
+    def timed(n):
+        # a new repository object each time, so no cache carries over
+        fresh = repo_find(repo.worktree)
+        stack = [object_read(fresh, ref_resolve(fresh, "HEAD")).tree]
+        while stack:
+            for leaf in object_read(fresh, stack.pop()).items:
+                if mode_is_dir(leaf.mode):
+                    stack.append(leaf.sha)
+                else:
+                    object_read(fresh, leaf.sha)
+    return None, timed
+
+
+BENCHMARKS = {
+    "add": bench_add,
+    "commit": bench_commit,
+    "status": bench_status,
+    "checkout": bench_checkout,
+    "diff": bench_diff,
+    "diff_stat": bench_diff_stat,
+    "log": bench_log,
+    "merge": bench_merge,
+    "index_read": bench_index_read,
+    "object_read": bench_object_read,
+}
+
+
+def _clone(source, dest):
+    # objects never change once written, so the copy shares them with
+    # the source through hard links; everything else is copied
+    objects = os.path.join(source, ".minigit", "objects") + os.sep
+
+    def copy(src, dst):
+        if src.startswith(objects):
+            os.link(src, dst)
+        else:
+            shutil.copy2(src, dst)
+    shutil.copytree(source, dest, symlinks=True, copy_function=copy)
+
+
+def run_scale(name, params, ops, repeat, workdir):
+    """
+    Generate the repository for one scale and time ops on copies of
+    it. Returns {op: {"median", "min", "max", "runs"}} in seconds.
+    """
+    source = os.path.join(workdir, name)
+    started = time.perf_counter()
+    generate_repo(source, **params)
+    print(f"[{name}] generated in {time.perf_counter() - started:.1f}s", file=sys.stderr)
+    results = {}
+    cwd = os.getcwd()
+    try:
+        for op in ops:
+            copy = os.path.join(workdir, f"{name}-{op}")
+            _clone(source, copy)
+            os.chdir(copy)
+            setup, timed = BENCHMARKS[op](repo_find(copy))
+            runs = []
+            # round 0 is the warm-up
+            for n in range(repeat + 1):
+                if setup:
+                    setup(n)
+                started = time.perf_counter()
+                timed(n)
+                if n:
+                    runs.append(time.perf_counter() - started)
+            os.chdir(cwd)
+            shutil.rmtree(copy)
+            results[op] = {"median": statistics.median(runs), "min": min(runs),
+                           "max": max(runs), "runs": runs}
+            print(f"[{name}] {op:<12} {results[op]['median'] * 1000:10.1f} ms", file=sys.stderr)
+    finally:
+        os.chdir(cwd)
+    return results
+
+
+def compare(results, baseline, threshold, min_delta=MIN_DELTA):
+    """
+    Compare medians with the baseline. Returns a list of
+    (scale, op, old, new, change in percent, regressed) for the
+    benchmarks present in both.
+    """
+    rows = []
+    for scale, ops in results["scales"].items():
+        old_ops = baseline.get("scales", {}).get(scale)
+        if not old_ops or old_ops["params"] != ops["params"]:
+            continue
+        for op, res in ops["results"].items():
+            old = old_ops["results"].get(op)
+            if old is None:
+                continue
+            before, after = old["median"], res["median"]
+            change = (after - before) / before * 100 if before else 0.0
+            regressed = change > threshold and after - before > min_delta
+            rows.append((scale, op, before, after, change, regressed))
+    return rows
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Benchmark MiniGit operations.")
+    parser.add_argument("--scale", nargs="+", choices=sorted(SCALES), default=["small", "medium"],
+                        help="Repository sizes to run (default: small medium)")
+    parser.add_argument("--op", nargs="+", choices=list(BENCHMARKS), default=list(BENCHMARKS),
+                        help="Operations to time (default: all)")
+    parser.add_argument("-r", "--repeat", type=int, default=5, help="Timed runs per operation")
+    parser.add_argument("-o", "--output", default=None, help="Write results as JSON here")
+    parser.add_argument("--baseline", default=DEFAULT_BASELINE, help="Baseline JSON to compare with")
+    parser.add_argument("--save-baseline", action="store_true", help="Store these results as the baseline")
+    parser.add_argument("--threshold", type=float, default=DEFAULT_THRESHOLD,
+                        help="Slowdown in percent that counts as a regression (default: 10)")
+    parser.add_argument("--keep", metavar="DIR", default=None,
+                        help="Generate repositories in DIR and leave them there")
+    args = parser.parse_args(argv)
+
+    results = {
+        "python": platform.python_version(),
+        "platform": platform.platform(),
+        "repeat": args.repeat,
+        "scales": {},
+    }
+    workdir = args.keep or tempfile.mkdtemp(prefix="minigit-bench-")
+    os.makedirs(workdir, exist_ok=True)
+    try:
+        for scale in args.scale:
+            params = SCALES[scale]
+            results["scales"][scale] = {
+                "params": params,
+                "results": run_scale(scale, params, args.op, args.repeat, workdir),
+            }
+    finally:
+        if not args.keep:
+            shutil.rmtree(workdir, ignore_errors=True)
+
+    text = json.dumps(results, indent=2, sort_keys=True)
+    if args.output:
+        with open(args.output, "w") as f:
+            f.write(text + "\n")
+    else:
+        print(text)
+
+    if args.save_baseline:
+        with open(args.baseline, "w") as f:
+            f.write(text + "\n")
+        print(f"Baseline written to {args.baseline}", file=sys.stderr)
+        return 0
+    if not os.path.exists(args.baseline):
+        print(f"No baseline at {args.baseline}; use --save-baseline to record one.", file=sys.stderr)
+        return 0
+    with open(args.baseline) as f:
+        rows = compare(results, json.load(f), args.threshold)
+    failed = False
+    for scale, op, before, after, change, regressed in rows:
+        mark = "REGRESSION" if regressed else ""
+        print(f"{scale:<7} {op:<12} {before * 1000:10.1f} ms -> {after * 1000:10.1f} ms "
+              f"{change:+7.1f}% {mark}", file=sys.stderr)
+        failed = failed or regressed
+    return 1 if failed else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
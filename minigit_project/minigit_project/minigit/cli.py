@@ -19,6 +19,11 @@ from .commands.ls_files import cmd_ls_files
 from .commands.check_ignore import cmd_check_ignore
 from .commands.status import cmd_status
 from .commands.rm import cmd_rm
+from .commands.repack import cmd_repack
+from .commands.write_commit_graph import cmd_write_commit_graph
+from .commands.merge_base import cmd_merge_base
+from .commands.pack_refs import cmd_pack_refs
+from .commands.fsmonitor import cmd_fsmonitor
 
 def main(argv=None):
     if argv is None:
@@ -34,6 +39,7 @@ def main(argv=None):
 
     # add
     p = subparsers.add_parser("add", help="Add files contents to the index.")
+    p.add_argument("-j", "--jobs", type=int, default=None, help="Number of hashing workers (default: add.jobs or CPU count)")
     p.add_argument("path", nargs="+", help="Files to add")
     p.set_defaults(func=cmd_add)
 
@@ -44,7 +50,13 @@ def main(argv=None):
 
     # log
     p = subparsers.add_parser("log", help="Display history of a given commit.")
-    p.add_argument("commit", nargs="?", default="HEAD", help="Commit to start at.")
+    p.add_argument("--oneline", action="store_true", help="One line per commit: abbreviated ID and subject")
+    p.add_argument("--graphviz", action="store_true", help="Print the history as a Graphviz digraph")
+    p.add_argument("-n", "--max-count", type=int, default=None, help="Show at most this many commits")
+    p.add_argument("--since", default=None, help="Only commits newer than a date (YYYY-MM-DD, 'N days ago' or a timestamp)")
+    p.add_argument("--first-parent", action="store_true", help="Follow only the first parent of merges")
+    p.add_argument("--topo-order", action="store_true", help="Show no parent before all of its children")
+    p.add_argument("revisions", nargs="*", help="Commits to start at; A..B or ^A exclude history (default: HEAD)")
     p.set_defaults(func=cmd_log)
 
     # branch
@@ -54,6 +66,7 @@ def main(argv=None):
 
     # checkout
     p = subparsers.add_parser("checkout", help="Checkout a commit or branch.")
+    p.add_argument("-j", "--jobs", type=int, default=None, help="Number of file-writing workers (default: checkout.workers or CPU count)")
     p.add_argument("target", help="Branch name or commit hash to checkout.")
     p.set_defaults(func=cmd_checkout)
 
@@ -64,6 +77,13 @@ def main(argv=None):
 
     # diff
     p = subparsers.add_parser("diff", help="Show differences between commits.")
+    p.add_argument("--stat", action="store_true", help="Show a per-file summary of changed lines")
+    p.add_argument("--numstat", action="store_true", help="Show added and deleted line counts per file")
+    p.add_argument("-M", "--find-renames", action="store_true", help="Detect renames")
+    p.add_argument("-C", "--find-copies", action="store_true", help="Detect copies as well as renames")
+    p.add_argument("--rename-threshold", metavar="n%", default=None, help="Similarity needed for a rename or copy (default: diff.renamethreshold or 50%%)")
+    p.add_argument("--diff-algorithm", dest="algorithm", choices=["myers", "histogram"], default=None, help="Line diff algorithm (default: diff.algorithm or myers)")
+    p.add_argument("-j", "--jobs", type=int, default=None, help="Number of diff worker processes (default: diff.jobs or CPU count)")
     p.add_argument("commit1", help="First commit.")
     p.add_argument("commit2", help="Second commit.")
     p.set_defaults(func=cmd_diff)
@@ -111,7 +131,8 @@ def main(argv=None):
 
     # check-ignore
     p = subparsers.add_parser("check-ignore", help="Check path(s) against ignore rules.")
-    p.add_argument("path", nargs="+", help="Paths to check")
+    p.add_argument("--stdin", action="store_true", help="Read paths from standard input, one per line")
+    p.add_argument("path", nargs="*", help="Paths to check")
     p.set_defaults(func=cmd_check_ignore)
 
     # status
@@ -123,6 +144,33 @@ def main(argv=None):
     p.add_argument("path", nargs="+", help="Files to remove")
     p.set_defaults(func=cmd_rm)
 
+    # repack
+    p = subparsers.add_parser("repack", help="Pack objects into a packfile.")
+    p.add_argument("-d", dest="delete", action="store_true", help="Remove loose objects and old packs once packed")
+    p.set_defaults(func=cmd_repack)
+
+    # write-commit-graph
+    p = subparsers.add_parser("write-commit-graph", help="Write or refresh the commit-graph file.")
+    p.set_defaults(func=cmd_write_commit_graph)
+
+    # merge-base
+    p = subparsers.add_parser("merge-base", help="Find the best common ancestor(s) of commits.")
+    p.add_argument("--all", action="store_true", help="Print all merge bases instead of the best one")
+    p.add_argument("--is-ancestor", dest="is_ancestor", action="store_true", help="Exit 0 if the first commit is an ancestor of the second, 1 otherwise")
+    p.add_argument("commit", nargs="+", help="Commits to compare")
+    p.set_defaults(func=cmd_merge_base)
+
+    # pack-refs
+    p = subparsers.add_parser("pack-refs", help="Pack refs into the packed-refs file.")
+    p.add_argument("--no-prune", action="store_true", help="Keep the loose ref files.")
+    p.set_defaults(func=cmd_pack_refs)
+
+    # fsmonitor
+    p = subparsers.add_parser("fsmonitor", help="Run the filesystem monitor daemon (used when core.fsmonitor is set).")
+    p.add_argument("action", choices=["start", "stop", "status", "run"], help="run stays in the foreground")
+    p.add_argument("--backend", choices=["auto", "inotify", "poll"], default=None, help="Watcher to use (default: fsmonitor.backend or auto)")
+    p.set_defaults(func=cmd_fsmonitor)
+
     args = parser.parse_args(argv)
     args.func(args)
 
@@ -1,48 +1,78 @@
 import os
+from concurrent.futures import ThreadPoolExecutor
 from ..repository import repo_find
-from ..index import index_read, index_write, GitIndexEntry
+from ..index import index_read, index_write, index_entry_from_stat, cache_tree_invalidate
 from ..objects.base import object_hash
-from .rm import rm
+from ..fsmonitor import fsmonitor_changes, fsmonitor_positions, fsmonitor_dirty_dirs
 
 def cmd_add(args):
     """
-    Handle `minigit add <paths>…`
+    Handle `minigit add [-j N] <paths>…`
     """
     repo = repo_find()
-    add(repo, args.path)
-
-def add(repo, paths, delete=True, skip_missing=False):
-    # first remove any stale entries
-    rm(repo, paths, delete=False, skip_missing=True)
+    add(repo, args.path, jobs=args.jobs)
 
+def add(repo, paths, jobs=None):
     worktree = repo.worktree + os.sep
-    to_add = {
-        (os.path.abspath(p), os.path.relpath(os.path.abspath(p), repo.worktree))
-        for p in paths
-        if os.path.isfile(p) and os.path.abspath(p).startswith(worktree)
-    }
+    to_add, missing = set(), set()
+    for p in paths:
+        abspath = os.path.abspath(p)
+        if not abspath.startswith(worktree):
+            continue
+        relpath = os.path.relpath(abspath, repo.worktree)
+        if os.path.isfile(p):
+            to_add.add((relpath, abspath))
+        elif not os.path.lexists(p):
+            missing.add(relpath)
+    to_add = sorted(to_add)
 
     idx = index_read(repo)
-    for abspath, relpath in to_add:
-        with open(abspath, "rb") as f:
-            sha = object_hash(f, b"blob", repo)
-        st = os.stat(abspath)
-        entry = GitIndexEntry(
-            ctime=(int(st.st_ctime), st.st_ctime_ns % 10**9),
-            mtime=(int(st.st_mtime), st.st_mtime_ns % 10**9),
-            dev=st.st_dev,
-            ino=st.st_ino,
-            mode_type=0b1000,
-            mode_perms=0o644,
-            uid=st.st_uid,
-            gid=st.st_gid,
-            fsize=st.st_size,
-            sha=sha,
-            flag_assume_valid=False,
-            flag_stage=0,
-            name=relpath
-        )
-        idx.entries.append(entry)
+    # tracked files that are gone from the worktree: stage the removal
+    gone = {name for name in missing if idx.find(name) is not None}
+    changed = fsmonitor_changes(repo, idx)
+    if changed is None:
+        # nothing was checked, so no token can vouch for the entries
+        idx.fsmonitor = None
+    else:
+        # files the daemon saw no change in are staged as they are
+        suspects = {idx.entries[i].name for i in fsmonitor_positions(idx, changed)}
+        to_add = [(relpath, abspath) for relpath, abspath in to_add
+                  if relpath in suspects or idx.find(relpath) is None]
+        idx.fsmonitor_dirty = suspects - {relpath for relpath, _ in to_add} - gone
+        # the token moves on, but add never lists directories: forget
+        # the cached listings of those the daemon reported, so the next
+        # status reads them again and sees new untracked files
+        if idx.untracked:
+            for path in fsmonitor_dirty_dirs(changed):
+                idx.untracked.pop(path, None)
+
+    # hash, compress and write the blobs on a worker pool; zlib and
+    # hashlib release the GIL on each chunk, so threads run in parallel
+    if jobs is None:
+        jobs = repo.conf.getint("add", "jobs", fallback=os.cpu_count() or 1)
+    abspaths = [abspath for _, abspath in to_add]
+    if jobs > 1 and len(to_add) > 1:
+        with ThreadPoolExecutor(max_workers=jobs) as pool:
+            results = list(pool.map(lambda p: _hash_file(repo, p), abspaths))
+    else:
+        results = [_hash_file(repo, p) for p in abspaths]
+
+    # replace stale entries, drop removed ones and write the index once
+    names = {relpath for relpath, _ in to_add} | gone
+    idx.entries = [e for e in idx.entries if e.name not in names]
+    for name in names:
+        cache_tree_invalidate(idx, name)
+    for (relpath, _), (sha, st) in zip(to_add, results):
+        idx.entries.append(index_entry_from_stat(relpath, st, sha))
+    idx.entries.sort(key=lambda e: e.name)
 
     index_write(repo, idx)
     print(f"Added {len(to_add)} file(s) to the index.")
+    if gone:
+        print(f"Removed {len(gone)} file(s) from the index.")
+
+def _hash_file(repo, abspath):
+    with open(abspath, "rb") as f:
+        sha = object_hash(f, b"blob", repo)
+        st = os.fstat(f.fileno())
+    return sha, st
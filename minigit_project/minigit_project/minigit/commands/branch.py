@@ -1,6 +1,7 @@
-import os
 from ..repository import repo_find, repo_file
 from ..objects.base import object_find
+from ..objects.oid_index import object_abbrev
+from ..refs import ref_resolve
 
 def get_active_branch(repo):
     head = open(repo_file(repo,"HEAD")).read().strip()
@@ -14,9 +15,10 @@ def cmd_branch(args):
     """
     repo = repo_find()
     sha = object_find(repo, "HEAD")
-    path = repo_file(repo, "refs/heads", args.name, mkdir=True)
-    if os.path.exists(path):
+    # the branch may only exist in packed-refs
+    if ref_resolve(repo, f"refs/heads/{args.name}") is not None:
         raise Exception(f"Branch {args.name} already exists.")
+    path = repo_file(repo, "refs/heads", args.name, mkdir=True)
     with open(path,"w") as f:
         f.write(sha + "\n")
-    print(f"Branch {args.name} created at {sha[:7]}")
+    print(f"Branch {args.name} created at {object_abbrev(repo, sha)}")
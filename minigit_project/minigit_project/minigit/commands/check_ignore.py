@@ -1,12 +1,22 @@
+import os
+import sys
 from ..repository import repo_find
 from ..ignore import gitignore_read, check_ignore
 
 def cmd_check_ignore(args):
     """
-    Handle `minigit check-ignore <paths>…`
+    Handle `minigit check-ignore [--stdin] <paths>…`
     """
     repo = repo_find()
     rules = gitignore_read(repo)
-    for p in args.path:
-        if check_ignore(rules, p):
-            print(p)
+    paths = args.path
+    if args.stdin:
+        paths = (line.rstrip("\n") for line in sys.stdin)
+    elif not paths:
+        raise Exception("No paths given.")
+    for p in paths:
+        if not p:
+            continue
+        is_dir = p.endswith("/") or os.path.isdir(os.path.join(repo.worktree, p))
+        if check_ignore(rules, p, is_dir):
+            print(p, flush=args.stdin)
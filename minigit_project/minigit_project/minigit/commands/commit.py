@@ -2,10 +2,10 @@ import os
 from datetime import datetime
 import configparser
 from ..repository import repo_find, repo_file
-from ..index import index_read
+from ..index import index_read, index_write, index_write_tree
 from ..objects.base import object_find, object_write
+from ..objects.oid_index import object_abbrev
 from ..objects.commit import GitCommit
-from ..objects.tree import GitTree, GitTreeLeaf
 from ..refs import ref_resolve
 from .branch import get_active_branch
 
@@ -15,26 +15,33 @@ def cmd_commit(args):
     """
     repo = repo_find()
     idx = index_read(repo)
-    tree = _tree_from_index(repo, idx)
+    tree = index_write_tree(repo, idx)
+    # keep the freshly computed cache-tree for the next commit
+    index_write(repo, idx)
     parent = object_find(repo, "HEAD")
+    parents = [parent] if parent else []
+    message = args.message
+    # concluding a merge that stopped on conflicts
+    merge_head = repo_file(repo, "MERGE_HEAD")
+    merge_msg = repo_file(repo, "MERGE_MSG")
+    if os.path.exists(merge_head):
+        with open(merge_head) as f:
+            parents.append(f.read().strip())
+        if message is None and os.path.exists(merge_msg):
+            with open(merge_msg) as f:
+                message = f.read().strip()
+    if message is None:
+        raise Exception("No commit message given (use -m).")
     author = _gitconfig_user_get(_gitconfig_read())
-    new_sha = _commit_create(repo, tree, [parent] if parent else [], author, datetime.now(), args.message)
+    new_sha = _commit_create(repo, tree, parents, author, datetime.now(), message)
     branch = get_active_branch(repo)
     ref = f"refs/heads/{branch}" if branch else "HEAD"
     with open(repo_file(repo, ref), "w") as f:
         f.write(new_sha + "\n")
-    print(f"Committed {new_sha[:7]}")
-
-def _tree_from_index(repo, idx):
-    """
-    Build a tree object from the index entries.
-    """
-    # simple flat-tree for illustration
-    tree = GitTree()
-    for e in idx.entries:
-        leaf = GitTreeLeaf(mode=b"100644", path=e.name, sha=e.sha)
-        tree.items.append(leaf)
-    return object_write(tree, repo)
+    for path in (merge_head, merge_msg):
+        if os.path.exists(path):
+            os.remove(path)
+    print(f"Committed {object_abbrev(repo, new_sha)}")
 
 def _commit_create(repo, tree_sha, parents, author, ts, msg):
     c = GitCommit()
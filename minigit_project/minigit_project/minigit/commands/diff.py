@@ -1,41 +1,138 @@
-import difflib
+import os
+import sys
+from concurrent.futures import ProcessPoolExecutor
 from ..repository import repo_find
 from ..objects.base import object_read, object_find
+from ..commit_graph import commit_tree
+from ..tree_diff import tree_diff, ADDED, DELETED, MODIFIED, RENAMED
+from ..rename import DEFAULT_RENAME_SCORE, detect_renames, parse_score
+from ..xdiff import ALGORITHMS, diff_lines, is_binary, split_lines, unified_hunks
+
+# below this many changed files a worker pool costs more than it saves
+PARALLEL_DIFF_MIN = 8
+# widest +/- bar drawn by --stat
+STAT_GRAPH_WIDTH = 50
 
 def cmd_diff(args):
+    """
+    Handle `minigit diff [--stat|--numstat] [-M|-C] [--rename-threshold n%] [--diff-algorithm A] [-j N] <c1> <c2>`
+    """
     repo = repo_find()
-    sha1 = object_find(repo, args.commit1)
-    sha2 = object_find(repo, args.commit2)
-    dict1 = tree_to_dict(repo, sha1)
-    dict2 = tree_to_dict(repo, sha2)
-    for path in sorted(set(dict1) | set(dict2)):
-        b1, b2 = dict1.get(path), dict2.get(path)
-        if b1 == b2:
-            continue
-        if b1 is None:
-            print(f"Only in {args.commit2}: {path}")
-        elif b2 is None:
-            print(f"Only in {args.commit1}: {path}")
-        else:
-            c1 = object_read(repo, b1).blobdata.decode("utf-8").splitlines()
-            c2 = object_read(repo, b2).blobdata.decode("utf-8").splitlines()
-            for line in difflib.unified_diff(c1, c2, fromfile=path, tofile=path, lineterm=""):
-                print(line)
-
-def tree_to_dict(repo, commit_sha, prefix=""):
-    from ..objects.base import object_find, object_read
-    # resolve commit → tree SHA
-    obj = object_read(repo, object_find(repo, commit_sha, fmt=b"commit"))
-    tree_sha = obj.kvlm[b"tree"].decode()
-    # now traverse
-    def _traverse(tsha, pref):
-        d = {}
-        tree = object_read(repo, object_find(repo, tsha, fmt=b"tree"))
-        for leaf in tree.items:
-            p = pref + leaf.path
-            if leaf.mode.startswith(b"04"):
-                d.update(_traverse(leaf.sha, p + "/"))
+    algorithm = args.algorithm or repo.conf.get("diff", "algorithm", fallback="myers")
+    if algorithm not in ALGORITHMS:
+        raise Exception(f"Unknown diff algorithm: {algorithm}")
+    tree1 = commit_tree(repo, object_find(repo, args.commit1, fmt=b"commit"))
+    tree2 = commit_tree(repo, object_find(repo, args.commit2, fmt=b"commit"))
+    changes = tree_diff(repo, tree1, tree2)
+    if args.find_renames or args.find_copies:
+        threshold = args.rename_threshold or repo.conf.get("diff", "renamethreshold", fallback=None)
+        threshold = parse_score(threshold) if threshold else DEFAULT_RENAME_SCORE
+        changes = detect_renames(repo, changes, threshold, copies=args.find_copies)
+    changes = [c for c in changes if c.status != MODIFIED or c.old_sha != c.new_sha]
+    stat_only = args.stat or args.numstat
+
+    tasks = [(c.old_path, c.path, c.status, c.old_sha, c.new_sha, algorithm, stat_only) for c in changes
+             if stat_only or c.status not in (ADDED, DELETED)]
+    jobs = args.jobs
+    if jobs is None:
+        jobs = repo.conf.getint("diff", "jobs", fallback=os.cpu_count() or 1)
+    if jobs > 1 and len(tasks) >= PARALLEL_DIFF_MIN:
+        with ProcessPoolExecutor(max_workers=jobs, initializer=_worker_init,
+                                 initargs=(repo.worktree,)) as pool:
+            results = list(pool.map(_worker_diff, tasks, chunksize=4))
+    else:
+        results = [file_diff(repo, *task) for task in tasks]
+
+    out = sys.stdout.buffer
+    if args.numstat:
+        for path, added, deleted, binary, _ in results:
+            if binary:
+                out.write(f"-\t-\t{path}\n".encode())
+            else:
+                out.write(f"{added}\t{deleted}\t{path}\n".encode())
+    elif args.stat:
+        _write_stat(out, results)
+    else:
+        results = iter(results)
+        for change in changes:
+            if change.status == ADDED:
+                out.write(f"Only in {args.commit2}: {change.path}\n".encode())
+            elif change.status == DELETED:
+                out.write(f"Only in {args.commit1}: {change.path}\n".encode())
             else:
-                d[p] = leaf.sha
-        return d
-    return _traverse(tree_sha, prefix)
+                if change.old_path != change.path:
+                    verb = "Renamed" if change.status == RENAMED else "Copied"
+                    out.write(f"{verb} {change.old_path} -> {change.path} ({change.score}% similar)\n".encode())
+                out.write(next(results)[4])
+    out.flush()
+
+def file_diff(repo, old_path, path, status, old_sha, new_sha, algorithm="myers", stat_only=False):
+    """
+    Diff one file between two blobs (None for a missing side). Returns
+    (name, lines added, lines deleted, binary, patch bytes), where name
+    is "old => new" for renames and copies; for binary files the counts
+    are the old and new sizes in bytes. The patch is empty when
+    stat_only is set or the content did not change.
+    """
+    name = path if old_path == path else f"{old_path} => {path}"
+    if old_sha == new_sha:
+        return name, 0, 0, False, b""
+    old = object_read(repo, old_sha).blobdata if old_sha else b""
+    new = object_read(repo, new_sha).blobdata if new_sha else b""
+    if is_binary(old) or is_binary(new):
+        patch = b"" if stat_only else f"Binary files {name} differ\n".encode()
+        return name, len(old), len(new), True, patch
+    a, b = split_lines(old), split_lines(new)
+    if status == ADDED:
+        return name, len(b), 0, False, b""
+    if status == DELETED:
+        return name, 0, len(a), False, b""
+    ca, cb = diff_lines(a, b, algorithm)
+    added, deleted = sum(cb), sum(ca)
+    if stat_only:
+        return name, added, deleted, False, b""
+    lines = [f"--- {old_path}\n+++ {path}\n".encode()]
+    lines.extend(unified_hunks(a, b, ca, cb))
+    return name, added, deleted, False, b"".join(lines)
+
+_worker_repo = None
+
+def _worker_init(worktree):
+    global _worker_repo
+    _worker_repo = repo_find(worktree)
+
+def _worker_diff(task):
+    return file_diff(_worker_repo, *task)
+
+def _write_stat(out, results):
+    if not results:
+        return
+    width = max(len(path) for path, *_ in results)
+    counts = [len(str(a + d)) for _, a, d, binary, _ in results if not binary]
+    digits = max(counts) if counts else 0
+    most = max([a + d for _, a, d, binary, _ in results if not binary] or [0])
+    scale = min(1.0, STAT_GRAPH_WIDTH / most) if most else 1.0
+    total_added = total_deleted = 0
+    for path, added, deleted, binary, _ in results:
+        if binary:
+            old_size, new_size = added, deleted
+            out.write(f" {path:<{width}} | Bin {old_size} -> {new_size} bytes\n".encode())
+            continue
+        total_added += added
+        total_deleted += deleted
+        plus, minus = _scaled(added, scale), _scaled(deleted, scale)
+        line = f" {path:<{width}} | {added + deleted:>{digits}} {'+' * plus}{'-' * minus}"
+        out.write((line.rstrip() + "\n").encode())
+    files = len(results)
+    summary = f" {files} file{'s' if files != 1 else ''} changed"
+    if total_added or not total_deleted:
+        summary += f", {total_added} insertion{'s' if total_added != 1 else ''}(+)"
+    if total_deleted or not total_added:
+        summary += f", {total_deleted} deletion{'s' if total_deleted != 1 else ''}(-)"
+    out.write((summary + "\n").encode())
+
+def _scaled(count, scale):
+    # anything that changed keeps at least one mark
+    if not count:
+        return 0
+    return max(1, int(count * scale))
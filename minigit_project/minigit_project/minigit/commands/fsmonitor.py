@@ -0,0 +1,20 @@
+from ..repository import repo_find
+from ..fsmonitor import fsmonitor_run, fsmonitor_start, fsmonitor_stop, fsmonitor_ping
+
+def cmd_fsmonitor(args):
+    """
+    Handle `minigit fsmonitor start|stop|status|run [--backend B]`
+    """
+    repo = repo_find()
+    if args.action == "run":
+        fsmonitor_run(repo, args.backend)
+    elif args.action == "start":
+        if fsmonitor_start(repo, args.backend):
+            print(f"fsmonitor started ({fsmonitor_ping(repo)}).")
+        else:
+            print("fsmonitor is already running.")
+    elif args.action == "stop":
+        print("fsmonitor stopped." if fsmonitor_stop(repo) else "fsmonitor is not running.")
+    else:
+        backend = fsmonitor_ping(repo)
+        print(f"fsmonitor is running ({backend})." if backend else "fsmonitor is not running.")
@@ -1,29 +1,98 @@
+import os
+import re
+import sys
+from datetime import datetime, timedelta, timezone
 from ..repository import repo_find
-from ..objects.base import object_find, object_read
+from ..objects.base import object_read
+from ..objects.oid_index import object_abbrev
+from ..commit_graph import commit_parents
+from ..revwalk import rev_walk, rev_parse_range, ORDER_DATE, ORDER_TOPO
+
+_RELATIVE = re.compile(r"(\d+)[ .](second|minute|hour|day|week)s?[ .]ago$")
 
 def cmd_log(args):
     """
-    Handle `minigit log [commit]`
+    Handle `minigit log [--oneline|--graphviz] [-n N] [--since D] [--first-parent] [--topo-order] [rev…]`
     """
     repo = repo_find()
-    start = object_find(repo, args.commit)
+    include, exclude = rev_parse_range(repo, args.revisions or ["HEAD"])
+    since = parse_since(args.since) if args.since else None
+    shas = rev_walk(repo, include, exclude,
+                    order=ORDER_TOPO if args.topo_order else ORDER_DATE,
+                    max_count=args.max_count, since=since,
+                    first_parent=args.first_parent)
+    try:
+        if args.graphviz:
+            _graph(repo, shas, args.first_parent)
+        else:
+            for i, sha in enumerate(shas):
+                commit = object_read(repo, sha)
+                if args.oneline:
+                    print(_oneline(repo, sha, commit))
+                else:
+                    print(("\n" if i else "") + _medium(sha, commit))
+    except BrokenPipeError:
+        # the reader (e.g. head or a pager) went away; stop quietly
+        os.dup2(os.open(os.devnull, os.O_WRONLY), sys.stdout.fileno())
+
+def parse_since(text):
+    """
+    Seconds since the epoch from "YYYY-MM-DD[ HH:MM[:SS]]", "N days ago"
+    (or seconds/minutes/hours/weeks) or a plain timestamp.
+    """
+    if text.isdigit():
+        return int(text)
+    m = _RELATIVE.match(text.strip())
+    if m:
+        delta = timedelta(**{m.group(2) + "s": int(m.group(1))})
+        return int((datetime.now(timezone.utc) - delta).timestamp())
+    for fmt in ("%Y-%m-%d %H:%M:%S", "%Y-%m-%d %H:%M", "%Y-%m-%d"):
+        try:
+            return int(datetime.strptime(text, fmt).timestamp())
+        except ValueError:
+            pass
+    raise Exception(f"Cannot parse date: {text}")
+
+def _subject(commit):
+    return commit.message.decode("utf-8", "replace").split("\n", 1)[0]
+
+def _oneline(repo, sha, commit):
+    return f"{object_abbrev(repo, sha)} {_subject(commit)}"
+
+def _format_ident(ident):
+    """
+    ("Name <email>", "Thu Oct 16 12:00:00 2026 +0200") from an author
+    or committer line.
+    """
+    name, ts, tz = ident.decode("utf-8", "replace").rsplit(" ", 2)
+    sign = -1 if tz.startswith("-") else 1
+    offset = timedelta(hours=int(tz[1:3]), minutes=int(tz[3:5])) * sign
+    when = datetime.fromtimestamp(int(ts), timezone(offset))
+    return name, f"{when:%a %b} {when.day} {when:%H:%M:%S %Y} {tz}"
+
+def _medium(sha, commit):
+    lines = [f"commit {sha}"]
+    parents = commit.parents
+    if len(parents) > 1:
+        lines.append("Merge: " + " ".join(p[:7] for p in parents))
+    author = commit.author
+    if author:
+        name, date = _format_ident(author)
+        lines.append(f"Author: {name}")
+        lines.append(f"Date:   {date}")
+    lines.append("")
+    message = commit.message.decode("utf-8", "replace").rstrip("\n")
+    lines.extend("    " + line if line else "" for line in message.split("\n"))
+    return "\n".join(lines)
+
+def _graph(repo, shas, first_parent):
     print("digraph minigitlog{")
     print("  node[shape=rect]")
-    _graph(repo, start, set())
+    for sha in shas:
+        commit = object_read(repo, sha)
+        msg = _subject(commit).replace("\\","\\\\").replace("\"","\\\"")
+        print(f"  c_{sha} [label=\"{sha[:7]}: {msg}\"]")
+        parents = commit_parents(repo, sha)
+        for p_sha in parents[:1] if first_parent else parents:
+            print(f"  c_{sha} -> c_{p_sha};")
     print("}")
-
-def _graph(repo, sha, seen):
-    if sha in seen:
-        return
-    seen.add(sha)
-    commit = object_read(repo, sha)
-    msg = commit.kvlm[None].decode().split("\n",1)[0]
-    msg = msg.replace("\\","\\\\").replace("\"","\\\"")
-    print(f"  c_{sha} [label=\"{sha[:7]}: {msg}\"]")
-    parents = commit.kvlm.get(b"parent", [])
-    if isinstance(parents, bytes):
-        parents = [parents]
-    for p in parents:
-        p_sha = p.decode()
-        print(f"  c_{sha} -> c_{p_sha};")
-        _graph(repo, p_sha, seen)
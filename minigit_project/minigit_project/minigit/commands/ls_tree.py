@@ -1,5 +1,6 @@
 from ..repository import repo_find
 from ..objects.base import object_find, object_read
+from ..objects.tree import mode_is_dir
 
 def cmd_ls_tree(args):
     """
@@ -12,8 +13,8 @@ def cmd_ls_tree(args):
 def _ls(repo, sha, recurse, prefix):
     tree = object_read(repo, sha)
     for leaf in tree.items:
-        typ = "tree" if leaf.mode.startswith(b"04") else "blob"
+        typ = "tree" if mode_is_dir(leaf.mode) else "blob"
         path = prefix + leaf.path
-        print(f"{leaf.mode.decode()} {typ} {leaf.sha}\t{path}")
+        print(f"{leaf.mode.decode().zfill(6)} {typ} {leaf.sha}\t{path}")
         if recurse and typ=="tree":
             _ls(repo, leaf.sha, recurse, path + "/")
@@ -1,10 +1,19 @@
 import os
+import sys
 import configparser
 from datetime import datetime
 from ..repository import repo_find, repo_file
 from ..refs import ref_resolve
-from ..objects.base import object_read, object_find, object_write
-from ..objects.tree import GitTree, GitTreeLeaf
+from ..objects.base import object_read, object_write
+from ..objects.blob import GitBlob
+from ..objects.tree import GitTree, GitTreeLeaf, TREE_MODE, mode_is_dir, tree_leaf, tree_update
+from ..commit_graph import commit_parents, commit_tree
+from ..tree_diff import tree_diff, RENAMED
+from ..rename import detect_renames
+from ..merge_base import merge_base
+from ..worktree import checkout_trees
+from ..xdiff import is_binary
+from ..xmerge import merge3
 from .branch import get_active_branch
 
 def cmd_merge(args):
@@ -23,14 +32,28 @@ def cmd_merge(args):
     current_tree = get_tree(repo, current_commit)
     target_tree = get_tree(repo, target_commit)
     ancestor_tree = get_tree(repo, ancestor)
-    merged_tree = merge_trees(repo, ancestor_tree, current_tree, target_tree)
+    merged_tree, conflicts = merge_trees(repo, ancestor_tree, current_tree, target_tree,
+                                         labels=("HEAD", target_branch))
+    # bring the worktree and index along before moving the branch
+    checkout_trees(repo, current_tree, merged_tree)
+    message = f"Merge branch '{target_branch}' into '{current_branch}'"
+    if conflicts:
+        # leave the result for the user to fix; commit picks these up
+        with open(repo_file(repo, "MERGE_HEAD"), "w") as f:
+            f.write(target_commit + "\n")
+        with open(repo_file(repo, "MERGE_MSG"), "w") as f:
+            f.write(message + "\n")
+        for path, kind in conflicts:
+            print(f"CONFLICT ({kind}): Merge conflict in {path}")
+        print("Automatic merge failed; fix conflicts and then commit the result.")
+        sys.exit(1)
     author = gitconfig_user_get(gitconfig_read())
     new_sha = commit_create(
         repo, merged_tree,
         [current_commit, target_commit],
         author,
         datetime.now(),
-        f"Merge branch '{target_branch}' into '{current_branch}'"
+        message
     )
     head_ref = repo_file(repo, "refs", "heads", current_branch)
     with open(head_ref, "w") as f:
@@ -38,8 +61,7 @@ def cmd_merge(args):
     print(f"Merged branch {target_branch} into {current_branch}")
 
 def get_tree(repo, commit_sha):
-    c = object_read(repo, commit_sha)
-    return c.kvlm[b"tree"].decode()
+    return commit_tree(repo, commit_sha)
 
 def get_commit_history(repo, sha):
     seen = set()
@@ -49,53 +71,212 @@ def get_commit_history(repo, sha):
         if cur in seen:
             continue
         seen.add(cur)
-        commit = object_read(repo, cur)
-        parents = commit.kvlm.get(b"parent", [])
-        if isinstance(parents, bytes):
-            parents = [parents]
-        for p in parents:
-            stack.append(p.decode())
+        stack.extend(commit_parents(repo, cur))
     return seen
 
 def find_common_ancestor(repo, c1, c2):
-    h1 = get_commit_history(repo, c1)
-    h2 = get_commit_history(repo, c2)
-    common = h1 & h2
-    return next(iter(common), None)
-
-def tree_to_dict(repo, tree_sha, prefix=""):
-    from ..objects.base import object_find, object_read
-    sha = object_find(repo, tree_sha, fmt=b"tree")
-    tree = object_read(repo, sha)
-    d = {}
-    for leaf in tree.items:
-        path = prefix + leaf.path
-        if leaf.mode.startswith(b"04"):
-            d.update(tree_to_dict(repo, leaf.sha, path + "/"))
-        else:
-            d[path] = leaf.sha
-    return d
-
-def merge_trees(repo, ancestor_sha, current_sha, target_sha):
-    a = tree_to_dict(repo, ancestor_sha)
-    c = tree_to_dict(repo, current_sha)
-    t = tree_to_dict(repo, target_sha)
-    merged = {}
-    for path in set(a) | set(c) | set(t):
-        av, cv, tv = a.get(path), c.get(path), t.get(path)
-        if cv == tv:
-            merged[path] = cv
-        elif cv == av:
-            merged[path] = tv
-        elif tv == av:
-            merged[path] = cv
-        else:
-            raise Exception(f"CONFLICT: both modified {path}")
+    return merge_base(repo, c1, c2)
+
+def merge_trees(repo, ancestor_sha, current_sha, target_sha, labels=("ours", "theirs")):
+    """
+    Three-way merge of trees. Returns (merged tree SHA, conflicts),
+    where conflicts lists (path, kind) for every path that needs a
+    hand. A subtree one side left as in the ancestor is taken whole
+    from the other side without being read, so the cost follows what
+    diverged. Files both sides changed are merged line by line, keeping
+    conflict markers (labelled with labels) where the changes overlap.
+    Files renamed on one side are followed (see _follow_renames) unless
+    merge.renames is false. Where a file and a directory meet, the
+    directory keeps the path and the file moves to "path~<label>".
+    """
+    conflicts = []
+    if repo.conf.getboolean("merge", "renames", fallback=True):
+        ancestor_sha, current_sha, target_sha = _follow_renames(repo, ancestor_sha, current_sha, target_sha,
+                                                                conflicts)
+    algorithm = repo.conf.get("diff", "algorithm", fallback="myers")
+    merged = _merge_tree(repo, ancestor_sha, current_sha, target_sha, "", labels, algorithm, conflicts)
+    return (merged if merged else object_write(GitTree(), repo)), conflicts
+
+def _merge_tree(repo, base, ours, theirs, prefix, labels, algorithm, conflicts):
+    if ours == theirs or base == theirs:
+        return ours
+    if base == ours:
+        return theirs
+    b, o, t = (_tree_entries(repo, sha) for sha in (base, ours, theirs))
+    names = set(b) | set(o) | set(t)
     tree = GitTree()
-    for p, sha in merged.items():
-        tree.items.append(GitTreeLeaf(mode=b"100644", path=p, sha=sha))
+    aside = []
+    for name in sorted(names):
+        eb, eo, et = b.get(name), o.get(name), t.get(name)
+        # raw (mode, binary SHA) pairs settle most entries undecoded
+        if eo == et or eb == et:
+            if eo is not None:
+                tree.items.append(tree_leaf(eo[0], name, eo[1]))
+            continue
+        if eb == eo:
+            if et is not None:
+                tree.items.append(tree_leaf(et[0], name, et[1]))
+            continue
+        lb, lo, lt = (None if e is None else tree_leaf(e[0], name, e[1]) for e in (eb, eo, et))
+        local = name.decode("utf-8")
+        merged = _merge_entry(repo, lb, lo, lt, prefix + local, labels, algorithm, conflicts, aside)
+        if merged is not None:
+            tree.items.append(GitTreeLeaf(mode=merged[0], path=local, sha=merged[1]))
+    if aside:
+        taken = {name.decode("utf-8") for name in names}
+    for name, label, entry in aside:
+        # a file that met a directory, kept next to it under a new name
+        new_name = _aside_name(name, label, taken)
+        taken.add(new_name)
+        tree.items.append(GitTreeLeaf(mode=entry[0], path=new_name, sha=entry[1]))
+    if not tree.items:
+        return None
     return object_write(tree, repo)
 
+def _tree_entries(repo, sha):
+    if sha is None:
+        return {}
+    return {name: (mode, binsha) for mode, name, binsha in object_read(repo, sha).entries()}
+
+def _is_dir(leaf):
+    return leaf is not None and mode_is_dir(leaf.mode)
+
+def _same(a, b):
+    if a is None or b is None:
+        return a is b
+    return a.sha == b.sha and a.mode == b.mode
+
+def _entry(leaf):
+    return None if leaf is None else (leaf.mode, leaf.sha)
+
+def _aside_name(name, label, taken):
+    candidate = f"{name}~{label.replace('/', '_')}"
+    n = 0
+    while candidate in taken:
+        n += 1
+        candidate = f"{name}~{label.replace('/', '_')}_{n}"
+    return candidate
+
+def _merge_entry(repo, base, ours, theirs, path, labels, algorithm, conflicts, aside):
+    """
+    Merge one tree entry; returns (mode, sha) or None if it goes away.
+    A file that clashes with a directory is added to aside as
+    (name, label of its side, (mode, sha)) for the caller to place.
+    """
+    if _same(ours, theirs) or _same(base, theirs):
+        return _entry(ours)
+    if _same(base, ours):
+        return _entry(theirs)
+    if _is_dir(ours) or _is_dir(theirs):
+        if ours is not None and theirs is not None and _is_dir(ours) != _is_dir(theirs):
+            conflicts.append((path, "file/directory"))
+            side = 1 if _is_dir(ours) else 0
+            aside.append((path.rsplit("/", 1)[-1], labels[side], _entry((ours, theirs)[side])))
+            return _entry(theirs if side == 0 else ours)
+        sha = _merge_tree(repo, base.sha if _is_dir(base) else None,
+                          ours.sha if ours else None, theirs.sha if theirs else None,
+                          path + "/", labels, algorithm, conflicts)
+        return (TREE_MODE, sha) if sha else None
+    if _is_dir(base):
+        base = None
+    if ours is None or theirs is None:
+        if base is not None:
+            conflicts.append((path, "modify/delete"))
+        return _entry(ours or theirs)
+
+    if ours.mode == theirs.mode or (base is not None and base.mode == theirs.mode):
+        mode = ours.mode
+    elif base is not None and base.mode == ours.mode:
+        mode = theirs.mode
+    else:
+        conflicts.append((path, "mode"))
+        mode = ours.mode
+    if ours.sha == theirs.sha or (base is not None and base.sha == theirs.sha):
+        return (mode, ours.sha)
+    if base is not None and base.sha == ours.sha:
+        return (mode, theirs.sha)
+    if not (ours.mode.startswith(b"100") and theirs.mode.startswith(b"100")):
+        conflicts.append((path, "content"))
+        return (mode, ours.sha)
+    base_data = object_read(repo, base.sha).blobdata if base is not None else b""
+    ours_data = object_read(repo, ours.sha).blobdata
+    theirs_data = object_read(repo, theirs.sha).blobdata
+    if is_binary(base_data) or is_binary(ours_data) or is_binary(theirs_data):
+        conflicts.append((path, "binary"))
+        return (mode, ours.sha)
+    merged, count = merge3(base_data, ours_data, theirs_data, labels[0], labels[1], algorithm)
+    if count:
+        conflicts.append((path, "content" if base is not None else "add/add"))
+    return (mode, object_write(GitBlob(merged), repo))
+
+def _change_target(change):
+    if change.new_sha is None:
+        return None
+    return (change.new_mode, change.new_sha)
+
+def _follow_renames(repo, ancestor_sha, current_sha, target_sha, conflicts):
+    """
+    Move each file renamed on one side to its new path in the ancestor
+    and in the other side, so the merge compares the file with itself
+    instead of seeing a delete and an unrelated add. A file renamed
+    differently on both sides is kept under both new names, and a
+    rename onto a path the other side added is not followed; both are
+    reported in conflicts.
+    """
+    ours = detect_renames(repo, tree_diff(repo, ancestor_sha, current_sha))
+    theirs = detect_renames(repo, tree_diff(repo, ancestor_sha, target_sha))
+    ours_renames = {c.old_path: c for c in ours if c.status == RENAMED}
+    theirs_renames = {c.old_path: c for c in theirs if c.status == RENAMED}
+    if not ours_renames and not theirs_renames:
+        return ancestor_sha, current_sha, target_sha
+    ours_at = _side_paths(ours)
+    theirs_at = _side_paths(theirs)
+    ancestor_moves, current_moves, target_moves = {}, {}, {}
+    for renames, other_renames, other_at, other_moves in (
+            (ours_renames, theirs_renames, theirs_at, target_moves),
+            (theirs_renames, ours_renames, ours_at, current_moves)):
+        for old, change in renames.items():
+            other = other_renames.get(old)
+            if other is not None and other.path != change.path:
+                # each side keeps its own name; both were "added"
+                if renames is ours_renames:
+                    conflicts.append((old, "rename/rename"))
+                continue
+            if other is None and change.path in other_at:
+                # left as a delete and an add, which the merge then
+                # reconciles with whatever the other side put there
+                if other_at[change.path] not in (None, _change_target(change)):
+                    conflicts.append((change.path, "rename/add"))
+                continue
+            original = (change.old_mode, change.old_sha)
+            ancestor_moves[old] = None
+            ancestor_moves[change.path] = original
+            if other is not None:
+                continue
+            # carry over the other side's version, unless it deleted it
+            entry = other_at.get(old, original)
+            if entry is not None:
+                other_moves[old] = None
+                other_moves[change.path] = entry
+    return (_moved(repo, ancestor_sha, ancestor_moves),
+            _moved(repo, current_sha, current_moves),
+            _moved(repo, target_sha, target_moves))
+
+def _side_paths(changes):
+    # path -> (mode, sha) or None for every path a side changed
+    paths = {}
+    for change in changes:
+        if change.status == RENAMED:
+            paths[change.old_path] = None
+        paths[change.path] = _change_target(change)
+    return paths
+
+def _moved(repo, tree_sha, moves):
+    if not moves:
+        return tree_sha
+    moved = tree_update(repo, tree_sha, moves)
+    return moved if moved else object_write(GitTree(), repo)
+
 def commit_create(repo, tree_sha, parents, author, ts, msg):
     from ..objects.commit import GitCommit
     c = GitCommit()
@@ -0,0 +1,22 @@
+import sys
+from ..repository import repo_find
+from ..objects.base import object_find
+from ..merge_base import merge_bases, is_ancestor
+
+def cmd_merge_base(args):
+    """
+    Handle `minigit merge-base [--all | --is-ancestor] <commit> <commit>…`
+    """
+    repo = repo_find()
+    shas = [object_find(repo, name, fmt=b"commit") for name in args.commit]
+    if args.is_ancestor:
+        if len(shas) != 2:
+            raise Exception("--is-ancestor takes exactly two commits.")
+        sys.exit(0 if is_ancestor(repo, shas[0], shas[1]) else 1)
+    if len(shas) < 2:
+        raise Exception("merge-base needs at least two commits.")
+    bases = merge_bases(repo, shas[0], shas[1:])
+    if not bases:
+        sys.exit(1)
+    for sha in (bases if args.all else bases[:1]):
+        print(sha)
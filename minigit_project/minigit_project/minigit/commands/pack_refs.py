@@ -0,0 +1,38 @@
+import os
+from ..repository import repo_find
+from ..refs import ref_names, ref_read, packed_refs_write
+
+def cmd_pack_refs(args):
+    """
+    Handle `minigit pack-refs [--no-prune]`
+    """
+    repo = repo_find()
+    count = pack_refs(repo, prune=not args.no_prune)
+    print(f"Packed {count} ref(s).")
+
+def pack_refs(repo, prune=True):
+    """
+    Move every ref into packed-refs; with prune, delete the loose
+    files that are now redundant. Symbolic refs stay loose.
+    """
+    refs = [(name, sha) for name, sha in ref_names(repo)
+            if not (ref_read(repo, name) or "").startswith("ref: ")]
+    packed_refs_write(repo, refs)
+    if prune:
+        for name, sha in refs:
+            path = os.path.join(repo.gitdir, name)
+            # leave refs alone that were updated while we were packing
+            if os.path.isfile(path) and ref_read(repo, name) == sha:
+                os.remove(path)
+                _prune_empty_dirs(repo, os.path.dirname(path))
+    return len(refs)
+
+def _prune_empty_dirs(repo, path):
+    # keep refs/heads, refs/tags and their siblings themselves
+    stop = os.path.join(repo.gitdir, "refs")
+    while os.path.dirname(path) != stop and path.startswith(stop + os.sep):
+        try:
+            os.rmdir(path)
+        except OSError:
+            break
+        path = os.path.dirname(path)
@@ -0,0 +1,40 @@
+import os
+from ..repository import repo_find, repo_file
+from ..objects.base import loose_object_ids
+from ..objects.pack import pack_write, packs_load, packs_reset
+
+def cmd_repack(args):
+    """
+    Handle `minigit repack [-d]`
+    """
+    repo = repo_find()
+    repack(repo, delete=args.delete)
+
+def repack(repo, delete=False):
+    loose = list(loose_object_ids(repo))
+    old_packs = [p.idx_path for p in packs_load(repo)]
+    shas = set(loose)
+    for pack in packs_load(repo):
+        shas.update(pack.shas())
+    if not shas:
+        print("Nothing to pack.")
+        return None
+    window = repo.conf.getint("pack", "window", fallback=10)
+    depth = repo.conf.getint("pack", "depth", fallback=50)
+    name, count, deltas = pack_write(repo, shas, window=window, depth=depth)
+    print(f"Packed {count} object(s) ({deltas} delta(s)) into pack-{name}.pack")
+    if delete:
+        # everything now lives in the new pack
+        packs_reset(repo)
+        for sha in loose:
+            os.remove(repo_file(repo, "objects", sha[:2], sha[2:]))
+        for prefix in {sha[:2] for sha in loose}:
+            objdir = repo_file(repo, "objects", prefix)
+            if not os.listdir(objdir):
+                os.rmdir(objdir)
+        stale = [p for p in old_packs if os.path.basename(p) != f"pack-{name}.idx"]
+        for idx_path in stale:
+            os.remove(idx_path)
+            os.remove(idx_path[:-4] + ".pack")
+        print(f"Removed {len(loose)} loose object(s) and {len(stale)} old pack(s).")
+    return name
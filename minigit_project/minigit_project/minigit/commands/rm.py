@@ -1,6 +1,6 @@
 import os
 from ..repository import repo_find
-from ..index import index_read, index_write
+from ..index import index_read, index_write, cache_tree_invalidate
 
 def cmd_rm(args):
     """
@@ -13,19 +13,18 @@ def rm(repo, paths, delete=True, skip_missing=False):
     idx = index_read(repo)
     worktree = repo.worktree + os.sep
     abspaths = {os.path.abspath(p) for p in paths if os.path.abspath(p).startswith(worktree)}
-    kept = []
     removed = []
-    for e in idx.entries:
-        full = os.path.join(repo.worktree, e.name)
-        if full in abspaths:
-            removed.append(full)
-            abspaths.remove(full)
-            if delete:
-                os.remove(full)
-        else:
-            kept.append(e)
+    for full in sorted(abspaths):
+        name = os.path.relpath(full, repo.worktree)
+        if not idx.remove(name):
+            continue
+        removed.append(full)
+        cache_tree_invalidate(idx, name)
+        abspaths.remove(full)
+        # already deleted outside minigit: just unstage it
+        if delete and os.path.lexists(full):
+            os.remove(full)
     if abspaths and not skip_missing:
         raise Exception(f"Paths not in the index: {abspaths}")
-    idx.entries = kept
     index_write(repo, idx)
     print(f"Removed {len(removed)} file(s) from the index.")
@@ -1,14 +1,19 @@
-import os
 from ..repository import repo_find
-from ..index import index_read
+from ..index import index_read, index_write, index_write_tree
 from ..refs import ref_resolve
+from ..worktree import worktree_changes, worktree_untracked
+from ..fsmonitor import fsmonitor_changes
+from ..commit_graph import commit_tree
+from ..tree_diff import tree_diff
 from .branch import get_active_branch
 
 
 def cmd_status(args):
     """
     Handle `minigit status`.
-    Compares HEAD tree vs index entries to show added, modified, deleted.
+    Diffs the HEAD tree against the index to show staged changes, then
+    the index vs the working tree (through the stat cache) to show
+    unstaged ones, and finally files that are not tracked at all.
     """
     repo = repo_find()
     idx = index_read(repo)
@@ -19,50 +24,40 @@ def cmd_status(args):
     else:
         print(f"HEAD detached at {head_ref}")
 
-    # Build HEAD tree map: path -> sha
-    head_tree = _build_tree_map(repo, head_ref) if head_ref else {}
+    # Compare HEAD vs an in-memory tree of the index; directories
+    # with a valid cache-tree keep their recorded IDs and get skipped
+    head_tree = commit_tree(repo, head_ref) if head_ref else None
+    trees = {}
+    index_tree = index_write_tree(repo, idx, trees)
+    staged = []
+    for change in tree_diff(repo, head_tree, index_tree, trees):
+        staged.append(f"  {change.status + ':':<10}{change.path}")
+
+    if staged:
+        print("Changes to be committed:")
+        for line in staged:
+            print(line)
+
+    # Compare worktree vs index, only where the fsmonitor daemon (if
+    # any) saw changes
+    fsmonitor_state = (idx.fsmonitor, idx.fsmonitor_dirty)
+    changed = fsmonitor_changes(repo, idx)
+    modified, deleted, refreshed = worktree_changes(repo, idx, changed)
+    unstaged = sorted([(p, "modified: ") for p in modified] + [(p, "deleted:  ") for p in deleted])
+    if unstaged:
+        print("Changes not staged for commit:")
+        for path, label in unstaged:
+            print(f"  {label}{path}")
+
+    untracked, untracked_changed = worktree_untracked(repo, idx, changed=changed)
+    if untracked:
+        print("Untracked files:")
+        for path in untracked:
+            print(f"  {path}")
+
+    # keep the refreshed stat data, directory listings and fsmonitor
+    # token so the next run can skip rehashing and rescanning
+    fsmonitor_changed = idx.fsmonitor is not None and fsmonitor_state != (idx.fsmonitor, idx.fsmonitor_dirty)
+    if refreshed or untracked_changed or fsmonitor_changed:
+        index_write(repo, idx)
 
-    # Track files from HEAD not in index
-    remaining = dict(head_tree)
-
-    # Compare index vs HEAD
-    for entry in idx.entries:
-        if entry.name in head_tree:
-            if head_tree[entry.name] != entry.sha:
-                print(f"  modified: {entry.name}")
-            remaining.pop(entry.name, None)
-        else:
-            print(f"  added:    {entry.name}")
-
-    # Files in HEAD not in index
-    for path in sorted(remaining):
-        print(f"  deleted:  {path}")
-
-
-def _build_tree_map(repo, ref, prefix=""):
-    """
-    Recursively build a map of file paths to blob SHAs from a commit or tree reference.
-    """
-    from ..objects.base import object_read, object_find
-
-    # Resolve commit -> tree SHA
-    try:
-        commit_sha = object_find(repo, ref, fmt=b"commit")
-        commit = object_read(repo, commit_sha)
-        tree_sha = commit.kvlm[b"tree"].decode()
-    except Exception:
-        # maybe ref is already a tree SHA
-        tree_sha = object_find(repo, ref, fmt=b"tree")
-
-    def _recurse(tree_sha, base):
-        tree = object_read(repo, object_find(repo, tree_sha, fmt=b"tree"))
-        mapping = {}
-        for leaf in tree.items:
-            path = os.path.join(base, leaf.path)
-            if leaf.mode.startswith(b"04"):
-                mapping.update(_recurse(leaf.sha, path))
-            else:
-                mapping[path] = leaf.sha
-        return mapping
-
-    return _recurse(tree_sha, prefix)
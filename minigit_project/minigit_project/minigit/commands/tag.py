@@ -3,6 +3,7 @@ import configparser
 from ..repository import repo_find
 from ..refs import ref_list, show_ref, ref_create
 from ..objects.base import object_find, object_write
+from ..objects.oid_index import object_abbrev
 from ..objects.tag import GitTag
 
 def cmd_tag(args):
@@ -20,12 +21,12 @@ def cmd_tag(args):
             }
             tag_sha = object_write(tag, repo)
             ref_create(repo, f"tags/{args.name}", tag_sha)
-            print(f"Annotated tag {args.name} -> {tag_sha[:7]}")
+            print(f"Annotated tag {args.name} -> {object_abbrev(repo, tag_sha)}")
         else:
             ref_create(repo, f"tags/{args.name}", sha)
-            print(f"Tag {args.name} -> {sha[:7]}")
+            print(f"Tag {args.name} -> {object_abbrev(repo, sha)}")
     else:
-        tags = ref_list(repo).get("tags", {})
+        tags = ref_list(repo, "refs/tags/")
         show_ref(repo, tags, with_hash=False, prefix="refs/tags")
 
 def gitconfig_read():
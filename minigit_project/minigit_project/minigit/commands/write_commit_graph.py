@@ -0,0 +1,10 @@
+from ..repository import repo_find
+from ..commit_graph import commit_graph_write
+
+def cmd_write_commit_graph(args):
+    """
+    Handle `minigit write-commit-graph`
+    """
+    repo = repo_find()
+    count = commit_graph_write(repo)
+    print(f"Wrote commit-graph with {count} commit(s).")
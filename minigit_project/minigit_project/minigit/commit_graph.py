@@ -0,0 +1,269 @@
+"""
+Commit-graph file: a sorted table of commit IDs with one fixed-width row
+per commit holding its root tree, parent positions, generation number
+and commit time, so revision walks need not inflate commit objects.
+
+Layout of .minigit/commit-graph:
+    "CGPH" | version (1) | 3 reserved bytes | count (4)
+    fan-out table: 256 x 4-byte cumulative counts
+    commit IDs:    count x 20 bytes, sorted
+    rows:          count x (tree 20 | parent1 4 | parent2 4 | generation 4 | time 8)
+    extra edges:   count (4) | 4-byte parent positions
+    SHA-1 of everything above
+A parent slot holds NO_PARENT, a position in the ID table, or (parent2
+only) EXTRA_EDGE | index of the first entry in the extra edge list for
+commits with more than two parents; the last such entry is flagged
+with EXTRA_EDGE.
+"""
+
+import os
+import mmap
+import struct
+import hashlib
+
+from .repository import repo_file
+
+MAGIC = b"CGPH"
+VERSION = 1
+NO_PARENT = 0x70000000
+EXTRA_EDGE = 0x80000000
+GENERATION_INFINITY = 0xFFFFFFFF
+
+ROW = struct.Struct(">20sIIIQ")
+HEADER_SIZE = 12
+
+
+class CommitGraph:
+    """
+    A commit-graph file opened read-only through mmap.
+    """
+
+    def __init__(self, path):
+        with open(path, "rb") as f:
+            self.buf = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        if self.buf[:4] != MAGIC or self.buf[4] != VERSION:
+            raise Exception(f"Unsupported commit-graph file {path}")
+        self.count = struct.unpack_from(">I", self.buf, 8)[0]
+        self.fanout = struct.unpack_from(">256I", self.buf, HEADER_SIZE)
+        self._oid_base = HEADER_SIZE + 256 * 4
+        self._row_base = self._oid_base + 20 * self.count
+        self._edge_base = self._row_base + ROW.size * self.count + 4
+
+    def close(self):
+        self.buf.close()
+
+    def sha_at(self, pos):
+        off = self._oid_base + 20 * pos
+        return self.buf[off:off + 20].hex()
+
+    def lookup(self, sha):
+        """
+        Position of a commit in the graph, or None.
+        """
+        binsha = bytes.fromhex(sha)
+        first = binsha[0]
+        lo = self.fanout[first - 1] if first else 0
+        hi = self.fanout[first]
+        while lo < hi:
+            mid = (lo + hi) // 2
+            off = self._oid_base + 20 * mid
+            cur = self.buf[off:off + 20]
+            if cur < binsha:
+                lo = mid + 1
+            elif cur > binsha:
+                hi = mid
+            else:
+                return mid
+        return None
+
+    def _row(self, pos):
+        return ROW.unpack_from(self.buf, self._row_base + ROW.size * pos)
+
+    def tree(self, pos):
+        return self._row(pos)[0].hex()
+
+    def parents(self, pos):
+        """
+        Parent positions, in commit order.
+        """
+        _, p1, p2, _, _ = self._row(pos)
+        if p1 == NO_PARENT:
+            return []
+        if p2 == NO_PARENT:
+            return [p1]
+        if not p2 & EXTRA_EDGE:
+            return [p1, p2]
+        out = [p1]
+        i = p2 & ~EXTRA_EDGE
+        while True:
+            edge = struct.unpack_from(">I", self.buf, self._edge_base + 4 * i)[0]
+            out.append(edge & ~EXTRA_EDGE)
+            if edge & EXTRA_EDGE:
+                return out
+            i += 1
+
+    def generation(self, pos):
+        return self._row(pos)[3]
+
+    def commit_time(self, pos):
+        return self._row(pos)[4]
+
+
+def commit_graph(repo):
+    """
+    The repository's commit graph, or None if none has been written.
+    """
+    if repo.commit_graph is None:
+        path = repo_file(repo, "commit-graph")
+        repo.commit_graph = CommitGraph(path) if os.path.isfile(path) else False
+    return repo.commit_graph or None
+
+
+def _graph_pos(repo, sha):
+    graph = commit_graph(repo)
+    if graph:
+        pos = graph.lookup(sha)
+        if pos is not None:
+            return graph, pos
+    return None, None
+
+
+def _read_commit(repo, sha):
+    from .objects.base import object_read
+    commit = object_read(repo, sha)
+    if commit is None or commit.fmt != b"commit":
+        raise Exception(f"Not a commit: {sha}")
+    return commit
+
+
+def commit_parents(repo, sha):
+    """
+    Parent SHAs of a commit, from the commit graph when it covers sha.
+    """
+    graph, pos = _graph_pos(repo, sha)
+    if graph:
+        return [graph.sha_at(p) for p in graph.parents(pos)]
+    return _read_commit(repo, sha).parents
+
+
+def commit_tree(repo, sha):
+    graph, pos = _graph_pos(repo, sha)
+    if graph:
+        return graph.tree(pos)
+    return _read_commit(repo, sha).tree
+
+
+def commit_time(repo, sha):
+    """
+    Committer timestamp (seconds since the epoch).
+    """
+    graph, pos = _graph_pos(repo, sha)
+    if graph:
+        return graph.commit_time(pos)
+    return _read_commit(repo, sha).commit_time
+
+
+def commit_generation(repo, sha):
+    """
+    Topological level (roots are 1), or GENERATION_INFINITY for
+    commits the graph does not cover yet.
+    """
+    graph, pos = _graph_pos(repo, sha)
+    if graph:
+        return graph.generation(pos)
+    return GENERATION_INFINITY
+
+
+def _ref_tips(repo):
+    from .refs import ref_list, ref_resolve
+    from .objects.base import object_read
+
+    def walk(refs):
+        for val in refs.values():
+            if isinstance(val, dict):
+                yield from walk(val)
+            elif val:
+                yield val
+
+    tips = set()
+    for sha in list(walk(ref_list(repo))) + [ref_resolve(repo, "HEAD")]:
+        # peel annotated tags down to commits
+        obj = object_read(repo, sha) if sha else None
+        while obj is not None and obj.fmt == b"tag":
+            sha = obj.target
+            obj = object_read(repo, sha)
+        if obj is not None and obj.fmt == b"commit":
+            tips.add(sha)
+    return tips
+
+
+def commit_graph_write(repo):
+    """
+    Write (or refresh) .minigit/commit-graph covering every commit
+    reachable from the refs plus those already in the old graph.
+    Returns the number of commits written.
+    """
+    old = commit_graph(repo)
+    todo = list(_ref_tips(repo))
+    if old:
+        todo.extend(old.sha_at(i) for i in range(old.count))
+    parents = {}
+    while todo:
+        sha = todo.pop()
+        if sha in parents:
+            continue
+        parents[sha] = commit_parents(repo, sha)
+        todo.extend(p for p in parents[sha] if p not in parents)
+
+    # generations, parents first, without recursion
+    generation = {}
+    for sha in parents:
+        stack = [sha]
+        while stack:
+            cur = stack[-1]
+            if cur in generation:
+                stack.pop()
+                continue
+            missing = [p for p in parents[cur] if p not in generation]
+            if missing:
+                stack.extend(missing)
+            else:
+                generation[cur] = 1 + max((generation[p] for p in parents[cur]), default=0)
+                stack.pop()
+
+    shas = sorted(parents)
+    pos = {sha: i for i, sha in enumerate(shas)}
+    counts = [0] * 256
+    for sha in shas:
+        counts[int(sha[:2], 16)] += 1
+    out = [MAGIC, bytes([VERSION, 0, 0, 0]), struct.pack(">I", len(shas))]
+    total = 0
+    for c in counts:
+        total += c
+        out.append(struct.pack(">I", total))
+    out.extend(bytes.fromhex(sha) for sha in shas)
+    edges = []
+    for sha in shas:
+        ps = [pos[p] for p in parents[sha]]
+        p1 = ps[0] if ps else NO_PARENT
+        if len(ps) <= 2:
+            p2 = ps[1] if len(ps) == 2 else NO_PARENT
+        else:
+            p2 = EXTRA_EDGE | len(edges)
+            edges.extend(ps[1:-1])
+            edges.append(EXTRA_EDGE | ps[-1])
+        tree = bytes.fromhex(commit_tree(repo, sha))
+        out.append(ROW.pack(tree, p1, p2, generation[sha], commit_time(repo, sha)))
+    out.append(struct.pack(">I", len(edges)))
+    out.extend(struct.pack(">I", e) for e in edges)
+    data = b"".join(out)
+    data += hashlib.sha1(data).digest()
+
+    path = repo_file(repo, "commit-graph")
+    with open(path + ".tmp", "wb") as f:
+        f.write(data)
+    if old:
+        old.close()
+    repo.commit_graph = None
+    os.replace(path + ".tmp", path)
+    return len(shas)
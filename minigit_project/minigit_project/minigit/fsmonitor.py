@@ -0,0 +1,430 @@
+"""
+Filesystem monitor. A daemon watches the worktree (inotify through
+ctypes where the kernel has it, periodic rescans otherwise) and keeps a
+journal of changed paths. Clients ask it over .minigit/fsmonitor.sock
+for everything that changed since the token they stored in the index,
+and get back a new token plus the paths, or a request to scan
+everything when their token belongs to an earlier daemon or an
+overflowed journal.
+
+Protocol: the client sends one line ("query <token>", "ping" or
+"stop"); the answer to a query is NUL-separated fields: the new token,
+"delta" or "full", then the changed paths.
+"""
+
+import os
+import sys
+import time
+import stat
+import errno
+import select
+import socket
+import struct
+import threading
+import subprocess
+import socketserver
+
+SOCKET_NAME = "fsmonitor.sock"
+DEFAULT_POLL_INTERVAL = 1.0
+QUERY_TIMEOUT = 5.0
+
+IN_MODIFY = 0x2
+IN_ATTRIB = 0x4
+IN_CLOSE_WRITE = 0x8
+IN_MOVED_FROM = 0x40
+IN_MOVED_TO = 0x80
+IN_CREATE = 0x100
+IN_DELETE = 0x200
+IN_DELETE_SELF = 0x400
+IN_MOVE_SELF = 0x800
+IN_Q_OVERFLOW = 0x4000
+IN_IGNORED = 0x8000
+IN_ONLYDIR = 0x01000000
+IN_ISDIR = 0x40000000
+IN_NONBLOCK = os.O_NONBLOCK
+IN_CLOEXEC = 0o2000000
+WATCH_MASK = (IN_MODIFY | IN_ATTRIB | IN_CLOSE_WRITE | IN_MOVED_FROM | IN_MOVED_TO
+              | IN_CREATE | IN_DELETE | IN_DELETE_SELF | IN_MOVE_SELF | IN_ONLYDIR)
+EVENT = struct.Struct("iIII")  # wd, mask, cookie, name length
+
+
+def socket_path(repo):
+    return os.path.join(repo.gitdir, SOCKET_NAME)
+
+
+class Journal:
+    """
+    Changed paths with the sequence number of their latest change. A
+    token is "<instance>:<seq>"; reset() starts a new instance, which
+    invalidates every token handed out before.
+    """
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.reset()
+
+    def reset(self):
+        with self.lock:
+            self.instance = os.urandom(8).hex()
+            self.seq = 0
+            self.changes = {}
+
+    def record(self, path):
+        with self.lock:
+            self.seq += 1
+            self.changes[path] = self.seq
+
+    def since(self, token):
+        """
+        (new token, paths changed after token), where paths is None if
+        token is unknown and the caller must check everything.
+        """
+        with self.lock:
+            new_token = f"{self.instance}:{self.seq}"
+            instance, _, seq = (token or "").partition(":")
+            if instance != self.instance or not seq.isdigit() or int(seq) > self.seq:
+                return new_token, None
+            seq = int(seq)
+            return new_token, [p for p, s in self.changes.items() if s > seq]
+
+
+def _walk(top):
+    # (relpath, lstat) of everything below top except .minigit
+    stack = [""]
+    while stack:
+        rel = stack.pop()
+        try:
+            it = os.scandir(os.path.join(top, rel))
+        except OSError:
+            continue
+        with it:
+            for entry in it:
+                if not rel and entry.name == ".minigit":
+                    continue
+                path = rel + "/" + entry.name if rel else entry.name
+                try:
+                    st = entry.stat(follow_symlinks=False)
+                except OSError:
+                    continue
+                yield path, st
+                if stat.S_ISDIR(st.st_mode):
+                    stack.append(path)
+
+
+class PollWatcher:
+    """
+    Portable backend: rescans the worktree every `interval` seconds (and
+    on every query) and journals paths whose lstat data changed.
+    """
+
+    def __init__(self, worktree, journal, interval=DEFAULT_POLL_INTERVAL):
+        self.worktree = worktree
+        self.journal = journal
+        self.interval = interval
+        self.lock = threading.Lock()
+        self.snapshot = self._scan()
+
+    def _scan(self):
+        return {path: (st.st_mode, st.st_mtime_ns, st.st_size, st.st_ino)
+                for path, st in _walk(self.worktree)}
+
+    def sync(self):
+        with self.lock:
+            current = self._scan()
+            for path, key in current.items():
+                if self.snapshot.get(path) != key:
+                    self.journal.record(path)
+            for path in self.snapshot:
+                if path not in current:
+                    self.journal.record(path)
+            self.snapshot = current
+
+    def run(self, stopped):
+        while not stopped.wait(self.interval):
+            self.sync()
+
+    def close(self):
+        pass
+
+
+class InotifyWatcher:
+    """
+    Linux backend: one inotify watch per directory, added as
+    directories appear. Events are drained by the watcher thread and
+    before every query, so a query sees everything done before it.
+    """
+
+    def __init__(self, worktree, journal):
+        import ctypes
+        import ctypes.util
+        self.libc = ctypes.CDLL(ctypes.util.find_library("c") or "libc.so.6", use_errno=True)
+        self.worktree = worktree
+        self.journal = journal
+        self.lock = threading.Lock()
+        self.fd = self.libc.inotify_init1(IN_NONBLOCK | IN_CLOEXEC)
+        if self.fd < 0:
+            raise OSError(ctypes.get_errno(), "inotify_init1 failed")
+        self.dirs = {}  # watch descriptor -> directory relpath
+        # set when a directory could not be watched (e.g. the watch
+        # limit was hit); every query then asks for a full scan
+        self.failed = False
+        self._watch_tree("")
+
+    def _watch(self, rel):
+        import ctypes
+        full = os.path.join(self.worktree, rel) if rel else self.worktree
+        wd = self.libc.inotify_add_watch(self.fd, os.fsencode(full), WATCH_MASK)
+        if wd < 0:
+            err = ctypes.get_errno()
+            if err in (errno.ENOENT, errno.ENOTDIR):
+                return False
+            raise OSError(err, f"inotify_add_watch failed for {full}")
+        self.dirs[wd] = rel
+        return True
+
+    def _watch_tree(self, rel, record=False):
+        # files created before the watch existed are journalled here
+        if not self._watch(rel):
+            return
+        for path, st in _walk(os.path.join(self.worktree, rel) if rel else self.worktree):
+            path = rel + "/" + path if rel else path
+            if record:
+                self.journal.record(path)
+            if stat.S_ISDIR(st.st_mode):
+                self._watch(path)
+
+    def sync(self):
+        with self.lock:
+            if self.failed:
+                self.journal.reset()
+            while True:
+                try:
+                    data = os.read(self.fd, 64 * 1024)
+                except BlockingIOError:
+                    return
+                self._handle(data)
+
+    def _handle(self, data):
+        pos = 0
+        while pos < len(data):
+            wd, mask, _, size = EVENT.unpack_from(data, pos)
+            name = os.fsdecode(data[pos + EVENT.size:pos + EVENT.size + size].rstrip(b"\x00"))
+            pos += EVENT.size + size
+            if mask & IN_Q_OVERFLOW:
+                # events were lost: nobody can trust their token now
+                self.journal.reset()
+                for old in list(self.dirs):
+                    self.libc.inotify_rm_watch(self.fd, old)
+                self.dirs = {}
+                self._watch_tree("")
+                continue
+            parent = self.dirs.get(wd)
+            if parent is None:
+                continue
+            if mask & IN_IGNORED:
+                del self.dirs[wd]
+                continue
+            if not name:
+                if parent:
+                    self.journal.record(parent)
+                continue
+            if not parent and name == ".minigit":
+                continue
+            path = parent + "/" + name if parent else name
+            self.journal.record(path)
+            if mask & IN_ISDIR and mask & (IN_CREATE | IN_MOVED_TO):
+                try:
+                    self._watch_tree(path, record=True)
+                except OSError:
+                    self.failed = True
+                    self.journal.reset()
+
+    def run(self, stopped):
+        while not stopped.is_set():
+            ready, _, _ = select.select([self.fd], [], [], 0.5)
+            if ready:
+                self.sync()
+
+    def close(self):
+        os.close(self.fd)
+
+
+def _watcher(repo, journal, backend=None):
+    if backend is None:
+        backend = repo.conf.get("fsmonitor", "backend", fallback="auto")
+    if backend in ("auto", "inotify") and sys.platform.startswith("linux"):
+        try:
+            return InotifyWatcher(repo.worktree, journal)
+        except OSError:
+            if backend == "inotify":
+                raise
+    elif backend == "inotify":
+        raise Exception("inotify is not available on this platform.")
+    interval = repo.conf.getfloat("fsmonitor", "pollinterval", fallback=DEFAULT_POLL_INTERVAL)
+    return PollWatcher(repo.worktree, journal, interval)
+
+
+class _Handler(socketserver.StreamRequestHandler):
+    def handle(self):
+        line = self.rfile.readline().decode("utf-8").strip()
+        cmd, _, arg = line.partition(" ")
+        server = self.server
+        if cmd == "query":
+            server.watcher.sync()
+            token, paths = server.journal.since(arg)
+            fields = [token, "full"] if paths is None else [token, "delta"] + paths
+            self.wfile.write("\x00".join(fields).encode("utf-8"))
+        elif cmd == "ping":
+            self.wfile.write(type(server.watcher).__name__.encode())
+        elif cmd == "stop":
+            self.wfile.write(b"ok")
+            threading.Thread(target=server.shutdown, daemon=True).start()
+
+
+def fsmonitor_run(repo, backend=None):
+    """
+    Run the daemon in the foreground until a "stop" request arrives.
+    """
+    path = socket_path(repo)
+    if fsmonitor_ping(repo):
+        raise Exception("An fsmonitor daemon is already running.")
+    if os.path.exists(path):
+        os.remove(path)  # left over from a daemon that died
+    journal = Journal()
+    watcher = _watcher(repo, journal, backend)
+    stopped = threading.Event()
+    thread = threading.Thread(target=watcher.run, args=(stopped,), daemon=True)
+    server = socketserver.UnixStreamServer(path, _Handler)
+    server.journal = journal
+    server.watcher = watcher
+    thread.start()
+    try:
+        server.serve_forever()
+    finally:
+        stopped.set()
+        thread.join()
+        watcher.close()
+        server.server_close()
+        if os.path.exists(path):
+            os.remove(path)
+
+
+def fsmonitor_start(repo, backend=None):
+    """
+    Start the daemon in the background and wait until it answers.
+    """
+    if fsmonitor_ping(repo):
+        return False
+    cmd = [sys.executable, "-m", "minigit.cli", "fsmonitor", "run"]
+    if backend:
+        cmd += ["--backend", backend]
+    env = dict(os.environ)
+    package_root = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+    env["PYTHONPATH"] = os.pathsep.join(filter(None, [package_root, env.get("PYTHONPATH")]))
+    subprocess.Popen(cmd, cwd=repo.worktree, env=env, start_new_session=True,
+                     stdin=subprocess.DEVNULL, stdout=subprocess.DEVNULL,
+                     stderr=subprocess.DEVNULL)
+    deadline = time.time() + QUERY_TIMEOUT
+    while time.time() < deadline:
+        if fsmonitor_ping(repo):
+            return True
+        time.sleep(0.05)
+    raise Exception("fsmonitor daemon did not start.")
+
+
+def _request(repo, line):
+    sock = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+    sock.settimeout(QUERY_TIMEOUT)
+    try:
+        sock.connect(socket_path(repo))
+        sock.sendall(line.encode("utf-8") + b"\n")
+        chunks = []
+        while True:
+            data = sock.recv(64 * 1024)
+            if not data:
+                break
+            chunks.append(data)
+    finally:
+        sock.close()
+    return b"".join(chunks).decode("utf-8")
+
+
+def fsmonitor_ping(repo):
+    """
+    Name of the running daemon's backend, or None.
+    """
+    try:
+        return _request(repo, "ping") or None
+    except OSError:
+        return None
+
+
+def fsmonitor_stop(repo):
+    try:
+        return _request(repo, "stop") == "ok"
+    except OSError:
+        return False
+
+
+def fsmonitor_query(repo, token):
+    """
+    Ask the daemon what changed since token. Returns (new token, set of
+    paths), with paths None when everything must be checked, or None
+    when no daemon answers.
+    """
+    try:
+        fields = _request(repo, f"query {token or ''}").split("\x00")
+    except OSError:
+        return None
+    if len(fields) < 2:
+        return None
+    if fields[1] != "delta":
+        return fields[0], None
+    return fields[0], set(fields[2:])
+
+
+def fsmonitor_changes(repo, idx):
+    """
+    Paths that may have changed since idx was last checked, when
+    core.fsmonitor is set and the daemon knows idx's token; None means
+    every path has to be checked. Stores the new token in idx, so the
+    index must be written afterwards for it to take effect.
+    """
+    if not repo.conf.getboolean("core", "fsmonitor", fallback=False):
+        idx.fsmonitor = None
+        return None
+    answer = fsmonitor_query(repo, idx.fsmonitor)
+    if answer is None:
+        idx.fsmonitor = None
+        return None
+    idx.fsmonitor, paths = answer
+    return paths
+
+
+def fsmonitor_positions(idx, changed):
+    """
+    Sorted positions of the entries a fsmonitor answer requires
+    checking: entries at or below a changed path, plus those that were
+    found dirty last time.
+    """
+    entries = idx.entries
+    out = set()
+    for path in set(changed) | idx.fsmonitor_dirty:
+        pos = idx.position(path)
+        if pos < len(entries) and entries[pos].name == path:
+            out.add(pos)
+        prefix = path + "/"
+        pos = idx.position(prefix)
+        while pos < len(entries) and entries[pos].name.startswith(prefix):
+            out.add(pos)
+            pos += 1
+    return sorted(out)
+
+
+def fsmonitor_dirty_dirs(changed):
+    """
+    Directories whose listing a set of changed paths may have altered.
+    """
+    dirs = set(changed)
+    dirs.update(os.path.dirname(p) for p in changed)
+    return dirs
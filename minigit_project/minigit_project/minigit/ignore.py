@@ -1,19 +1,105 @@
+"""
+Ignore rules. Each ignore file is compiled into one regular expression
+per scope, an alternation of all its rules in reverse order so the
+first alternative that matches is the rule listed last, which is the
+one gitignore semantics say wins. Translated rules of tracked
+.gitignore files are kept in .minigit/ignore-cache under the blob ID,
+so unchanged files are neither inflated nor parsed again.
+"""
+
 import os
-from fnmatch import fnmatch
+import re
+import json
 
-from .repository import repo_file
 from .index import index_read
 from .objects.base import object_read
 
+IGNORE_CACHE = "ignore-cache"
+
+
+def _translate(pattern):
+    """
+    Regex source for a glob pattern: * and ? stop at "/", [...] is a
+    character class, and ** spans directories when it is a whole path
+    component ("**/x", "x/**", "x/**/y").
+    """
+    out = []
+    i, n = 0, len(pattern)
+    while i < n:
+        c = pattern[i]
+        if pattern.startswith("**", i):
+            component = i == 0 or pattern[i - 1] == "/"
+            if component and pattern[i + 2:i + 3] == "/":
+                out.append("(?:.*/)?")
+                i += 3
+                continue
+            if component and i + 2 == n:
+                out.append(".*")
+                i += 2
+                continue
+            out.append("[^/]*")
+            i += 2
+            while i < n and pattern[i] == "*":
+                i += 1
+            continue
+        if c == "*":
+            out.append("[^/]*")
+        elif c == "?":
+            out.append("[^/]")
+        elif c == "[":
+            j = i + 1
+            if j < n and pattern[j] in "!^":
+                j += 1
+            if j < n and pattern[j] == "]":
+                j += 1
+            end = pattern.find("]", j)
+            if end < 0:
+                out.append(re.escape(c))
+            else:
+                body = pattern[i + 1:end].replace("\\", "\\\\")
+                if body[0] in "!^":
+                    body = "^" + body[1:]
+                out.append("(?!/)[" + body + "]")
+                i = end
+        elif c == "\\" and i + 1 < n:
+            i += 1
+            out.append(re.escape(pattern[i]))
+        else:
+            out.append(re.escape(c))
+        i += 1
+    return "".join(out)
+
+
 def gitignore_parse1(raw):
-    raw = raw.strip()
+    """
+    Translate one line of an ignore file into (regex, negate, dir_only),
+    or None for blank lines and comments.
+    """
+    raw = raw.rstrip("\n")
+    # trailing spaces are dropped unless escaped
+    stripped = raw.rstrip(" ")
+    if stripped.endswith("\\") and len(stripped) < len(raw):
+        stripped += " "
+    raw = stripped
     if not raw or raw.startswith("#"):
         return None
-    if raw.startswith("!"):
-        return (raw[1:], False)
-    if raw.startswith("\\"):
-        return (raw[1:], True)
-    return (raw, True)
+    negate = raw.startswith("!")
+    if negate:
+        raw = raw[1:]
+    elif raw.startswith("\\"):
+        raw = raw[1:] if raw[1:2] in ("#", "!") else raw
+    dir_only = raw.endswith("/")
+    raw = raw.rstrip("/")
+    if not raw:
+        return None
+    # a slash anywhere but at the end anchors the pattern to its scope;
+    # otherwise it matches a name at any depth
+    if "/" in raw:
+        regex = _translate(raw.lstrip("/"))
+    else:
+        regex = "(?:.*/)?" + _translate(raw)
+    return (regex, negate, dir_only)
+
 
 def gitignore_parse(lines):
     rules = []
@@ -23,64 +109,143 @@ def gitignore_parse(lines):
             rules.append(parsed)
     return rules
 
+
+class IgnoreMatcher:
+    """
+    Compiled rules of one ignore file. match() returns True (ignored),
+    False (re-included by a "!" rule) or None (no rule applies).
+    """
+
+    def __init__(self, rules):
+        self.rules = rules
+        self._file_rules = [r for r in rules if not r[2]]
+        self._file_re = self._compile(self._file_rules)
+        self._dir_re = self._compile(rules)
+
+    @staticmethod
+    def _compile(rules):
+        if not rules:
+            return None
+        return re.compile("|".join(f"({r[0]})" for r in reversed(rules)), re.DOTALL)
+
+    def match(self, path, is_dir=False):
+        rules = self.rules if is_dir else self._file_rules
+        regex = self._dir_re if is_dir else self._file_re
+        if regex is None:
+            return None
+        m = regex.fullmatch(path)
+        if m is None:
+            return None
+        return not rules[len(rules) - m.lastindex][1]
+
+
 class GitIgnore:
     def __init__(self):
-        self.absolute = []   # list of rule‐lists
-        self.scoped = {}     # dir → rule‐list
+        self.absolute = []   # IgnoreMatchers for info/exclude, global
+        self.scoped = {}     # dir -> IgnoreMatcher of its .gitignore
+        self._dirs = {}      # dir -> verdict, for parent lookups
+
+
+def _ignore_cache_read(repo):
+    path = os.path.join(repo.gitdir, IGNORE_CACHE)
+    if not os.path.exists(path):
+        return {}
+    try:
+        with open(path) as f:
+            return json.load(f)
+    except ValueError:
+        return {}
+
+
+def _ignore_cache_write(repo, cache):
+    path = os.path.join(repo.gitdir, IGNORE_CACHE)
+    with open(path + ".tmp", "w") as f:
+        json.dump(cache, f)
+    os.replace(path + ".tmp", path)
+
+
+def _file_matcher(path):
+    with open(path, "r") as f:
+        return IgnoreMatcher(gitignore_parse(f.readlines()))
+
 
 def gitignore_read(repo):
     ig = GitIgnore()
     # repo/.minigit/info/exclude
     excl = os.path.join(repo.gitdir, "info", "exclude")
     if os.path.exists(excl):
-        with open(excl, "r") as f:
-            ig.absolute.append(gitignore_parse(f.readlines()))
+        ig.absolute.append(_file_matcher(excl))
     # global: XDG_CONFIG_HOME/git/ignore or ~/.config/git/ignore
     cfg = os.environ.get("XDG_CONFIG_HOME", os.path.expanduser("~/.config"))
     global_file = os.path.join(cfg, "git", "ignore")
     if os.path.exists(global_file):
-        with open(global_file, "r") as f:
-            ig.absolute.append(gitignore_parse(f.readlines()))
-    # per-directory .gitignore tracked in index
+        ig.absolute.append(_file_matcher(global_file))
+    # per-directory .gitignore tracked in index, translated once per blob
+    cache = _ignore_cache_read(repo)
+    used = {}
     idx = index_read(repo)
     for entry in idx.entries:
-        if entry.name.endswith(".gitignore"):
-            blob = object_read(repo, entry.sha)
-            lines = blob.blobdata.decode("utf-8").splitlines()
-            dirpath = os.path.dirname(entry.name)
-            ig.scoped[dirpath] = gitignore_parse(lines)
+        if entry.name == ".gitignore" or entry.name.endswith("/.gitignore"):
+            rules = cache.get(entry.sha)
+            if rules is None:
+                blob = object_read(repo, entry.sha)
+                rules = gitignore_parse(blob.blobdata.decode("utf-8").splitlines())
+            used[entry.sha] = [list(r) for r in rules]
+            ig.scoped[os.path.dirname(entry.name)] = IgnoreMatcher([tuple(r) for r in rules])
+    if used != cache:
+        _ignore_cache_write(repo, used)
     return ig
 
-def check_ignore_scoped(rules_map, path):
-    parent = os.path.dirname(path)
-    while True:
-        if parent in rules_map:
-            res = check_ignore1(rules_map[parent], path)
+
+def check_ignore_scoped(rules_map, path, is_dir=False):
+    # the deepest .gitignore above path has the final say
+    parent = path
+    while parent:
+        parent = os.path.dirname(parent)
+        matcher = rules_map.get(parent)
+        if matcher is not None:
+            res = matcher.match(path[len(parent) + 1:] if parent else path, is_dir)
             if res is not None:
                 return res
-        if parent == "":
-            break
-        parent = os.path.dirname(parent)
     return None
 
-def check_ignore_absolute(rule_sets, path):
-    for rules in rule_sets:
-        res = check_ignore1(rules, path)
+
+def check_ignore_absolute(matchers, path, is_dir=False):
+    for matcher in matchers:
+        res = matcher.match(path, is_dir)
         if res is not None:
             return res
     return False
 
-def check_ignore(rules, path):
-    if os.path.isabs(path):
-        raise ValueError("Path must be relative to the repo root")
-    scoped = check_ignore_scoped(rules.scoped, path)
+
+def _check_one(rules, path, is_dir):
+    scoped = check_ignore_scoped(rules.scoped, path, is_dir)
     if scoped is not None:
         return scoped
-    return check_ignore_absolute(rules.absolute, path)
-
-def check_ignore1(rules, path):
-    hit = None
-    for pattern, keep in rules:
-        if fnmatch(path, pattern):
-            hit = keep
-    return hit
+    return check_ignore_absolute(rules.absolute, path, is_dir)
+
+
+def check_ignore_dir(rules, path):
+    """
+    True if directory path is ignored, by its own rules or because a
+    directory above it is (nothing below an ignored directory can be
+    re-included).
+    """
+    verdict = rules._dirs.get(path)
+    if verdict is None:
+        parent = os.path.dirname(path)
+        verdict = bool(parent and check_ignore_dir(rules, parent)) or _check_one(rules, path, True)
+        rules._dirs[path] = verdict
+    return verdict
+
+
+def check_ignore(rules, path, is_dir=False):
+    if os.path.isabs(path):
+        raise ValueError("Path must be relative to the repo root")
+    path = path.rstrip("/")
+    parent = os.path.dirname(path)
+    if parent and check_ignore_dir(rules, parent):
+        return True
+    if is_dir:
+        return check_ignore_dir(rules, path)
+    return _check_one(rules, path, False)
@@ -1,14 +1,24 @@
 import os
-from math import ceil
-from datetime import datetime
+import time
+import heapq
+import struct
+import hashlib
 
 from .repository import repo_file
 
+# fixed-width part of an entry: ctime s/ns, mtime s/ns, dev, ino, mode,
+# uid, gid, size, SHA-1, flags; the NUL-terminated name follows
+ENTRY = struct.Struct(">10I20sH")
+
 class GitIndexEntry:
+    __slots__ = ("ctime_s", "ctime_ns", "mtime_s", "mtime_ns", "dev", "ino",
+                 "mode_type", "mode_perms", "uid", "gid", "fsize", "binsha",
+                 "flag_assume_valid", "flag_stage", "name")
+
     def __init__(self, ctime, mtime, dev, ino, mode_type, mode_perms,
                  uid, gid, fsize, sha, flag_assume_valid, flag_stage, name):
-        self.ctime = ctime
-        self.mtime = mtime
+        self.ctime_s, self.ctime_ns = ctime
+        self.mtime_s, self.mtime_ns = mtime
         self.dev = dev
         self.ino = ino
         self.mode_type = mode_type
@@ -16,94 +26,429 @@ class GitIndexEntry:
         self.uid = uid
         self.gid = gid
         self.fsize = fsize
-        self.sha = sha
+        self.binsha = bytes.fromhex(sha)
         self.flag_assume_valid = flag_assume_valid
         self.flag_stage = flag_stage
         self.name = name
 
+    @property
+    def ctime(self):
+        return (self.ctime_s, self.ctime_ns)
+
+    @property
+    def mtime(self):
+        return (self.mtime_s, self.mtime_ns)
+
+    @property
+    def sha(self):
+        return self.binsha.hex()
+
+def index_entry_from_stat(name, st, sha):
+    """
+    Build an index entry for a regular file from its stat result.
+    """
+    return GitIndexEntry(
+        ctime=(int(st.st_ctime), st.st_ctime_ns % 10**9),
+        mtime=(int(st.st_mtime), st.st_mtime_ns % 10**9),
+        dev=st.st_dev,
+        ino=st.st_ino,
+        mode_type=0b1000,
+        mode_perms=0o644,
+        uid=st.st_uid,
+        gid=st.st_gid,
+        fsize=st.st_size,
+        sha=sha,
+        flag_assume_valid=False,
+        flag_stage=0,
+        name=name
+    )
+
+def _stat_key(ctime, mtime, dev, ino, uid, gid, fsize):
+    # fields as the index stores them: 32-bit, ns split from seconds
+    return (ctime, mtime, dev & 0xFFFFFFFF, ino & 0xFFFFFFFF,
+            uid, gid, fsize & 0xFFFFFFFF)
+
+def index_entry_stat_matches(entry, st):
+    """
+    True if a file's lstat result matches the stat data cached in its
+    index entry, so its content can be assumed unchanged.
+    """
+    return _stat_key(entry.ctime, entry.mtime, entry.dev, entry.ino,
+                     entry.uid, entry.gid, entry.fsize) == _stat_key(
+        (int(st.st_ctime), st.st_ctime_ns % 10**9),
+        (int(st.st_mtime), st.st_mtime_ns % 10**9),
+        st.st_dev, st.st_ino, st.st_uid, st.st_gid, st.st_size)
+
+class CacheTree:
+    """
+    Cache-tree node for one directory: the tree SHA built for it at
+    the last commit and how many index entries it covers. An
+    entry_count of -1 marks the node invalid (something below changed).
+    """
+    def __init__(self, entry_count=-1, sha=None):
+        self.entry_count = entry_count
+        self.sha = sha
+        self.children = {}  # name -> CacheTree
+
+def cache_tree_invalidate(index, path):
+    """
+    Invalidate the cache-tree nodes of every directory above path.
+    """
+    node = index.cache_tree
+    parts = path.split("/")[:-1]
+    while node is not None:
+        node.entry_count = -1
+        if not parts:
+            break
+        node = node.children.get(parts.pop(0))
+
+def _cache_tree_parse(data):
+    # pre-order: name NUL entry_count SP subtree_count LF [sha if valid]
+    def parse(pos):
+        nul = data.index(b"\x00", pos)
+        name = data[pos:nul].decode("utf-8")
+        nl = data.index(b"\n", nul)
+        entry_count, subtrees = (int(x) for x in data[nul+1:nl].split(b" "))
+        pos = nl + 1
+        node = CacheTree(entry_count)
+        if entry_count >= 0:
+            node.sha = data[pos:pos+20].hex()
+            pos += 20
+        for _ in range(subtrees):
+            child_name, child, pos = parse(pos)
+            node.children[child_name] = child
+        return name, node, pos
+    return parse(0)[1]
+
+def _cache_tree_serialize(node, name="", out=None):
+    if out is None:
+        out = []
+    out.append(f"{name}\x00{node.entry_count} {len(node.children)}\n".encode("utf-8"))
+    if node.entry_count >= 0:
+        out.append(bytes.fromhex(node.sha))
+    for child_name in sorted(node.children):
+        _cache_tree_serialize(node.children[child_name], child_name, out)
+    return out
+
+# untracked cache: for each directory scanned by status, its mtime and
+# listing, so an unchanged directory need not be read again. Records are
+# path NUL | mtime_ns (8) | count (4), then count x (is_dir (1) | name NUL).
+# The layout differs from git's UNTR, hence the different signature.
+UNTRACKED_SIG = b"UNTC"
+UNTRACKED_HEAD = struct.Struct(">QI")
+
+def _untracked_parse(data):
+    cache = {}
+    pos = 0
+    while pos < len(data):
+        nul = data.index(b"\x00", pos)
+        path = data[pos:nul].decode("utf-8")
+        mtime_ns, count = UNTRACKED_HEAD.unpack_from(data, nul + 1)
+        pos = nul + 1 + UNTRACKED_HEAD.size
+        listing = []
+        for _ in range(count):
+            nul = data.index(b"\x00", pos + 1)
+            listing.append((data[pos+1:nul].decode("utf-8"), data[pos] == 1))
+            pos = nul + 1
+        cache[path] = (mtime_ns, listing)
+    return cache
+
+def _untracked_serialize(cache):
+    out = []
+    for path in sorted(cache):
+        mtime_ns, listing = cache[path]
+        out.append(path.encode("utf-8") + b"\x00" + UNTRACKED_HEAD.pack(mtime_ns, len(listing)))
+        for name, is_dir in listing:
+            out.append(bytes([is_dir]) + name.encode("utf-8") + b"\x00")
+    return b"".join(out)
+
+# fsmonitor state: the daemon token this index was last checked at and
+# the entries found dirty then, as NUL-terminated strings (token first)
+FSMONITOR_SIG = b"FSMT"
+
 class GitIndex:
-    def __init__(self, version=2, entries=None):
+    """
+    In-memory index. entries are kept sorted by name (then stage), so
+    single paths are found by binary search.
+    """
+    def __init__(self, version=2, entries=None, cache_tree=None):
         self.version = version
         self.entries = entries or []
+        self.cache_tree = cache_tree
+        # dir -> (mtime_ns, [(name, is_dir)]), see worktree_untracked
+        self.untracked = None
+        # see fsmonitor.fsmonitor_changes
+        self.fsmonitor = None
+        self.fsmonitor_dirty = set()
+        # split-index mode: the shared base this index was read from
+        self.base_sha = None
+        self.base_entries = None
 
-def index_read(repo):
-    index_path = repo_file(repo, "index")
-    if not os.path.exists(index_path):
-        return GitIndex()
-    data = open(index_path, "rb").read()
+    def position(self, name):
+        """
+        Position of the first entry for name, or where it would go.
+        """
+        entries = self.entries
+        lo, hi = 0, len(entries)
+        while lo < hi:
+            mid = (lo + hi) // 2
+            if entries[mid].name < name:
+                lo = mid + 1
+            else:
+                hi = mid
+        return lo
+
+    def find(self, name):
+        pos = self.position(name)
+        if pos < len(self.entries) and self.entries[pos].name == name:
+            return self.entries[pos]
+        return None
+
+    def remove(self, name):
+        """
+        Drop every entry for name; returns how many were removed.
+        """
+        start = end = self.position(name)
+        while end < len(self.entries) and self.entries[end].name == name:
+            end += 1
+        del self.entries[start:end]
+        return end - start
+
+def _index_parse(path):
+    """
+    Parse an index file into (version, entries, extensions), where
+    extensions maps each signature to its raw data.
+    """
+    with open(path, "rb") as f:
+        data = f.read()
     # header: "DIRC" | version (4) | count (4)
-    assert data[:4] == b"DIRC"
-    version = int.from_bytes(data[4:8], "big")
-    count   = int.from_bytes(data[8:12], "big")
+    if data[:4] != b"DIRC":
+        raise Exception(f"Bad index file signature: {path}")
+    version, count = struct.unpack_from(">II", data, 4)
+    # files written before the checksum was added end right after the
+    # extensions and pad entries to absolute 8-byte offsets rather than
+    # to a multiple of 8 bytes per entry
+    end = len(data)
+    legacy = not (end >= 32 and hashlib.sha1(memoryview(data)[:-20]).digest() == data[-20:])
+    if not legacy:
+        end -= 20
+    view = memoryview(data)
+    unpack = ENTRY.unpack_from
     entries = []
-    idx = 12
+    pos = 12
     for _ in range(count):
-        # read fixed‐size metadata
-        ctime_s = int.from_bytes(data[idx:idx+4], "big")
-        ctime_ns= int.from_bytes(data[idx+4:idx+8], "big")
-        mtime_s = int.from_bytes(data[idx+8:idx+12], "big")
-        mtime_ns= int.from_bytes(data[idx+12:idx+16], "big")
-        dev     = int.from_bytes(data[idx+16:idx+20], "big")
-        ino     = int.from_bytes(data[idx+20:idx+24], "big")
-        mode    = int.from_bytes(data[idx+24:idx+28], "big")
-        mode_type = mode >> 12
-        mode_perms= mode & 0o7777
-        uid     = int.from_bytes(data[idx+28:idx+32], "big")
-        gid     = int.from_bytes(data[idx+32:idx+36], "big")
-        fsize   = int.from_bytes(data[idx+36:idx+40], "big")
-        sha     = format(int.from_bytes(data[idx+40:idx+60], "big"), "040x")
-        flags   = int.from_bytes(data[idx+60:idx+62], "big")
-        flag_assume_valid = bool(flags & 0x8000)
-        flag_stage        = (flags >> 12) & 0b11
+        (ctime_s, ctime_ns, mtime_s, mtime_ns, dev, ino, mode,
+         uid, gid, fsize, binsha, flags) = unpack(data, pos)
         name_len = flags & 0x0FFF
-        idx += 62
-        name = data[idx:idx+name_len].decode("utf-8")
-        idx += name_len + 1
-        # align to 8-byte boundary
-        if idx % 8:
-            idx += (8 - (idx % 8))
-        entries.append(GitIndexEntry(
-            ctime=(ctime_s, ctime_ns),
-            mtime=(mtime_s, mtime_ns),
-            dev=dev, ino=ino,
-            mode_type=mode_type,
-            mode_perms=mode_perms,
-            uid=uid, gid=gid,
-            fsize=fsize,
-            sha=sha,
-            flag_assume_valid=flag_assume_valid,
-            flag_stage=flag_stage,
-            name=name
-        ))
-    return GitIndex(version=version, entries=entries)
+        name_start = pos + ENTRY.size
+        if name_len == 0x0FFF:
+            name_len = data.index(b"\x00", name_start) - name_start
+        # the name is NUL-terminated and the entry padded to 8 bytes
+        e = GitIndexEntry.__new__(GitIndexEntry)
+        e.ctime_s, e.ctime_ns, e.mtime_s, e.mtime_ns = ctime_s, ctime_ns, mtime_s, mtime_ns
+        e.dev, e.ino, e.uid, e.gid, e.fsize = dev, ino, uid, gid, fsize
+        e.mode_type, e.mode_perms = mode >> 12, mode & 0o7777
+        e.binsha = binsha
+        e.flag_assume_valid = bool(flags & 0x8000)
+        e.flag_stage = (flags >> 12) & 0b11
+        e.name = str(view[name_start:name_start + name_len], "utf-8")
+        entries.append(e)
+        if legacy:
+            pos = (name_start + name_len + 8) & ~7
+        else:
+            pos += (ENTRY.size + name_len + 8) & ~7
+    # extensions: signature (4) | size (4) | data
+    extensions = {}
+    while pos + 8 <= end:
+        sig = data[pos:pos+4]
+        size = struct.unpack_from(">I", data, pos + 4)[0]
+        extensions[sig] = data[pos+8:pos+8+size]
+        pos += 8 + size
+    if pos != end:
+        raise Exception(f"Index file corrupt: {path}")
+    if any(entries[i].name > entries[i + 1].name for i in range(len(entries) - 1)):
+        entries.sort(key=lambda e: (e.name, e.flag_stage))
+    return version, entries, extensions
+
+def _merge_entries(base, deleted, delta):
+    # base minus the deleted positions, merged with the sorted delta
+    deleted = set(deleted)
+    kept = [e for i, e in enumerate(base) if i not in deleted] if deleted else base
+    if not delta:
+        return list(kept)
+    return list(heapq.merge(kept, delta, key=lambda e: (e.name, e.flag_stage)))
+
+def index_read(repo):
+    """
+    Read the index. In split-index mode the small index file only holds
+    the entries that differ from a shared base index, and the merged
+    view is returned.
+    """
+    index_path = repo_file(repo, "index")
+    if not os.path.exists(index_path):
+        return GitIndex()
+    version, entries, extensions = _index_parse(index_path)
+    cache_tree = None
+    if b"TREE" in extensions:
+        cache_tree = _cache_tree_parse(extensions[b"TREE"])
+    index = GitIndex(version=version, entries=entries, cache_tree=cache_tree)
+    if UNTRACKED_SIG in extensions:
+        index.untracked = _untracked_parse(extensions[UNTRACKED_SIG])
+    if FSMONITOR_SIG in extensions:
+        fields = extensions[FSMONITOR_SIG].decode("utf-8").split("\x00")[:-1]
+        index.fsmonitor = fields[0]
+        index.fsmonitor_dirty = set(fields[1:])
+    if b"link" in extensions:
+        base_sha, deleted = _link_parse(extensions[b"link"])
+        base_path = repo_file(repo, f"sharedindex.{base_sha}")
+        if not os.path.isfile(base_path):
+            raise Exception(f"Shared index file missing: {base_path}")
+        index.base_sha = base_sha
+        index.base_entries = _index_parse(base_path)[1]
+        index.entries = _merge_entries(index.base_entries, deleted, entries)
+    return index
+
+# Racy-git protection: a file modified within this window of writing the
+# index could change again without its mtime moving. Such entries are
+# written with a zero size ("smudged") so the next stat check fails and
+# the file is rehashed instead of trusted.
+RACY_WINDOW_NS = 10**9
+
+# in split-index mode, fold the delta into a new shared base once it
+# touches more than this percentage of the base entries
+SPLIT_INDEX_MAX_CHANGE = 20
+
+def _link_parse(data):
+    # base SHA (20) | count (4) | positions of deleted base entries (4 each)
+    count = struct.unpack_from(">I", data, 20)[0]
+    return data[:20].hex(), struct.unpack_from(f">{count}I", data, 24)
+
+def _link_serialize(base_sha, deleted):
+    return (bytes.fromhex(base_sha) + struct.pack(">I", len(deleted))
+            + struct.pack(f">{len(deleted)}I", *deleted))
+
+def _index_serialize(version, entries, extensions, racy_limit):
+    out = [b"DIRC", struct.pack(">II", version, len(entries))]
+    pack = ENTRY.pack
+    for e in entries:
+        fsize = e.fsize & 0xFFFFFFFF
+        if e.mtime_s * 10**9 + e.mtime_ns >= racy_limit:
+            fsize = 0
+        name = e.name.encode("utf-8")
+        flags = (0x8000 if e.flag_assume_valid else 0) | (e.flag_stage << 12) | min(len(name), 0x0FFF)
+        out.append(pack(e.ctime_s, e.ctime_ns, e.mtime_s, e.mtime_ns,
+                        e.dev & 0xFFFFFFFF, e.ino & 0xFFFFFFFF,
+                        (e.mode_type << 12) | e.mode_perms,
+                        e.uid & 0xFFFFFFFF, e.gid & 0xFFFFFFFF, fsize, e.binsha, flags))
+        # NUL-terminate the name and pad the entry to 8 bytes
+        out.append(name + b"\x00" * (8 - (ENTRY.size + len(name)) % 8))
+    for sig, ext in extensions:
+        out.append(sig + struct.pack(">I", len(ext)) + ext)
+    data = b"".join(out)
+    return data + hashlib.sha1(data).digest()
+
+def _split_index_delta(repo, index, racy_limit):
+    """
+    Split index.entries against the shared base: returns the entries to
+    store in the index file and the LINK extension data. Entries read
+    from the base and still present are the very same objects, so
+    anything else is new or changed. Writes a fresh base when there is
+    none yet or the delta has grown too large.
+    """
+    base = index.base_entries
+    if base is not None:
+        present = set(map(id, index.entries))
+        in_base = set(map(id, base))
+        deleted = [i for i, e in enumerate(base) if id(e) not in present]
+        delta = [e for e in index.entries if id(e) not in in_base]
+        limit = repo.conf.getint("splitindex", "maxpercentchange", fallback=SPLIT_INDEX_MAX_CHANGE)
+        if (len(deleted) + len(delta)) * 100 <= limit * len(base):
+            return delta, _link_serialize(index.base_sha, deleted)
+    data = _index_serialize(index.version, index.entries, [], racy_limit)
+    base_sha = data[-20:].hex()
+    path = repo_file(repo, f"sharedindex.{base_sha}")
+    with open(path + ".tmp", "wb") as f:
+        f.write(data)
+    os.replace(path + ".tmp", path)
+    index.base_sha = base_sha
+    index.base_entries = list(index.entries)
+    return [], _link_serialize(base_sha, [])
 
 def index_write(repo, index):
-    out = bytearray()
-    out += b"DIRC"
-    out += index.version.to_bytes(4, "big")
-    out += len(index.entries).to_bytes(4, "big")
-    pos = 12
-    for e in index.entries:
-        out += e.ctime[0].to_bytes(4, "big")
-        out += e.ctime[1].to_bytes(4, "big")
-        out += e.mtime[0].to_bytes(4, "big")
-        out += e.mtime[1].to_bytes(4, "big")
-        out += (e.dev & 0xFFFFFFFF).to_bytes(4, "big")
-        out += (e.ino & 0xFFFFFFFF).to_bytes(4, "big")
-        mode = (e.mode_type << 12) | e.mode_perms
-        out += mode.to_bytes(4, "big")
-        out += e.uid.to_bytes(4, "big")
-        out += e.gid.to_bytes(4, "big")
-        out += e.fsize.to_bytes(4, "big")
-        out += int(e.sha, 16).to_bytes(20, "big")
-        flags = (0x8000 if e.flag_assume_valid else 0) | (e.flag_stage << 12) | len(e.name.encode("utf-8"))
-        out += flags.to_bytes(2, "big")
-        out += e.name.encode("utf-8") + b"\x00"
-        pos += 62 + len(e.name.encode("utf-8")) + 1
-        # pad to 8-byte boundary
-        if pos % 8:
-            pad = 8 - (pos % 8)
-            out += b"\x00" * pad
-            pos += pad
+    """
+    Write the index. With core.splitIndex set only the entries that
+    differ from the shared base index are written (see index_read).
+    """
+    racy_limit = int(time.time() * 10**9) - RACY_WINDOW_NS
+    old_base = index.base_sha
+    entries = index.entries
+    extensions = []
+    if repo.conf.getboolean("core", "splitindex", fallback=False):
+        entries, link = _split_index_delta(repo, index, racy_limit)
+        # lowercase signature: readers that do not know it must refuse
+        extensions.append((b"link", link))
+    else:
+        index.base_sha = index.base_entries = None
+    if index.cache_tree is not None:
+        extensions.append((b"TREE", b"".join(_cache_tree_serialize(index.cache_tree))))
+    if index.untracked is not None:
+        extensions.append((UNTRACKED_SIG, _untracked_serialize(index.untracked)))
+    if index.fsmonitor is not None:
+        fields = [index.fsmonitor] + sorted(index.fsmonitor_dirty)
+        extensions.append((FSMONITOR_SIG, "".join(f + "\x00" for f in fields).encode("utf-8")))
+    data = _index_serialize(index.version, entries, extensions, racy_limit)
     with open(repo_file(repo, "index"), "wb") as f:
-        f.write(out)
\ No newline at end of file
+        f.write(data)
+    # the old base is only dropped once nothing refers to it
+    if old_base and old_base != index.base_sha:
+        path = repo_file(repo, f"sharedindex.{old_base}")
+        if os.path.exists(path):
+            os.remove(path)
+
+def index_write_tree(repo, index, trees=None):
+    """
+    Build nested tree objects from the index entries and return the
+    root tree SHA. Directories whose cache-tree node is still valid
+    reuse the recorded subtree ID instead of being rebuilt. When trees
+    is a dict, new trees are collected there (SHA -> GitTree) instead
+    of being written, and the cache-tree is left as it was.
+    """
+    if index.cache_tree is None:
+        index.cache_tree = CacheTree()
+    entries = sorted(index.entries, key=lambda e: e.name)
+    return _write_tree(repo, entries, 0, len(entries), "", index.cache_tree, trees)
+
+def _write_tree(repo, entries, start, end, prefix, node, trees):
+    from .objects.base import object_write
+    from .objects.tree import GitTree, GitTreeLeaf, TREE_MODE
+    if node.entry_count == end - start and node.sha:
+        return node.sha
+    tree = GitTree()
+    children = {}
+    i = start
+    while i < end:
+        name = entries[i].name[len(prefix):]
+        if "/" not in name:
+            mode = f"{entries[i].mode_type:o}{entries[i].mode_perms:04o}".encode()
+            tree.items.append(GitTreeLeaf(mode=mode, path=name, sha=entries[i].sha))
+            i += 1
+            continue
+        # entries under one directory are contiguous in sorted order
+        dirname = name.split("/", 1)[0]
+        sub_prefix = prefix + dirname + "/"
+        j = i
+        while j < end and entries[j].name.startswith(sub_prefix):
+            j += 1
+        child = node.children.get(dirname) or CacheTree()
+        children[dirname] = child
+        sha = _write_tree(repo, entries, i, j, sub_prefix, child, trees)
+        tree.items.append(GitTreeLeaf(mode=TREE_MODE, path=dirname, sha=sha))
+        i = j
+    if trees is not None:
+        sha = object_write(tree)
+        trees[sha] = tree
+        return sha
+    node.children = children
+    node.sha = object_write(tree, repo)
+    node.entry_count = end - start
+    return node.sha
@@ -0,0 +1,132 @@
+"""
+Merge-base computation: a priority-queue walk that paints commits
+reachable from each side and stops once every commit left in the queue
+is already known to be below a common ancestor.
+"""
+
+import heapq
+
+from .commit_graph import commit_parents, commit_generation, commit_time, GENERATION_INFINITY
+
+PARENT1 = 1
+PARENT2 = 2
+STALE = 4
+RESULT = 8
+
+
+class _Queue:
+    """
+    Max-heap of commits keyed by (generation, commit time), so a commit
+    is always popped before any of its ancestors.
+    """
+
+    def __init__(self, repo):
+        self.repo = repo
+        self.heap = []
+        self.counter = 0
+
+    def push(self, sha):
+        key = (commit_generation(self.repo, sha), commit_time(self.repo, sha))
+        self.counter += 1
+        heapq.heappush(self.heap, (-key[0], -key[1], self.counter, sha))
+
+    def pop(self):
+        return heapq.heappop(self.heap)[3]
+
+    def __iter__(self):
+        return (item[3] for item in self.heap)
+
+    def __len__(self):
+        return len(self.heap)
+
+
+def _paint_down_to_common(repo, one, twos):
+    flags = {one: PARENT1}
+    queue = _Queue(repo)
+    queue.push(one)
+    for two in twos:
+        flags[two] = flags.get(two, 0) | PARENT2
+        queue.push(two)
+
+    result = []
+    # stop once the frontier can only reach commits below a known base
+    while any(not flags[sha] & STALE for sha in queue):
+        sha = queue.pop()
+        cur = flags[sha] & (PARENT1 | PARENT2 | STALE)
+        if cur == PARENT1 | PARENT2:
+            if not flags[sha] & RESULT:
+                flags[sha] |= RESULT
+                result.append(sha)
+            cur |= STALE
+        for parent in commit_parents(repo, sha):
+            if flags.get(parent, 0) & cur == cur:
+                continue
+            flags[parent] = flags.get(parent, 0) | cur
+            queue.push(parent)
+    return result
+
+
+def _reachable(repo, src, dst, min_generation):
+    """
+    True if dst is reachable from any commit in src, never walking
+    below min_generation.
+    """
+    seen = set()
+    stack = list(src)
+    while stack:
+        sha = stack.pop()
+        if sha == dst:
+            return True
+        if sha in seen:
+            continue
+        seen.add(sha)
+        for parent in commit_parents(repo, sha):
+            if parent not in seen and commit_generation(repo, parent) >= min_generation:
+                stack.append(parent)
+    return False
+
+
+def _remove_redundant(repo, candidates):
+    # drop any candidate that is an ancestor of another one
+    out = []
+    for i, sha in enumerate(candidates):
+        others = [c for j, c in enumerate(candidates) if j != i]
+        gen = commit_generation(repo, sha)
+        min_gen = 0 if gen == GENERATION_INFINITY else gen
+        if not _reachable(repo, others, sha, min_gen):
+            out.append(sha)
+    return out
+
+
+def merge_bases(repo, one, twos):
+    """
+    All best common ancestors of `one` and the commits in `twos`, best
+    (newest) first. None of them is an ancestor of another.
+    """
+    if one in twos:
+        return [one]
+    result = _paint_down_to_common(repo, one, list(twos))
+    if len(result) <= 1:
+        return result
+    return _remove_redundant(repo, result)
+
+
+def merge_base(repo, a, b):
+    """
+    The best common ancestor of a and b, or None.
+    """
+    bases = merge_bases(repo, a, [b])
+    return bases[0] if bases else None
+
+
+def is_ancestor(repo, a, b):
+    """
+    True if commit a is reachable from commit b (a commit is its own
+    ancestor).
+    """
+    if a == b:
+        return True
+    gen = commit_generation(repo, a)
+    if gen == GENERATION_INFINITY:
+        return a in merge_bases(repo, a, [b])
+    return _reachable(repo, [b], a, gen)
@@ -5,5 +5,5 @@ MiniGit object types and helpers.
 from .base import GitObject, object_read, object_write, object_find, object_hash
 from .blob import GitBlob
 from .commit import GitCommit
-from .tree import GitTree, GitTreeLeaf, tree_parse, tree_serialize, tree_checkout
+from .tree import GitTree, GitTreeLeaf, tree_parse, tree_serialize
 from .tag import GitTag
@@ -1,9 +1,11 @@
 import os
 import zlib
 import hashlib
-from ..repository import repo_file
+import tempfile
+from ..repository import repo_file, repo_dir
 
 class GitObject:
+    __slots__ = ()
     fmt = None
 
     def __init__(self, data=None):
@@ -21,15 +23,31 @@ class GitObject:
     def init(self):
         pass
 
-def object_read(repo, sha):
+def _object_class(fmt):
+    # only now import each subclass
+    if fmt == b"blob":
+        from .blob import GitBlob as _Cls
+    elif fmt == b"commit":
+        from .commit import GitCommit as _Cls
+    elif fmt == b"tree":
+        from .tree import GitTree as _Cls
+    elif fmt == b"tag":
+        from .tag import GitTag as _Cls
+    else:
+        return None
+    return _Cls
+
+def object_read_raw(repo, sha):
     """
-    Read object by SHA, decompress, parse header, and
-    return an instance of the right GitObject subclass.
+    Return (fmt, data) for an object, looking at the loose object
+    first and then in the packs. Returns None if it is in neither.
     """
     path = repo_file(repo, "objects", sha[:2], sha[2:])
-    if not os.path.isfile(path):
-        return None
-    raw = zlib.decompress(open(path, "rb").read())
+    if not (path and os.path.isfile(path)):
+        from .pack import pack_read
+        return pack_read(repo, sha)
+    with open(path, "rb") as f:
+        raw = zlib.decompress(f.read())
     # header: "<fmt> <size>\0"
     x = raw.find(b" ")
     fmt = raw[:x]
@@ -37,21 +55,44 @@ def object_read(repo, sha):
     size = int(raw[x+1:y])
     if size != len(raw) - y - 1:
         raise Exception(f"Malformed object {sha}: bad length")
-    data = raw[y+1:]
+    return fmt, raw[y+1:]
 
-    # only now import each subclass
-    if fmt == b"blob":
-        from .blob import GitBlob as _Cls
-    elif fmt == b"commit":
-        from .commit import GitCommit as _Cls
-    elif fmt == b"tree":
-        from .tree import GitTree as _Cls
-    elif fmt == b"tag":
-        from .tag import GitTag as _Cls
-    else:
+def object_read(repo, sha):
+    """
+    Read object by SHA, decompress, parse header, and
+    return an instance of the right GitObject subclass.
+    Parsed objects are kept in the repository's object cache and
+    shared between callers, so they must not be modified.
+    """
+    from .cache import object_cache
+    cache = object_cache(repo)
+    obj = cache.get(sha)
+    if obj is not None:
+        return obj
+    raw = object_read_raw(repo, sha)
+    if raw is None:
+        return None
+    fmt, data = raw
+    _Cls = _object_class(fmt)
+    if _Cls is None:
         raise Exception(f"Unknown object type {fmt.decode()} for {sha}")
+    obj = _Cls(data)
+    cache.put(sha, obj, len(data))
+    return obj
 
-    return _Cls(data)
+def loose_object_ids(repo):
+    """
+    Yield the SHA of every loose object in the repository.
+    """
+    objdir = repo_dir(repo, "objects")
+    if not objdir:
+        return
+    for prefix in sorted(os.listdir(objdir)):
+        if len(prefix) != 2 or not os.path.isdir(os.path.join(objdir, prefix)):
+            continue
+        for fname in sorted(os.listdir(os.path.join(objdir, prefix))):
+            if len(fname) == 38:
+                yield prefix + fname
 
 def object_write(obj, repo=None):
     """
@@ -63,10 +104,13 @@ def object_write(obj, repo=None):
     full = header + data
     sha = hashlib.sha1(full).hexdigest()
     if repo:
+        from .pack import pack_contains
         path = repo_file(repo, "objects", sha[:2], sha[2:], mkdir=True)
-        if not os.path.exists(path):
+        if not os.path.exists(path) and not pack_contains(repo, sha):
             with open(path, "wb") as f:
                 f.write(zlib.compress(full))
+            from .oid_index import oid_index
+            oid_index(repo).add(sha)
     return sha
 
 def object_hash(fd, fmt, repo=None):
@@ -75,37 +119,92 @@ def object_hash(fd, fmt, repo=None):
     and write (if requested) to repo. Returns its sha.
     """
     if fmt == b"blob":
-        from .blob import GitBlob as _Cls
-    elif fmt == b"commit":
-        from .commit import GitCommit as _Cls
-    elif fmt == b"tree":
-        from .tree import GitTree as _Cls
-    elif fmt == b"tag":
-        from .tag import GitTag as _Cls
-    else:
+        return object_hash_stream(fd, repo)
+    _Cls = _object_class(fmt)
+    if _Cls is None:
         raise Exception(f"Unknown type {fmt!r}")
     obj = _Cls(fd.read())
     return object_write(obj, repo)
 
+STREAM_CHUNK = 64 * 1024
+
+def object_hash_stream(fd, repo=None):
+    """
+    Hash (and, given a repo, store) a blob from a binary file in
+    constant memory. The header size comes from fstat; the content is
+    fed in chunks to SHA-1 and to a zlib stream written to a temp file
+    that is renamed into place once the SHA is known.
+    """
+    size = os.fstat(fd.fileno()).st_size
+    header = b"blob " + str(size).encode() + b"\x00"
+    digest = hashlib.sha1(header)
+    out = tmp = None
+    if repo:
+        objdir = repo_dir(repo, "objects", mkdir=True)
+        tmpfd, tmp = tempfile.mkstemp(dir=objdir, prefix="tmp_obj_")
+        out = os.fdopen(tmpfd, "wb")
+        comp = zlib.compressobj()
+        out.write(comp.compress(header))
+    try:
+        seen = 0
+        while True:
+            chunk = fd.read(STREAM_CHUNK)
+            if not chunk:
+                break
+            seen += len(chunk)
+            digest.update(chunk)
+            if out:
+                out.write(comp.compress(chunk))
+        if seen != size:
+            raise Exception(f"File changed while hashing: expected {size} bytes, read {seen}")
+        sha = digest.hexdigest()
+        if out:
+            out.write(comp.flush())
+            out.close()
+            out = None
+            from .pack import pack_contains
+            path = repo_file(repo, "objects", sha[:2], sha[2:], mkdir=True)
+            if not os.path.exists(path) and not pack_contains(repo, sha):
+                os.replace(tmp, path)
+                tmp = None
+                from .oid_index import oid_index
+                oid_index(repo).add(sha)
+    finally:
+        if out:
+            out.close()
+        if tmp:
+            os.remove(tmp)
+    return sha
+
 def object_find(repo, name, fmt=None, follow=True):
     """
     Resolve a name to a SHA. If fmt is given, follow tags/commits
-    to find an object of that type.
+    to find an object of that type. "<rev>:<path>" names the blob or
+    tree at path in rev.
     """
     from ..refs import ref_resolve
+    from .oid_index import object_resolve_prefix
 
+    if ":" in name:
+        # "<rev>:<path>", e.g. HEAD:src/x.py
+        from .tree import tree_lookup
+        rev, path = name.split(":", 1)
+        tree = object_find(repo, rev, fmt=b"tree")
+        if tree is None:
+            raise Exception(f"Not a tree-ish: {rev}")
+        if not path.strip("/"):
+            shas = [tree]
+        else:
+            leaf = tree_lookup(repo, tree, path)
+            if leaf is None:
+                raise Exception(f"Path '{path}' does not exist in '{rev}'")
+            shas = [leaf.sha]
     # HEAD or branches/tags
-    if name == "HEAD":
+    elif name == "HEAD":
         shas = [ref_resolve(repo, "HEAD")]
     elif len(name) >= 4 and all(c in "0123456789abcdef" for c in name.lower()):
-        # abbreviated SHA logic
-        prefix, rest = name[:2], name[2:]
-        objdir = repo_file(repo, "objects", prefix)
-        shas = []
-        if os.path.isdir(objdir):
-            for fname in os.listdir(objdir):
-                if fname.startswith(rest):
-                    shas.append(prefix + fname)
+        # abbreviated SHA logic, over loose and packed objects
+        shas = object_resolve_prefix(repo, name)
     else:
         # branch or tag
         tag_sha = ref_resolve(repo, f"refs/tags/{name}")
@@ -129,8 +228,8 @@ def object_find(repo, name, fmt=None, follow=True):
         if not follow:
             return None
         if obj.fmt == b"tag":
-            sha = obj.kvlm[b"object"].decode()
+            sha = obj.target
         elif obj.fmt == b"commit" and fmt == b"tree":
-            sha = obj.kvlm[b"tree"].decode()
+            sha = obj.tree
         else:
             return None
@@ -0,0 +1,78 @@
+"""
+Per-repository LRU cache of parsed objects, bounded by a byte budget.
+"""
+
+import threading
+from collections import OrderedDict
+
+DEFAULT_LIMIT = 16 * 1024 * 1024
+# rough per-entry overhead of the parsed object on top of its raw data
+ENTRY_OVERHEAD = 256
+
+
+def parse_size(value):
+    """
+    Parse a size such as "512", "64k", "16m" or "1g" into bytes.
+    """
+    value = value.strip().lower()
+    units = {"k": 1024, "m": 1024 ** 2, "g": 1024 ** 3}
+    if value and value[-1] in units:
+        return int(value[:-1]) * units[value[-1]]
+    return int(value)
+
+
+class ObjectCache:
+    """
+    Maps SHA -> parsed GitObject. Cached objects are shared between
+    callers, so they must be treated as read-only.
+    """
+
+    def __init__(self, limit=DEFAULT_LIMIT):
+        self.limit = limit
+        self.size = 0
+        self.hits = 0
+        self.misses = 0
+        self._entries = OrderedDict()  # sha -> (obj, cost)
+        self._lock = threading.Lock()
+
+    def get(self, sha):
+        with self._lock:
+            entry = self._entries.get(sha)
+            if entry is None:
+                self.misses += 1
+                return None
+            self._entries.move_to_end(sha)
+            self.hits += 1
+            return entry[0]
+
+    def put(self, sha, obj, size):
+        cost = size + ENTRY_OVERHEAD
+        with self._lock:
+            if cost > self.limit or sha in self._entries:
+                return
+            self._entries[sha] = (obj, cost)
+            self.size += cost
+            while self.size > self.limit:
+                _, (_, old_cost) = self._entries.popitem(last=False)
+                self.size -= old_cost
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+            self.size = 0
+
+    def __len__(self):
+        return len(self._entries)
+
+
+def object_cache(repo):
+    """
+    The repository's object cache, created on first use with the
+    budget from core.objectCacheLimit (default 16m; 0 disables it).
+    """
+    if repo.object_cache is None:
+        limit = DEFAULT_LIMIT
+        if repo.conf.has_option("core", "objectcachelimit"):
+            limit = parse_size(repo.conf.get("core", "objectcachelimit"))
+        repo.object_cache = ObjectCache(limit)
+    return repo.object_cache
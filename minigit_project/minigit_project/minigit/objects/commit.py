@@ -1,16 +1,107 @@
 from .base import GitObject
-from ..utils import kvlm_parse, kvlm_serialize
+from ..utils import kvlm_scan, kvlm_unfold, kvlm_parse, kvlm_serialize
 
 class GitCommit(GitObject):
+    """
+    A commit read from the object store keeps its raw bytes; header
+    offsets are found on first use and values are sliced from a
+    memoryview, so a walk that needs only parents and tree never
+    touches the author or the message. serialize() returns the raw
+    bytes unchanged unless the headers were rebuilt through .kvlm,
+    the dict form used to create new commits.
+    """
+    __slots__ = ("_raw", "_fields", "_body", "_kvlm")
     fmt = b"commit"
 
     def deserialize(self, data):
-        # parse headers and message
-        self.kvlm = kvlm_parse(data)
+        self._raw = bytes(data)
+        self._fields = None
+        self._body = None
+        self._kvlm = None
 
     def serialize(self):
-        return kvlm_serialize(self.kvlm)
+        if self._kvlm is not None:
+            return kvlm_serialize(self._kvlm)
+        return self._raw
 
     def init(self):
         # empty commit: no headers yet
-        self.kvlm = {}
+        self._raw = None
+        self._kvlm = {}
+
+    @property
+    def kvlm(self):
+        if self._kvlm is None:
+            self._kvlm = kvlm_parse(self._raw)
+        return self._kvlm
+
+    @kvlm.setter
+    def kvlm(self, value):
+        self._kvlm = value
+
+    def _scan(self):
+        if self._fields is None:
+            self._fields, self._body = kvlm_scan(self._raw)
+        return self._fields
+
+    def headers(self, key):
+        """
+        Every value of header key, unfolded, in order.
+        """
+        if self._kvlm is not None:
+            val = self._kvlm.get(key)
+            if val is None:
+                return []
+            return list(val) if isinstance(val, list) else [val]
+        view = memoryview(self._raw)
+        return [kvlm_unfold(view[start:end]) for k, start, end in self._scan() if k == key]
+
+    def header(self, key):
+        """
+        First value of header key, or None.
+        """
+        if self._kvlm is None:
+            for k, start, end in self._scan():
+                if k == key:
+                    return kvlm_unfold(memoryview(self._raw)[start:end])
+            return None
+        vals = self.headers(key)
+        return vals[0] if vals else None
+
+    @property
+    def tree(self):
+        val = self.header(b"tree")
+        return val.decode() if val is not None else None
+
+    @property
+    def parents(self):
+        return [p.decode() for p in self.headers(b"parent")]
+
+    @property
+    def author(self):
+        return self.header(b"author")
+
+    @property
+    def committer(self):
+        return self.header(b"committer")
+
+    @property
+    def author_time(self):
+        return _ident_time(self.author)
+
+    @property
+    def commit_time(self):
+        return _ident_time(self.committer or self.author)
+
+    @property
+    def message(self):
+        if self._kvlm is not None:
+            return self._kvlm.get(None, b"")
+        self._scan()
+        return self._raw[self._body:]
+
+def _ident_time(ident):
+    # "Name <email> 1700000000 +0100"
+    if not ident:
+        return 0
+    return int(ident.rsplit(b" ", 2)[1])
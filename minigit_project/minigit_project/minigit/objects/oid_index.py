@@ -0,0 +1,112 @@
+"""
+Sorted index of object IDs across loose objects and packs, used to
+resolve abbreviated SHAs and to compute unambiguous abbreviations.
+"""
+
+import os
+import bisect
+import threading
+
+from ..repository import repo_dir
+from .pack import packs_load
+
+DEFAULT_ABBREV = 7
+MIN_ABBREV = 4  # shortest form object_find accepts as a SHA
+
+
+class ObjectIdIndex:
+    """
+    One sorted list of hex SHAs per fan-out byte, merged from the loose
+    objects/xx directory and the matching fan-out range of every pack.
+    Buckets are built on first use and kept up to date by add().
+    """
+
+    def __init__(self, repo):
+        self.repo = repo
+        self._buckets = {}
+        self._lock = threading.Lock()
+
+    def _bucket(self, byte):
+        with self._lock:
+            bucket = self._buckets.get(byte)
+            if bucket is None:
+                bucket = self._load(byte)
+                self._buckets[byte] = bucket
+            return bucket
+
+    def _load(self, byte):
+        prefix = f"{byte:02x}"
+        shas = set()
+        objdir = repo_dir(self.repo, "objects", prefix)
+        if objdir:
+            shas.update(prefix + name for name in os.listdir(objdir) if len(name) == 38)
+        for pack in packs_load(self.repo):
+            lo = pack.fanout[byte - 1] if byte else 0
+            for i in range(lo, pack.fanout[byte]):
+                shas.add(pack.sha_at(i).hex())
+        return sorted(shas)
+
+    def add(self, sha):
+        """
+        Record a newly written object in an already loaded bucket.
+        """
+        with self._lock:
+            bucket = self._buckets.get(int(sha[:2], 16))
+            if bucket is not None:
+                i = bisect.bisect_left(bucket, sha)
+                if i == len(bucket) or bucket[i] != sha:
+                    bucket.insert(i, sha)
+
+    def resolve(self, prefix):
+        """
+        All SHAs starting with the hex prefix (at least 2 characters).
+        """
+        prefix = prefix.lower()
+        bucket = self._bucket(int(prefix[:2], 16))
+        out = []
+        i = bisect.bisect_left(bucket, prefix)
+        while i < len(bucket) and bucket[i].startswith(prefix):
+            out.append(bucket[i])
+            i += 1
+        return out
+
+    def abbrev(self, sha, min_len=DEFAULT_ABBREV):
+        """
+        Shortest prefix of sha (but at least min_len characters, and
+        never below MIN_ABBREV) that no other known object shares.
+        """
+        bucket = self._bucket(int(sha[:2], 16))
+        i = bisect.bisect_left(bucket, sha)
+        common = 0
+        for j in (i - 1, i + 1 if i < len(bucket) and bucket[i] == sha else i):
+            if 0 <= j < len(bucket):
+                common = max(common, _common_prefix(sha, bucket[j]))
+        return sha[:max(min_len, MIN_ABBREV, common + 1)]
+
+
+def _common_prefix(a, b):
+    n = 0
+    for x, y in zip(a, b):
+        if x != y:
+            break
+        n += 1
+    return n
+
+
+def oid_index(repo):
+    if repo.oid_index is None:
+        repo.oid_index = ObjectIdIndex(repo)
+    return repo.oid_index
+
+
+def object_resolve_prefix(repo, prefix):
+    return oid_index(repo).resolve(prefix)
+
+
+def object_abbrev(repo, sha, min_len=None):
+    """
+    Unambiguous abbreviation of sha, at least core.abbrev characters.
+    """
+    if min_len is None:
+        min_len = repo.conf.getint("core", "abbrev", fallback=DEFAULT_ABBREV)
+    return oid_index(repo).abbrev(sha, min_len)
@@ -0,0 +1,444 @@
+"""
+Packfile storage: many objects in one file, delta-compressed against
+similar objects, with a sorted .idx (256-entry fan-out + SHA table)
+for binary-search lookup. The on-disk layout follows Git's pack v2 /
+idx v2 formats.
+"""
+
+import os
+import mmap
+import zlib
+import struct
+import hashlib
+import tempfile
+import threading
+
+from ..repository import repo_dir
+
+OBJ_COMMIT = 1
+OBJ_TREE = 2
+OBJ_BLOB = 3
+OBJ_TAG = 4
+OBJ_OFS_DELTA = 6
+OBJ_REF_DELTA = 7
+
+TYPE_TO_FMT = {
+    OBJ_COMMIT: b"commit",
+    OBJ_TREE: b"tree",
+    OBJ_BLOB: b"blob",
+    OBJ_TAG: b"tag",
+}
+FMT_TO_TYPE = {fmt: num for num, fmt in TYPE_TO_FMT.items()}
+
+IDX_MAGIC = b"\377tOc"
+DELTA_BLOCK = 16
+INFLATE_CHUNK = 16384
+
+_load_lock = threading.Lock()
+
+
+class PackFile:
+    """
+    A pack/idx pair opened read-only through mmap.
+    """
+
+    def __init__(self, idx_path):
+        self.idx_path = idx_path
+        self.pack_path = idx_path[:-4] + ".pack"
+        with open(idx_path, "rb") as f:
+            self.idx = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        with open(self.pack_path, "rb") as f:
+            self.pack = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        if self.idx[:4] != IDX_MAGIC or struct.unpack_from(">I", self.idx, 4)[0] != 2:
+            raise Exception(f"Unsupported pack index {idx_path}")
+        if self.pack[:4] != b"PACK":
+            raise Exception(f"Bad pack header in {self.pack_path}")
+        self.fanout = struct.unpack_from(">256I", self.idx, 8)
+        self.count = self.fanout[255]
+        self._sha_base = 8 + 256 * 4
+        self._crc_base = self._sha_base + 20 * self.count
+        self._off_base = self._crc_base + 4 * self.count
+        self._large_base = self._off_base + 4 * self.count
+
+    def close(self):
+        self.idx.close()
+        self.pack.close()
+
+    def sha_at(self, i):
+        pos = self._sha_base + 20 * i
+        return self.idx[pos:pos + 20]
+
+    def offset_at(self, i):
+        off = struct.unpack_from(">I", self.idx, self._off_base + 4 * i)[0]
+        if off & 0x80000000:
+            pos = self._large_base + 8 * (off & 0x7FFFFFFF)
+            off = struct.unpack_from(">Q", self.idx, pos)[0]
+        return off
+
+    def bisect(self, binsha):
+        """
+        Position of the first entry >= binsha, searching only the
+        fan-out bucket of its first byte.
+        """
+        first = binsha[0]
+        lo = self.fanout[first - 1] if first else 0
+        hi = self.fanout[first]
+        while lo < hi:
+            mid = (lo + hi) // 2
+            if self.sha_at(mid) < binsha:
+                lo = mid + 1
+            else:
+                hi = mid
+        return lo
+
+    def find(self, binsha):
+        i = self.bisect(binsha)
+        if i < self.count and self.sha_at(i) == binsha:
+            return i
+        return None
+
+    def shas(self):
+        for i in range(self.count):
+            yield self.sha_at(i).hex()
+
+    def read(self, binsha, repo=None):
+        """
+        Return (fmt, data) for an object in this pack, or None.
+        """
+        i = self.find(binsha)
+        if i is None:
+            return None
+        return self.read_at(self.offset_at(i), repo)
+
+    def read_at(self, offset, repo=None):
+        # collect the delta chain down to its base, then replay it
+        deltas = []
+        while True:
+            typ, size, pos = self._entry_header(offset)
+            if typ == OBJ_OFS_DELTA:
+                base_off, pos = _read_ofs(self.pack, pos)
+                deltas.append(self._inflate(pos, size))
+                offset -= base_off
+            elif typ == OBJ_REF_DELTA:
+                base_sha = self.pack[pos:pos + 20]
+                deltas.append(self._inflate(pos + 20, size))
+                base = self.read(base_sha, repo)
+                if base is None and repo is not None:
+                    from .base import object_read_raw
+                    base = object_read_raw(repo, base_sha.hex())
+                if base is None:
+                    raise Exception(f"Missing delta base {base_sha.hex()}")
+                fmt, data = base
+                break
+            else:
+                fmt, data = TYPE_TO_FMT[typ], self._inflate(pos, size)
+                break
+        for delta in reversed(deltas):
+            data = delta_apply(data, delta)
+        return fmt, data
+
+    def _entry_header(self, pos):
+        c = self.pack[pos]
+        pos += 1
+        typ = (c >> 4) & 7
+        size = c & 0x0F
+        shift = 4
+        while c & 0x80:
+            c = self.pack[pos]
+            pos += 1
+            size |= (c & 0x7F) << shift
+            shift += 7
+        return typ, size, pos
+
+    def _inflate(self, pos, size):
+        d = zlib.decompressobj()
+        out = []
+        while not d.eof:
+            chunk = self.pack[pos:pos + INFLATE_CHUNK]
+            if not chunk:
+                raise Exception(f"Truncated object in {self.pack_path}")
+            pos += INFLATE_CHUNK
+            out.append(d.decompress(chunk))
+        data = b"".join(out)
+        if len(data) != size:
+            raise Exception(f"Corrupt object in {self.pack_path}: bad length")
+        return data
+
+
+def _read_ofs(buf, pos):
+    c = buf[pos]
+    pos += 1
+    off = c & 0x7F
+    while c & 0x80:
+        c = buf[pos]
+        pos += 1
+        off = ((off + 1) << 7) | (c & 0x7F)
+    return off, pos
+
+
+def _encode_ofs(off):
+    out = [off & 0x7F]
+    off >>= 7
+    while off:
+        off -= 1
+        out.append(0x80 | (off & 0x7F))
+        off >>= 7
+    return bytes(reversed(out))
+
+
+def _encode_entry_header(typ, size):
+    c = (typ << 4) | (size & 0x0F)
+    size >>= 4
+    out = bytearray()
+    while size:
+        out.append(c | 0x80)
+        c = size & 0x7F
+        size >>= 7
+    out.append(c)
+    return bytes(out)
+
+
+def _encode_varint(n):
+    out = bytearray()
+    while True:
+        c = n & 0x7F
+        n >>= 7
+        if n:
+            out.append(c | 0x80)
+        else:
+            out.append(c)
+            return bytes(out)
+
+
+def _decode_varint(buf, pos):
+    n = shift = 0
+    while True:
+        c = buf[pos]
+        pos += 1
+        n |= (c & 0x7F) << shift
+        shift += 7
+        if not c & 0x80:
+            return n, pos
+
+
+def delta_create(src, dst):
+    """
+    Encode dst as a Git delta against src: copy instructions for runs
+    found through a 16-byte block index of src, inserts for the rest.
+    """
+    out = [_encode_varint(len(src)), _encode_varint(len(dst))]
+    index = {}
+    for off in range(0, len(src) - DELTA_BLOCK + 1, DELTA_BLOCK):
+        index.setdefault(src[off:off + DELTA_BLOCK], off)
+
+    pending = bytearray()
+    i = 0
+    end = len(dst)
+    while i < end:
+        off = index.get(dst[i:i + DELTA_BLOCK]) if i + DELTA_BLOCK <= end else None
+        if off is None:
+            pending.append(dst[i])
+            i += 1
+            continue
+        # extend the match forwards, then backwards into pending
+        n = DELTA_BLOCK
+        while i + n < end and off + n < len(src) and src[off + n] == dst[i + n]:
+            n += 1
+        while pending and off > 0 and src[off - 1] == pending[-1]:
+            pending.pop()
+            off -= 1
+            i -= 1
+            n += 1
+        _flush_insert(out, pending)
+        pending = bytearray()
+        _emit_copy(out, off, n)
+        i += n
+    _flush_insert(out, pending)
+    return b"".join(out)
+
+
+def _flush_insert(out, data):
+    for pos in range(0, len(data), 127):
+        chunk = data[pos:pos + 127]
+        out.append(bytes([len(chunk)]) + bytes(chunk))
+
+
+def _emit_copy(out, off, n):
+    while n:
+        size = min(n, 0xFFFFFF)
+        cmd = 0x80
+        args = bytearray()
+        for b in range(4):
+            byte = (off >> (8 * b)) & 0xFF
+            if byte:
+                cmd |= 1 << b
+                args.append(byte)
+        for b in range(3):
+            byte = (size >> (8 * b)) & 0xFF
+            if byte:
+                cmd |= 0x10 << b
+                args.append(byte)
+        out.append(bytes([cmd]) + bytes(args))
+        off += size
+        n -= size
+
+
+def delta_apply(src, delta):
+    """
+    Rebuild a target buffer from its base and a Git delta.
+    """
+    src_size, pos = _decode_varint(delta, 0)
+    dst_size, pos = _decode_varint(delta, pos)
+    if src_size != len(src):
+        raise Exception("Delta base size mismatch")
+    out = bytearray()
+    end = len(delta)
+    while pos < end:
+        cmd = delta[pos]
+        pos += 1
+        if cmd & 0x80:
+            off = size = 0
+            for b in range(4):
+                if cmd & (1 << b):
+                    off |= delta[pos] << (8 * b)
+                    pos += 1
+            for b in range(3):
+                if cmd & (0x10 << b):
+                    size |= delta[pos] << (8 * b)
+                    pos += 1
+            if size == 0:
+                size = 0x10000
+            out += src[off:off + size]
+        elif cmd:
+            out += delta[pos:pos + cmd]
+            pos += cmd
+        else:
+            raise Exception("Invalid delta opcode 0")
+    if len(out) != dst_size:
+        raise Exception("Delta result size mismatch")
+    return bytes(out)
+
+
+def packs_load(repo):
+    """
+    Open (once per repository instance) every pack under objects/pack.
+    """
+    with _load_lock:
+        if repo.packs is None:
+            packs = []
+            packdir = repo_dir(repo, "objects", "pack")
+            if packdir:
+                for name in sorted(os.listdir(packdir)):
+                    if name.endswith(".idx") and os.path.exists(os.path.join(packdir, name[:-4] + ".pack")):
+                        packs.append(PackFile(os.path.join(packdir, name)))
+            repo.packs = packs
+    return repo.packs
+
+
+def packs_reset(repo):
+    for pack in repo.packs or []:
+        pack.close()
+    repo.packs = None
+
+
+def pack_read(repo, sha):
+    binsha = bytes.fromhex(sha)
+    for pack in packs_load(repo):
+        res = pack.read(binsha, repo)
+        if res is not None:
+            return res
+    return None
+
+
+def pack_contains(repo, sha):
+    binsha = bytes.fromhex(sha)
+    return any(pack.find(binsha) is not None for pack in packs_load(repo))
+
+
+def pack_write(repo, shas, window=10, depth=50):
+    """
+    Write the given objects into a new pack + idx pair. Returns
+    (pack name, object count, delta count). Objects are sorted by type and size so that similar
+    objects sit next to each other, and each one is tried as a delta
+    against the previous `window` objects of the same type.
+    """
+    from .base import object_read_raw
+
+    objs = []
+    for sha in set(shas):
+        fmt, data = object_read_raw(repo, sha)
+        objs.append((FMT_TO_TYPE[fmt], len(data), sha, data))
+    objs.sort(key=lambda o: (o[0], -o[1], o[2]))
+
+    packdir = repo_dir(repo, "objects", "pack", mkdir=True)
+    fd, tmp_pack = tempfile.mkstemp(dir=packdir, prefix="tmp_pack_")
+    checksum = hashlib.sha1()
+    entries = []  # (binsha, crc32, offset)
+    offset = 0
+    deltas = 0
+    # sliding window of (typ, data, offset, chain depth)
+    recent = []
+    with os.fdopen(fd, "wb") as f:
+        def emit(chunk):
+            checksum.update(chunk)
+            f.write(chunk)
+
+        emit(b"PACK" + struct.pack(">II", 2, len(objs)))
+        offset = 12
+        for typ, size, sha, data in objs:
+            best = None
+            for btyp, bdata, boff, bdepth in recent:
+                if btyp != typ or bdepth >= depth or len(bdata) < size // 32:
+                    continue
+                delta = delta_create(bdata, data)
+                limit = len(best[0]) if best else size // 2
+                if len(delta) < limit:
+                    best = (delta, boff, bdepth + 1)
+            if best:
+                delta, boff, obj_depth = best
+                body = _encode_entry_header(OBJ_OFS_DELTA, len(delta)) + _encode_ofs(offset - boff)
+                body += zlib.compress(delta)
+                deltas += 1
+            else:
+                obj_depth = 0
+                body = _encode_entry_header(typ, size) + zlib.compress(data)
+            emit(body)
+            entries.append((bytes.fromhex(sha), zlib.crc32(body), offset))
+            recent.append((typ, data, offset, obj_depth))
+            if len(recent) > window:
+                recent.pop(0)
+            offset += len(body)
+        pack_sha = checksum.digest()
+        f.write(pack_sha)
+
+    entries.sort()
+    idx = [IDX_MAGIC, struct.pack(">I", 2)]
+    counts = [0] * 256
+    for binsha, _, _ in entries:
+        counts[binsha[0]] += 1
+    total = 0
+    for b in range(256):
+        total += counts[b]
+        idx.append(struct.pack(">I", total))
+    idx.extend(binsha for binsha, _, _ in entries)
+    idx.extend(struct.pack(">I", crc) for _, crc, _ in entries)
+    large = []
+    for _, _, off in entries:
+        if off < 0x80000000:
+            idx.append(struct.pack(">I", off))
+        else:
+            idx.append(struct.pack(">I", 0x80000000 | len(large)))
+            large.append(struct.pack(">Q", off))
+    idx.extend(large)
+    idx.append(pack_sha)
+    idx_data = b"".join(idx)
+    idx_data += hashlib.sha1(idx_data).digest()
+
+    name = pack_sha.hex()
+    base = os.path.join(packdir, f"pack-{name}")
+    with open(base + ".idx.tmp", "wb") as f:
+        f.write(idx_data)
+    os.replace(tmp_pack, base + ".pack")
+    os.replace(base + ".idx.tmp", base + ".idx")
+    packs_reset(repo)
+    return name, len(objs), deltas
@@ -1,5 +1,13 @@
 from .commit import GitCommit
 
 class GitTag(GitCommit):
+    __slots__ = ()
     fmt = b"tag"
-    # inherits deserialize/serialize from GitCommit
+    # inherits deserialize/serialize and header access from GitCommit
+
+    @property
+    def target(self):
+        """
+        SHA of the tagged object.
+        """
+        return self.header(b"object").decode()
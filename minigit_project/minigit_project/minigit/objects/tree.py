@@ -1,13 +1,33 @@
 import os
-from .base import GitObject, object_read
+import queue
+from array import array
+import threading
+from .base import GitObject, object_read, object_read_raw, object_write
 from ..repository import repo_file
 
+# below this many files a checkout is written serially
+PARALLEL_CHECKOUT_THRESHOLD = 100
+
+# mode of a subtree entry as git writes it; older minigit trees say "040000"
+TREE_MODE = b"40000"
+
+def mode_is_dir(mode):
+    return mode == TREE_MODE or mode == b"040000"
+
 class GitTreeLeaf:
+    __slots__ = ("mode", "path", "sha")
+
     def __init__(self, mode, path, sha):
-        self.mode = mode      # e.g. b"100644" or b"040000"
+        self.mode = mode      # e.g. b"100644" or b"40000"
         self.path = path      # string
         self.sha  = sha       # hex string
 
+def tree_leaf(mode, name, binsha):
+    """
+    GitTreeLeaf from the raw fields given by GitTree.entries().
+    """
+    return GitTreeLeaf(mode, name.decode("utf-8"), binsha.hex())
+
 def tree_parse_one(raw, start=0):
     """
     Parse a single entry from a raw Git tree.
@@ -29,39 +49,279 @@ def tree_parse(raw):
         items.append(leaf)
     return items
 
+def _sort_key(name, is_dir):
+    # git orders entries bytewise as if directory names ended in "/"
+    return name + b"/" if is_dir else name
+
 def tree_serialize(tree_obj):
     """
-    Given a GitTree (with .items), produce its raw content bytes.
+    Given a GitTree (with .items), produce its raw content bytes, in
+    git's entry order and with git's mode for subtrees.
     """
-    tree_obj.items.sort(key=lambda it: it.path)
-    out = b""
+    entries = []
     for leaf in tree_obj.items:
-        out += leaf.mode + b" " + leaf.path.encode("utf-8") + b"\x00"
-        out += bytes.fromhex(leaf.sha)
-    return out
+        name = leaf.path.encode("utf-8")
+        is_dir = mode_is_dir(leaf.mode)
+        mode = TREE_MODE if is_dir else leaf.mode
+        entries.append((_sort_key(name, is_dir), mode, name, leaf.sha))
+    entries.sort(key=lambda e: e[0])
+    return b"".join(b"%s %s\x00%s" % (mode, name, bytes.fromhex(sha))
+                    for _, mode, name, sha in entries)
 
 class GitTree(GitObject):
+    """
+    A tree read from the object store keeps its raw bytes and a table
+    of entry offsets. Entries become GitTreeLeaf objects only when
+    .items is used; entries() hands out the raw fields instead, and
+    lookup() binary-searches them, as git keeps them sorted. A tree
+    built in memory is just its .items list.
+    """
+    __slots__ = ("_raw", "_offsets", "_ordered", "_entries", "_items")
     fmt = b"tree"
 
     def deserialize(self, data):
-        self.items = tree_parse(data)
+        self._raw = bytes(data)
+        self._offsets = None
+        self._ordered = None
+        self._entries = None
+        self._items = None
 
     def serialize(self):
+        if self._items is None:
+            return self._raw
         return tree_serialize(self)
 
     def init(self):
-        self.items = []
+        self._raw = None
+        self._offsets = None
+        self._ordered = None
+        self._entries = None
+        self._items = []
+
+    @property
+    def items(self):
+        if self._items is None:
+            self._items = tree_parse(self._raw)
+        return self._items
+
+    @items.setter
+    def items(self, value):
+        self._items = value
+
+    def _index(self):
+        if self._offsets is None:
+            raw = self._raw
+            offsets = array("I")
+            # whether the entries are in git's order, which trees
+            # minigit wrote before it followed that order are not
+            ordered = True
+            prev = b""
+            pos = 0
+            while pos < len(raw):
+                offsets.append(pos)
+                spc = raw.find(b" ", pos)
+                nul = raw.find(b"\x00", spc)
+                key = _sort_key(raw[spc+1:nul], mode_is_dir(raw[pos:spc]))
+                if key <= prev:
+                    ordered = False
+                prev = key
+                pos = nul + 21
+            self._offsets = offsets
+            self._ordered = ordered
+        return self._offsets
+
+    def __len__(self):
+        if self._items is not None:
+            return len(self._items)
+        return len(self._index())
+
+    def _entry(self, i):
+        # (mode, name) as bytes, and where the binary SHA starts
+        raw, pos = self._raw, self._offsets[i]
+        spc = raw.find(b" ", pos)
+        nul = raw.find(b"\x00", spc)
+        return raw[pos:spc], raw[spc+1:nul], nul + 1
+
+    def entries(self):
+        """
+        (mode, name, binary SHA), all bytes, for every entry in stored
+        order, without decoding anything. Kept for the next call, as
+        cached trees get walked again.
+        """
+        if self._items is not None:
+            return [(leaf.mode, leaf.path.encode("utf-8"), bytes.fromhex(leaf.sha))
+                    for leaf in self._items]
+        if self._entries is None:
+            raw = self._raw
+            find = raw.find
+            entries = []
+            pos, end = 0, len(raw)
+            while pos < end:
+                spc = find(b" ", pos)
+                nul = find(b"\x00", spc)
+                entries.append((raw[pos:spc], raw[spc+1:nul], raw[nul+1:nul+21]))
+                pos = nul + 21
+            self._entries = entries
+        return self._entries
+
+    def lookup(self, name):
+        """
+        The GitTreeLeaf called name, or None.
+        """
+        if self._items is not None:
+            for leaf in self._items:
+                if leaf.path == name:
+                    return leaf
+            return None
+        offsets = self._index()
+        target = name.encode("utf-8")
+        if not self._ordered:
+            # out of order, so the search below could miss
+            for mode, entry_name, binsha in self.entries():
+                if entry_name == target:
+                    return tree_leaf(mode, entry_name, binsha)
+            return None
+        # the entry sorts as name if it is a file and as name + "/" if
+        # it is a directory, so try both
+        for is_dir in (False, True):
+            key = _sort_key(target, is_dir)
+            lo, hi = 0, len(offsets)
+            while lo < hi:
+                mid = (lo + hi) // 2
+                mode, entry_name, sha_pos = self._entry(mid)
+                entry_key = _sort_key(entry_name, mode_is_dir(mode))
+                if entry_key < key:
+                    lo = mid + 1
+                elif entry_key > key:
+                    hi = mid
+                else:
+                    return GitTreeLeaf(mode, name, self._raw[sha_pos:sha_pos+20].hex())
+        return None
 
-def tree_checkout(repo, tree, dest_path):
+def tree_lookup(repo, tree_sha, path):
     """
-    Write a tree object (and subtrees) out into the working directory.
+    The GitTreeLeaf at path ("a/b/c") below tree tree_sha, or None.
+    Reads one tree per path component.
     """
-    os.makedirs(dest_path, exist_ok=True)
-    for leaf in tree.items:
-        obj = object_read(repo, leaf.sha)
-        target = os.path.join(dest_path, leaf.path)
-        if leaf.mode.startswith(b"04"):  # directory
-            tree_checkout(repo, obj, target)
-        else:  # blob
-            with open(target, "wb") as f:
-                f.write(obj.blobdata)
+    leaf = None
+    for part in path.strip("/").split("/"):
+        if leaf is not None:
+            if not mode_is_dir(leaf.mode):
+                return None
+            tree_sha = leaf.sha
+        leaf = object_read(repo, tree_sha).lookup(part)
+        if leaf is None:
+            return None
+    return leaf
+
+def tree_update(repo, tree_sha, changes):
+    """
+    Write a copy of tree tree_sha (None for an empty tree) with changes
+    applied, where changes maps a path to (mode, sha) or to None to
+    delete it. A name given its own (mode, sha) replaces anything below
+    it, so {"d/f": None, "d": (mode, sha)} turns directory d into a
+    file. Only the trees along changed paths are read and rewritten.
+    Returns the new tree SHA, or None if nothing is left.
+    """
+    items = {}
+    if tree_sha is not None:
+        items = {leaf.path: leaf for leaf in object_read(repo, tree_sha).items}
+    nested = {}
+    replaced = set()
+    for path, value in changes.items():
+        name, sep, rest = path.partition("/")
+        if sep:
+            nested.setdefault(name, {})[rest] = value
+        elif value is None:
+            items.pop(name, None)
+        else:
+            items[name] = GitTreeLeaf(mode=value[0], path=name, sha=value[1])
+            replaced.add(name)
+    for name, sub in nested.items():
+        if name in replaced:
+            # a file (or tree) given for name itself replaces whatever
+            # was below it
+            continue
+        leaf = items.get(name)
+        if leaf is not None and not mode_is_dir(leaf.mode):
+            raise Exception(f"Cannot update {name}/: not a directory")
+        sha = tree_update(repo, leaf.sha if leaf else None, sub)
+        if sha is None:
+            items.pop(name, None)
+        else:
+            items[name] = GitTreeLeaf(mode=TREE_MODE, path=name, sha=sha)
+    if not items:
+        return None
+    tree = GitTree()
+    tree.items = list(items.values())
+    return object_write(tree, repo)
+
+def checkout_workers(repo, count, workers=None):
+    """
+    Number of writer threads for checking out count files: workers if
+    given, else checkout.workers (default: CPU count); 1 for small jobs.
+    """
+    if workers is None:
+        workers = repo.conf.getint("checkout", "workers", fallback=os.cpu_count() or 1)
+    if count < PARALLEL_CHECKOUT_THRESHOLD:
+        return 1
+    return max(1, workers)
+
+class BlobWriter:
+    """
+    Checkout pipeline: the producer queues (path, sha) jobs with put()
+    after creating the target directory, and worker threads inflate
+    each blob and write it out. stats maps every written path to its
+    lstat result. With a single worker jobs are written inline.
+    """
+
+    def __init__(self, repo, workers=1):
+        self.repo = repo
+        self.stats = {}
+        self.errors = []
+        self.threads = []
+        if workers > 1:
+            self.queue = queue.Queue(maxsize=workers * 16)
+            for _ in range(workers):
+                t = threading.Thread(target=self._run, daemon=True)
+                t.start()
+                self.threads.append(t)
+
+    def put(self, path, sha):
+        if self.threads:
+            self.queue.put((path, sha))
+        else:
+            self._write(path, sha)
+
+    def _run(self):
+        while True:
+            job = self.queue.get()
+            if job is None:
+                return
+            try:
+                self._write(*job)
+            except Exception as e:
+                self.errors.append(e)
+
+    def _write(self, path, sha):
+        fmt, data = object_read_raw(self.repo, sha)
+        if fmt != b"blob":
+            raise Exception(f"Expected blob at {path}, found {fmt.decode()} {sha}")
+        with open(path, "wb") as f:
+            f.write(data)
+        self.stats[path] = os.lstat(path)
+
+    def close(self):
+        for _ in self.threads:
+            self.queue.put(None)
+        for t in self.threads:
+            t.join()
+        self.threads = []
+        if self.errors:
+            raise self.errors[0]
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
@@ -1,31 +1,214 @@
+"""
+References: loose files under .minigit/refs plus the sorted
+.minigit/packed-refs file ("<sha> <refname>" per line). A loose ref
+always overrides its packed copy.
+"""
+
 import os
+import stat
 
-from .repository import repo_file, repo_dir
+from .repository import repo_file
 
-def ref_resolve(repo, ref):
-    path = repo_file(repo, ref)
-    if not os.path.isfile(path):
+PACKED_REFS_HEADER = b"# pack-refs with: sorted \n"
+# how many symbolic refs may be chained before giving up
+SYMREF_MAX_DEPTH = 5
+
+
+class PackedRefs:
+    """
+    Contents of a packed-refs file. Lookups binary-search the raw
+    bytes, so no line is parsed until it is needed. Lines starting
+    with "^" (peeled tags written by git) belong to the ref above.
+    """
+
+    def __init__(self, data):
+        self.data = data
+        self.start = 0
+        while data.startswith(b"#", self.start):
+            nl = data.find(b"\n", self.start)
+            self.start = len(data) if nl < 0 else nl + 1
+
+    def _record_start(self, pos):
+        data = self.data
+        while pos > self.start and (data[pos - 1] != 0x0A or data[pos] == 0x5E):
+            pos -= 1
+        return pos
+
+    def _record_end(self, pos):
+        data = self.data
+        while pos < len(data):
+            nl = data.find(b"\n", pos)
+            pos = len(data) if nl < 0 else nl + 1
+            if pos >= len(data) or data[pos] != 0x5E:
+                break
+        return pos
+
+    def lookup(self, name):
+        """
+        SHA of ref name, or None.
+        """
+        target = name.encode()
+        lo, hi = self.start, len(self.data)
+        while lo < hi:
+            rec = self._record_start(lo + (hi - lo) // 2)
+            nl = self.data.find(b"\n", rec)
+            line = self.data[rec:nl if nl >= 0 else len(self.data)]
+            refname = line[41:]
+            if refname < target:
+                lo = self._record_end(rec)
+            elif refname > target:
+                hi = rec
+            else:
+                return line[:40].decode()
+        return None
+
+    def items(self):
+        """
+        (name, sha) for every ref, in name order.
+        """
+        for line in self.data[self.start:].splitlines():
+            if line and not line.startswith(b"^"):
+                yield line[41:].decode(), line[:40].decode()
+
+
+class RefCache:
+    """
+    Loose ref contents and the parsed packed-refs file, each reused
+    for as long as the file's stat data stays the same.
+    """
+
+    def __init__(self):
+        self.loose = {}  # path -> (stat key, contents)
+        self.packed = None
+        self.packed_key = None
+
+
+def ref_cache(repo):
+    if repo.ref_cache is None:
+        repo.ref_cache = RefCache()
+    return repo.ref_cache
+
+
+def _stat_key(st):
+    return (st.st_mtime_ns, st.st_size, st.st_ino)
+
+
+def packed_refs(repo):
+    """
+    The repository's PackedRefs, reloaded when the file changes.
+    """
+    cache = ref_cache(repo)
+    path = os.path.join(repo.gitdir, "packed-refs")
+    try:
+        key = _stat_key(os.stat(path))
+    except FileNotFoundError:
+        key = None
+    if cache.packed is None or key != cache.packed_key:
+        data = b""
+        if key is not None:
+            with open(path, "rb") as f:
+                data = f.read()
+        cache.packed = PackedRefs(data)
+        cache.packed_key = key
+    return cache.packed
+
+
+def _loose_read(repo, ref):
+    cache = ref_cache(repo)
+    path = os.path.join(repo.gitdir, ref)
+    try:
+        st = os.stat(path)
+    except (FileNotFoundError, NotADirectoryError):
+        cache.loose.pop(path, None)
         return None
-    data = open(path).read().strip()
-    if data.startswith("ref: "):
-        # recurse through symbolic ref
-        return ref_resolve(repo, data[5:])
+    if not stat.S_ISREG(st.st_mode):
+        return None
+    key = _stat_key(st)
+    hit = cache.loose.get(path)
+    if hit is not None and hit[0] == key:
+        return hit[1]
+    with open(path) as f:
+        data = f.read().strip()
+    cache.loose[path] = (key, data)
+    return data
+
+
+def ref_read(repo, ref):
+    """
+    Raw value of ref: a SHA, "ref: <target>" for a symbolic ref, or
+    None. Loose refs win over packed ones.
+    """
+    data = _loose_read(repo, ref)
+    if data is None and ref.startswith("refs/"):
+        data = packed_refs(repo).lookup(ref)
     return data
 
-def ref_list(repo, path=None):
-    if path is None:
-        path = repo_dir(repo, "refs")
+
+def ref_resolve(repo, ref):
+    """
+    Follow symbolic refs from ref and return the SHA it points at, or
+    None if it does not exist.
+    """
+    for _ in range(SYMREF_MAX_DEPTH + 1):
+        data = ref_read(repo, ref)
+        if data is None or not data.startswith("ref: "):
+            return data
+        ref = data[5:]
+    raise Exception(f"Too many levels of symbolic refs at {ref}")
+
+
+def _loose_names(repo, prefix):
+    top = os.path.join(repo.gitdir, prefix)
+    stack = [top] if os.path.isdir(top) else []
+    while stack:
+        with os.scandir(stack.pop()) as it:
+            for entry in it:
+                if entry.is_dir(follow_symlinks=False):
+                    stack.append(entry.path)
+                elif not entry.name.endswith(".lock"):
+                    yield os.path.relpath(entry.path, repo.gitdir).replace(os.sep, "/")
+
+
+def ref_names(repo, prefix="refs/"):
+    """
+    Sorted (name, sha) pairs for every ref under prefix, loose and
+    packed.
+    """
+    refs = {name: sha for name, sha in packed_refs(repo).items() if name.startswith(prefix)}
+    for name in _loose_names(repo, prefix):
+        sha = ref_resolve(repo, name)
+        if sha:
+            refs[name] = sha
+    return sorted(refs.items())
+
+
+def ref_list(repo, prefix="refs/"):
+    """
+    Refs under prefix as a nested dict: one level per path component,
+    with SHAs at the leaves.
+    """
     refs = {}
-    for name in sorted(os.listdir(path)):
-        full = os.path.join(path, name)
-        if os.path.isdir(full):
-            refs[name] = ref_list(repo, full)
-        else:
-            # relpath inside .minigit
-            rel = os.path.relpath(full, repo.gitdir)
-            refs[name] = ref_resolve(repo, rel)
+    for name, sha in ref_names(repo, prefix):
+        node = refs
+        parts = name[len(prefix):].split("/")
+        for part in parts[:-1]:
+            node = node.setdefault(part, {})
+        node[parts[-1]] = sha
     return refs
 
+
+def packed_refs_write(repo, refs):
+    """
+    Replace .minigit/packed-refs with the (name, sha) pairs in refs.
+    """
+    lines = [PACKED_REFS_HEADER]
+    lines.extend(f"{sha} {name}\n".encode() for name, sha in sorted(refs))
+    path = os.path.join(repo.gitdir, "packed-refs")
+    with open(path + ".lock", "wb") as f:
+        f.write(b"".join(lines))
+    os.replace(path + ".lock", path)
+
+
 def show_ref(repo, refs, prefix="refs", with_hash=True):
     for name, val in refs.items():
         if isinstance(val, dict):
@@ -0,0 +1,145 @@
+"""
+Rename and copy detection on top of tree_diff. Added files are paired
+with deleted ones (and, for copies, with modified ones) first by blob ID
+and then by content similarity. Similarity compares fingerprints: each
+blob is cut into chunks at newlines (or every CHUNK_MAX bytes), chunks
+are hashed, and the score is the share of bytes whose chunks occur on
+both sides. Inexact matching looks at every source/destination pair,
+so it is skipped when there are more pairs than the rename limit
+allows.
+"""
+
+import zlib
+
+from .objects.base import object_read
+from .tree_diff import TreeChange, ADDED, DELETED, MODIFIED, RENAMED, COPIED
+
+# minimum similarity, in percent, for a pair to count as a rename
+DEFAULT_RENAME_SCORE = 50
+# inexact detection runs only for at most limit * limit candidate pairs
+DEFAULT_RENAME_LIMIT = 1000
+CHUNK_MAX = 64
+
+
+def parse_score(arg):
+    """
+    Similarity threshold in percent from "60%" or "60".
+    """
+    try:
+        score = int(arg[:-1] if arg.endswith("%") else arg)
+    except ValueError:
+        raise Exception(f"Invalid similarity score: {arg}")
+    if not 0 <= score <= 100:
+        raise Exception(f"Invalid similarity score: {arg}")
+    return score
+
+
+def fingerprint(data):
+    """
+    Map of chunk hash -> number of bytes in chunks with that hash.
+    """
+    counts = {}
+    start, n = 0, len(data)
+    while start < n:
+        nl = data.find(b"\n", start, start + CHUNK_MAX)
+        end = nl + 1 if nl >= 0 else min(n, start + CHUNK_MAX)
+        key = zlib.crc32(data[start:end])
+        counts[key] = counts.get(key, 0) + end - start
+        start = end
+    return counts
+
+
+def similarity(src, dst, src_size, dst_size):
+    """
+    Percentage of the larger blob covered by chunks the two share.
+    """
+    if not src_size and not dst_size:
+        return 100
+    if len(dst) < len(src):
+        src, dst = dst, src
+    common = 0
+    for key, count in src.items():
+        other = dst.get(key)
+        if other:
+            common += min(count, other)
+    return common * 100 // max(src_size, dst_size)
+
+
+def _kind(mode):
+    # regular files pair with regular files, symlinks with symlinks
+    return mode[:-4].lstrip(b"0")
+
+
+def detect_renames(repo, changes, threshold=DEFAULT_RENAME_SCORE, copies=False, limit=None):
+    """
+    Return changes (TreeChanges from tree_diff) with added/deleted pairs
+    merged into RENAMED changes, and with copies=True added files that
+    came from a deleted or modified file into COPIED ones. Each deleted
+    file is renamed at most once; the best scores are paired first.
+    """
+    if limit is None:
+        limit = repo.conf.getint("diff", "renamelimit", fallback=DEFAULT_RENAME_LIMIT)
+    changes = list(changes)
+    added = [c for c in changes if c.status == ADDED and _kind(c.new_mode) != b"16"]
+    deleted = [c for c in changes if c.status == DELETED and _kind(c.old_mode) != b"16"]
+    if not added or not (deleted or copies):
+        return changes
+    sources = deleted + ([c for c in changes if c.status == MODIFIED] if copies else [])
+    used = set()     # indices of deleted files already renamed
+    paired = {}      # id(added change) -> its replacement
+
+    def pair(dst, i, score):
+        src = sources[i]
+        if _kind(src.old_mode) != _kind(dst.new_mode) or id(dst) in paired:
+            return
+        if src.status == DELETED and i not in used:
+            used.add(i)
+            status = RENAMED
+        elif copies:
+            status = COPIED
+        else:
+            return
+        paired[id(dst)] = TreeChange(dst.path, src.old_mode, src.old_sha, dst.new_mode, dst.new_sha,
+                                     status, old_path=src.path, score=score)
+
+    by_sha = {}
+    for i, src in enumerate(sources):
+        by_sha.setdefault(src.old_sha, []).append(i)
+    for dst in added:
+        for i in by_sha.get(dst.new_sha, ()):
+            pair(dst, i, 100)
+
+    dsts = [c for c in added if id(c) not in paired]
+    srcs = [i for i, c in enumerate(sources) if copies or i not in used]
+    if dsts and srcs and len(dsts) * len(srcs) <= limit * limit:
+        blobs = {}
+
+        def load(sha):
+            if sha not in blobs:
+                data = object_read(repo, sha).blobdata
+                blobs[sha] = (len(data), fingerprint(data))
+            return blobs[sha]
+
+        candidates = []
+        for di, dst in enumerate(dsts):
+            dst_size, dst_fp = load(dst.new_sha)
+            for i in srcs:
+                src_size, src_fp = load(sources[i].old_sha)
+                # the smaller blob bounds how much the two can share
+                if max(src_size, dst_size) * threshold > min(src_size, dst_size) * 100:
+                    continue
+                score = similarity(src_fp, dst_fp, src_size, dst_size)
+                if score >= threshold:
+                    candidates.append((-score, di, i))
+        candidates.sort()
+        for score, di, i in candidates:
+            pair(dsts[di], i, -score)
+
+    renamed_from = {sources[i].path for i in used}
+    result = []
+    for change in changes:
+        if change.status == DELETED and change.path in renamed_from:
+            continue
+        result.append(paired.get(id(change), change))
+    result.sort(key=lambda c: c.path)
+    return result
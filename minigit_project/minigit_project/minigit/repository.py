@@ -13,7 +13,7 @@ def repo_dir(repo, *paths, mkdir=False):
             return full
         raise Exception(f"Not a directory: {full}")
     if mkdir:
-        os.makedirs(full)
+        os.makedirs(full, exist_ok=True)
         return full
     return None
 
@@ -36,6 +36,11 @@ class GitRepository:
     def __init__(self, path, force=False):
         self.worktree = path
         self.gitdir   = os.path.join(path, ".minigit")
+        self.packs    = None  # opened lazily by objects.pack.packs_load
+        self.object_cache = None  # created lazily by objects.cache.object_cache
+        self.oid_index = None  # created lazily by objects.oid_index.oid_index
+        self.commit_graph = None  # opened lazily by commit_graph.commit_graph
+        self.ref_cache = None  # created lazily by refs.ref_cache
         if not (force or os.path.isdir(self.gitdir)):
             raise Exception(f"Not a MiniGit repository: {path}")
         self.conf = configparser.ConfigParser()
@@ -0,0 +1,225 @@
+"""
+Revision walking. rev_walk() is a generator over the commits reachable
+from some tips, driven by a heap instead of recursion:
+
+- date order (the default) pops the newest commit first and streams,
+  so the first commits come out before the rest of history is read;
+- ranges ("A..B", "^A") need to know what is reachable from the
+  excluded tips: the walk goes on, newest first, until only excluded
+  commits are left queued and a few more (SLOP) have been taken, since
+  a commit older than its parent can let the exclusion fall behind;
+- topological order counts children first and then emits a commit only
+  once all its children are out (Kahn's algorithm), keeping the ready
+  ones on a stack so each line of history comes out in one piece.
+"""
+
+import heapq
+
+from .objects.base import object_find
+from .commit_graph import commit_parents, commit_time
+
+ORDER_DATE = "date"
+ORDER_TOPO = "topo"
+
+UNINTERESTING = 1
+SEEN = 2      # queued once; never queued again
+
+# uninteresting commits taken after nothing interesting is left queued
+# (git's SLOP)
+SLOP = 5
+
+
+def rev_parse_range(repo, specs):
+    """
+    Split revision arguments into (include, exclude) commit SHAs.
+    "A..B" means B but not A (either side defaults to HEAD), "^A" means
+    not A.
+    """
+    include, exclude = [], []
+    for spec in specs:
+        if ".." in spec:
+            left, right = spec.split("..", 1)
+            exclude.append(object_find(repo, left or "HEAD", fmt=b"commit"))
+            include.append(object_find(repo, right or "HEAD", fmt=b"commit"))
+        elif spec.startswith("^"):
+            exclude.append(object_find(repo, spec[1:], fmt=b"commit"))
+        else:
+            include.append(object_find(repo, spec, fmt=b"commit"))
+    for sha in include + exclude:
+        if sha is None:
+            raise Exception("Not a valid revision")
+    return include, exclude
+
+
+class _DateQueue:
+    """
+    Max-heap of commits by commit time; ties pop in insertion order.
+    """
+
+    def __init__(self, repo):
+        self.repo = repo
+        self.heap = []
+        self.counter = 0
+
+    def push(self, sha):
+        self.counter += 1
+        heapq.heappush(self.heap, (-commit_time(self.repo, sha), self.counter, sha))
+
+    def pop(self):
+        return heapq.heappop(self.heap)[2]
+
+    def peek(self):
+        return self.heap[0][2]
+
+    def __iter__(self):
+        return (item[2] for item in self.heap)
+
+    def __len__(self):
+        return len(self.heap)
+
+
+def _parents(repo, sha, first_parent):
+    parents = commit_parents(repo, sha)
+    return parents[:1] if first_parent else parents
+
+
+def _walk_date(repo, include, first_parent):
+    seen = set(include)
+    queue = _DateQueue(repo)
+    for sha in include:
+        queue.push(sha)
+    while queue:
+        sha = queue.pop()
+        yield sha
+        for parent in _parents(repo, sha, first_parent):
+            if parent not in seen:
+                seen.add(parent)
+                queue.push(parent)
+
+
+def _mark_uninteresting(repo, flags, sha):
+    # the mark passes on to ancestors the walk has already queued, so
+    # they are known to be excluded when they come up
+    stack = [sha]
+    while stack:
+        cur = stack.pop()
+        old = flags.get(cur, 0)
+        if old & UNINTERESTING:
+            continue
+        flags[cur] = old | UNINTERESTING
+        if old & SEEN:
+            stack.extend(commit_parents(repo, cur))
+
+
+def _mark_parents_uninteresting(repo, flags, sha):
+    # git does this for every excluded commit it parses, that is, as
+    # soon as the commit is queued, not when it comes out
+    for parent in commit_parents(repo, sha):
+        _mark_uninteresting(repo, flags, parent)
+
+
+def _walk_limited(repo, include, exclude, first_parent):
+    """
+    Interesting commits reachable from include but not from exclude,
+    newest first in the order they were walked (git's limit_list).
+    """
+    flags = {}
+    queue = _DateQueue(repo)
+
+    def push(sha):
+        if not flags.get(sha, 0) & SEEN:
+            flags[sha] = flags.get(sha, 0) | SEEN
+            queue.push(sha)
+
+    for sha in exclude:
+        _mark_uninteresting(repo, flags, sha)
+        _mark_parents_uninteresting(repo, flags, sha)
+    for sha in include + exclude:
+        push(sha)
+    walked = []
+    last = None    # commit time of the last interesting commit walked
+    slop = SLOP
+    interesting = None    # a queued commit last seen to be interesting
+    while queue:
+        sha = queue.pop()
+        if sha == interesting:
+            interesting = None
+        if flags[sha] & UNINTERESTING:
+            for parent in commit_parents(repo, sha):
+                _mark_uninteresting(repo, flags, parent)
+                _mark_parents_uninteresting(repo, flags, parent)
+                push(parent)
+            if not queue:
+                break
+            # go on while something queued is as new as the last
+            # interesting commit or still interesting itself; after
+            # that, take SLOP more before giving up
+            if interesting is not None and flags[interesting] & UNINTERESTING:
+                interesting = None
+            if interesting is None:
+                interesting = next((q for q in queue if not flags[q] & UNINTERESTING), None)
+            if (last is not None and last <= commit_time(repo, queue.peek())) or interesting is not None:
+                slop = SLOP
+            else:
+                slop -= 1
+                if not slop:
+                    break
+            continue
+        walked.append(sha)
+        last = commit_time(repo, sha)
+        for parent in _parents(repo, sha, first_parent):
+            push(parent)
+    return [sha for sha in walked if not flags[sha] & UNINTERESTING]
+
+
+def _sort_topo(repo, commits, first_parent):
+    members = set(commits)
+    children = dict.fromkeys(commits, 0)
+    for sha in commits:
+        for parent in _parents(repo, sha, first_parent):
+            if parent in members:
+                children[parent] += 1
+    # ready commits go on a stack, so a line of history is finished
+    # before the walk moves on to another; tips start in walk order
+    ready = [sha for sha in commits if not children[sha]]
+    ready.reverse()
+    while ready:
+        sha = ready.pop()
+        yield sha
+        for parent in _parents(repo, sha, first_parent):
+            if parent in members:
+                children[parent] -= 1
+                if not children[parent]:
+                    ready.append(parent)
+
+
+def rev_walk(repo, include, exclude=(), order=ORDER_DATE, max_count=None, since=None,
+             first_parent=False):
+    """
+    Yield the SHAs of commits reachable from include but not from
+    exclude, newest first (order=ORDER_DATE) or with every commit ahead
+    of its parents (order=ORDER_TOPO). since (seconds since the epoch)
+    drops older commits; first_parent follows only first parents.
+    """
+    include, exclude = list(include), list(exclude)
+    if max_count is not None and max_count <= 0:
+        return
+    if exclude or order == ORDER_TOPO:
+        commits = _walk_limited(repo, include, exclude, first_parent)
+        if since is not None:
+            commits = [sha for sha in commits if commit_time(repo, sha) >= since]
+        if order == ORDER_TOPO:
+            commits = _sort_topo(repo, commits, first_parent)
+    else:
+        commits = _walk_date(repo, include, first_parent)
+    count = 0
+    for sha in commits:
+        if since is not None and commit_time(repo, sha) < since:
+            if not exclude and order == ORDER_DATE:
+                # everything still queued is older still
+                return
+            continue
+        yield sha
+        count += 1
+        if max_count is not None and count >= max_count:
+            return
@@ -0,0 +1,102 @@
+"""
+Streaming tree-to-tree diff. Both trees are walked side by side in git's
+entry order and any pair of subtrees with the same ID is skipped without
+being read, so the work follows the size of the change rather than the
+size of the trees.
+"""
+
+from operator import itemgetter
+
+from .objects.base import object_read
+from .objects.tree import mode_is_dir, tree_leaf, _sort_key
+
+ADDED = "added"
+DELETED = "deleted"
+MODIFIED = "modified"
+# only produced by rename detection (see rename.py)
+RENAMED = "renamed"
+COPIED = "copied"
+
+
+class TreeChange:
+    def __init__(self, path, old_mode, old_sha, new_mode, new_sha, status, old_path=None, score=None):
+        self.path = path          # full path from the root tree
+        self.old_mode = old_mode  # None when added
+        self.old_sha = old_sha
+        self.new_mode = new_mode  # None when deleted
+        self.new_sha = new_sha
+        self.status = status      # ADDED, DELETED, MODIFIED, RENAMED or COPIED
+        self.old_path = old_path if old_path is not None else path
+        self.score = score        # similarity in percent, for renames and copies
+
+
+def _is_dir(leaf):
+    return mode_is_dir(leaf.mode)
+
+
+def _tree_entries(repo, sha, trees):
+    if sha is None:
+        return []
+    tree = trees.get(sha) if trees else None
+    if tree is None:
+        tree = object_read(repo, sha)
+        if tree is None or tree.fmt != b"tree":
+            raise Exception(f"Not a tree: {sha}")
+    # raw (sort key, mode, name, binary SHA) in git's order, whatever
+    # order the tree was written in; a directory sorts as name + "/"
+    entries = [(_sort_key(name, mode_is_dir(mode)), mode, name, binsha)
+               for mode, name, binsha in tree.entries()]
+    entries.sort(key=itemgetter(0))
+    return entries
+
+
+def tree_diff(repo, old, new, trees=None, prefix=""):
+    """
+    Yield a TreeChange for every file that differs between the trees
+    old and new (SHAs; None stands for an empty tree), in the order
+    git diff-tree -r gives them.
+    trees optionally maps SHA -> GitTree for trees that only exist in
+    memory, e.g. one built from the index without writing it.
+    """
+    if old == new:
+        return
+    a = _tree_entries(repo, old, trees)
+    b = _tree_entries(repo, new, trees)
+    i = j = 0
+    while i < len(a) or j < len(b):
+        if j == len(b) or (i < len(a) and a[i][0] < b[j][0]):
+            yield from _one_side(repo, tree_leaf(*a[i][1:]), None, trees, prefix)
+            i += 1
+        elif i == len(a) or b[j][0] < a[i][0]:
+            yield from _one_side(repo, None, tree_leaf(*b[j][1:]), trees, prefix)
+            j += 1
+        else:
+            # the same key means both are directories or both files
+            # (a file and a directory of one name come up apart);
+            # unchanged entries are never decoded, and two differing
+            # subtrees only need their IDs
+            _, old_mode, name, old_sha = a[i]
+            _, new_mode, _, new_sha = b[j]
+            if mode_is_dir(old_mode):
+                if old_sha != new_sha:
+                    yield from tree_diff(repo, old_sha.hex(), new_sha.hex(), trees,
+                                         prefix + name.decode("utf-8") + "/")
+            elif old_sha != new_sha or old_mode != new_mode:
+                yield TreeChange(prefix + name.decode("utf-8"), old_mode, old_sha.hex(),
+                                 new_mode, new_sha.hex(), MODIFIED)
+            i += 1
+            j += 1
+
+
+def _one_side(repo, old, new, trees, prefix):
+    leaf = old or new
+    path = prefix + leaf.path
+    if _is_dir(leaf):
+        sub_old = old.sha if old else None
+        sub_new = new.sha if new else None
+        yield from tree_diff(repo, sub_old, sub_new, trees, path + "/")
+    elif old:
+        yield TreeChange(path, old.mode, old.sha, None, None, DELETED)
+    else:
+        yield TreeChange(path, None, None, new.mode, new.sha, ADDED)
+
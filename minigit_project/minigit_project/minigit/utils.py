@@ -1,46 +1,68 @@
-def kvlm_parse(raw, start=0, dct=None):
+def kvlm_scan(raw):
+    """
+    Locate the headers of a key-value list with message (commits and
+    tags) without copying anything. Returns ([(key, start, end)], body)
+    where raw[start:end] is a value still folded ("\\n " continuation
+    lines) and raw[body:] is the message.
+    """
+    fields = []
+    pos, n = 0, len(raw)
+    while pos < n:
+        nl = raw.find(b"\n", pos)
+        if nl < 0:
+            nl = n
+        # end of headers
+        if nl == pos:
+            return fields, pos + 1
+        spc = raw.find(b" ", pos, nl)
+        if spc < 0:
+            raise Exception("Malformed header line")
+        # multiline values
+        end = nl
+        while end + 1 < n and raw[end + 1] == 0x20:
+            nxt = raw.find(b"\n", end + 1)
+            end = n if nxt < 0 else nxt
+        fields.append((bytes(raw[pos:spc]), spc + 1, end))
+        pos = end + 1
+    return fields, n
+
+
+def kvlm_unfold(value):
+    return bytes(value).replace(b"\n ", b"\n")
+
+
+def kvlm_parse(raw):
     """
     Parse a key-value list with message (used by commits and tags).
     Returns a dict mapping keys→bytes (or key=None→message body).
     """
-    if dct is None:
-        dct = {}
-    spc = raw.find(b" ", start)
-    nl  = raw.find(b"\n", start)
-    # end of headers
-    if spc < 0 or nl < spc:
-        assert nl == start
-        dct[None] = raw[start+1:]
-        return dct
-    key = raw[start:spc]
-    end = start
-    # multiline values
-    while True:
-        end = raw.find(b"\n", end+1)
-        if raw[end+1] != ord(" "):
-            break
-    val = raw[spc+1:end].replace(b"\n ", b"\n")
-    if key in dct:
-        if isinstance(dct[key], list):
-            dct[key].append(val)
+    fields, body = kvlm_scan(raw)
+    dct = {}
+    for key, start, end in fields:
+        val = kvlm_unfold(raw[start:end])
+        if key in dct:
+            if isinstance(dct[key], list):
+                dct[key].append(val)
+            else:
+                dct[key] = [dct[key], val]
         else:
-            dct[key] = [dct[key], val]
-    else:
-        dct[key] = val
-    return kvlm_parse(raw, end+1, dct)
+            dct[key] = val
+    dct[None] = bytes(raw[body:])
+    return dct
+
 
 def kvlm_serialize(kvlm):
     """
     Serialize a dict produced by kvlm_parse back into bytes.
     """
-    out = b""
+    out = []
     for k, v in kvlm.items():
         if k is None:
             continue
         vals = v if isinstance(v, list) else [v]
         for item in vals:
             # fold newlines
-            folded = item.replace(b"\n", b"\n ")
-            out += k + b" " + folded + b"\n"
-    out += b"\n" + kvlm[None]
-    return out
+            out.append(k + b" " + item.replace(b"\n", b"\n ") + b"\n")
+    out.append(b"\n")
+    out.append(kvlm[None])
+    return b"".join(out)
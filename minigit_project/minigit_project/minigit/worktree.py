@@ -0,0 +1,247 @@
+"""
+Working tree inspection and updates against the index.
+"""
+
+import os
+import stat
+import time
+
+from .index import (index_read, index_write, index_entry_stat_matches,
+                    index_entry_from_stat, cache_tree_invalidate, RACY_WINDOW_NS)
+from .ignore import gitignore_read, check_ignore, check_ignore_dir
+from .fsmonitor import fsmonitor_positions, fsmonitor_dirty_dirs
+from .objects.base import object_hash
+from .objects.tree import BlobWriter, checkout_workers
+from .tree_diff import tree_diff
+
+def worktree_entry_check(repo, entry):
+    """
+    Compare one index entry with its file in the working tree, trusting
+    the cached stat data when it still matches. Returns (state, entry)
+    where state is None (unchanged), "modified" or "deleted"; when the
+    stat data changed but the content did not, entry is a refreshed
+    copy to store in the index, otherwise it is None.
+    """
+    path = os.path.join(repo.worktree, entry.name)
+    try:
+        st = os.lstat(path)
+    except FileNotFoundError:
+        return "deleted", None
+    if not stat.S_ISREG(st.st_mode):
+        return "deleted", None
+    if index_entry_stat_matches(entry, st):
+        return None, None
+    if entry.fsize and (st.st_size & 0xFFFFFFFF) != entry.fsize:
+        return "modified", None
+    with open(path, "rb") as f:
+        sha = object_hash(f, b"blob")
+        st = os.fstat(f.fileno())
+    if sha != entry.sha:
+        return "modified", None
+    return None, index_entry_from_stat(entry.name, st, sha)
+
+def worktree_changes(repo, idx, changed=None):
+    """
+    Compare each index entry with the file in the working tree.
+    Only files whose lstat data no longer matches the cached stat
+    fields are rehashed. With changed, the paths an fsmonitor reported
+    (see fsmonitor_changes), only entries under those paths or left
+    dirty last time are looked at. Returns (modified, deleted,
+    refreshed), where refreshed counts entries whose stat data was
+    updated in idx because the content turned out to be unchanged.
+    """
+    modified, deleted = [], []
+    refreshed = 0
+    if changed is None:
+        positions = range(len(idx.entries))
+    else:
+        positions = fsmonitor_positions(idx, changed)
+    for i in positions:
+        entry = idx.entries[i]
+        state, fresh = worktree_entry_check(repo, entry)
+        if state == "modified":
+            modified.append(entry.name)
+        elif state == "deleted":
+            deleted.append(entry.name)
+        elif fresh:
+            idx.entries[i] = fresh
+            refreshed += 1
+    idx.fsmonitor_dirty = set(modified) | set(deleted)
+    return modified, deleted, refreshed
+
+def _dir_listing(repo, path, old, new, racy_limit, dirty=None):
+    """
+    Sorted (name, is_dir) pairs of directory path, taken from the old
+    untracked cache while the directory's mtime is unchanged, or
+    without even a stat when an fsmonitor reported nothing in it (dirty
+    is then the set of directories it did report). Listings worth
+    caching are recorded in new; a directory modified within the racy
+    window is read again next time, since it could still change without
+    its mtime moving.
+    """
+    hit = old.get(path)
+    if hit is not None and dirty is not None and path not in dirty:
+        new[path] = hit
+        return hit[1]
+    full = os.path.join(repo.worktree, path)
+    try:
+        mtime_ns = os.stat(full).st_mtime_ns
+    except (FileNotFoundError, NotADirectoryError):
+        return []
+    if hit is not None and hit[0] == mtime_ns:
+        new[path] = hit
+        return hit[1]
+    with os.scandir(full) as it:
+        listing = sorted((e.name, e.is_dir(follow_symlinks=False)) for e in it)
+    if path == "":
+        listing = [item for item in listing if item[0] != ".minigit"]
+    if mtime_ns < racy_limit:
+        new[path] = (mtime_ns, listing)
+    return listing
+
+def worktree_untracked(repo, idx, rules=None, changed=None):
+    """
+    Sorted untracked paths of the worktree. A directory that holds no
+    tracked file is reported once as "dir/", and ignored directories
+    are never entered. Unless core.untrackedCache is false, directory
+    listings are kept in idx.untracked between runs; changed, the paths
+    an fsmonitor reported, lets unreported directories skip their stat.
+    Returns (paths, updated), where updated tells whether idx.untracked
+    was changed.
+    """
+    if rules is None:
+        rules = gitignore_read(repo)
+    tracked = set()
+    tracked_dirs = set()
+    for e in idx.entries:
+        tracked.add(e.name)
+        d = os.path.dirname(e.name)
+        while d and d not in tracked_dirs:
+            tracked_dirs.add(d)
+            d = os.path.dirname(d)
+    use_cache = repo.conf.getboolean("core", "untrackedcache", fallback=True)
+    old = (idx.untracked or {}) if use_cache else {}
+    new = {}
+    racy_limit = int(time.time() * 10**9) - RACY_WINDOW_NS
+    dirty = fsmonitor_dirty_dirs(changed) if changed is not None else None
+
+    def has_untracked(top):
+        # any file below top that is not ignored; stops at the first one
+        stack = [top]
+        while stack:
+            path = stack.pop()
+            for name, is_dir in _dir_listing(repo, path, old, new, racy_limit, dirty):
+                sub = path + "/" + name
+                if not is_dir:
+                    if not check_ignore(rules, sub):
+                        return True
+                elif not check_ignore_dir(rules, sub):
+                    stack.append(sub)
+        return False
+
+    out = []
+    stack = [""]
+    while stack:
+        path = stack.pop()
+        for name, is_dir in _dir_listing(repo, path, old, new, racy_limit, dirty):
+            sub = path + "/" + name if path else name
+            if is_dir:
+                if check_ignore_dir(rules, sub):
+                    continue
+                if sub in tracked_dirs:
+                    stack.append(sub)
+                elif has_untracked(sub):
+                    out.append(sub + "/")
+            elif sub not in tracked and not check_ignore(rules, sub):
+                out.append(sub)
+    out.sort()
+    if not use_cache:
+        updated = idx.untracked is not None
+        idx.untracked = None
+        return out, updated
+    updated = new != idx.untracked
+    idx.untracked = new
+    return out, updated
+
+def worktree_remove(repo, name):
+    """
+    Delete a file from the worktree along with any parent directories
+    it leaves empty.
+    """
+    path = os.path.join(repo.worktree, name)
+    if os.path.lexists(path):
+        os.remove(path)
+    parent = os.path.dirname(path)
+    while parent != repo.worktree and parent.startswith(repo.worktree):
+        try:
+            os.rmdir(parent)
+        except OSError:
+            break
+        parent = os.path.dirname(parent)
+
+def checkout_trees(repo, old_tree, new_tree, workers=None):
+    """
+    Move the worktree and index from tree old_tree to tree new_tree
+    (SHAs; old_tree may be None), touching only the files tree_diff
+    reports as changed. Refuses, before changing anything, if that
+    would overwrite local modifications or untracked files. Files are
+    written by a pool of `workers` threads (see checkout_workers).
+    """
+    idx = index_read(repo)
+    entries = {e.name: e for e in idx.entries}
+    changes = list(tree_diff(repo, old_tree, new_tree))
+
+    conflicts = []
+    for change in changes:
+        path, target = change.path, change.new_sha
+        entry = entries.get(path)
+        if entry is None:
+            # untracked: only a problem if the target would overwrite it
+            full = os.path.join(repo.worktree, path)
+            if target and os.path.lexists(full) and not _same_content(full, target):
+                if not (os.path.isdir(full) and _removes_below(changes, path)):
+                    conflicts.append(path)
+        elif entry.sha == target:
+            continue  # already staged; carry any worktree edits along
+        elif entry.sha != change.old_sha or worktree_entry_check(repo, entry)[0] is not None:
+            conflicts.append(path)
+    if conflicts:
+        raise Exception(
+            "Your local changes to the following files would be overwritten:\n  "
+            + "\n  ".join(conflicts)
+        )
+
+    # deletions first, so a file can replace a directory and vice versa
+    for change in changes:
+        if change.new_sha is None and change.path in entries:
+            worktree_remove(repo, change.path)
+            del entries[change.path]
+    writes = [(c.path, c.new_sha) for c in changes
+              if c.new_sha and (c.path not in entries or entries[c.path].sha != c.new_sha)]
+    with BlobWriter(repo, checkout_workers(repo, len(writes), workers)) as writer:
+        made = set()
+        for path, sha in writes:
+            full = os.path.join(repo.worktree, path)
+            parent = os.path.dirname(full)
+            if parent not in made:
+                os.makedirs(parent, exist_ok=True)
+                made.add(parent)
+            writer.put(full, sha)
+    for path, sha in writes:
+        full = os.path.join(repo.worktree, path)
+        entries[path] = index_entry_from_stat(path, writer.stats[full], sha)
+
+    for change in changes:
+        cache_tree_invalidate(idx, change.path)
+    idx.entries = [entries[name] for name in sorted(entries)]
+    index_write(repo, idx)
+
+def _removes_below(changes, path):
+    prefix = path + "/"
+    return any(c.path.startswith(prefix) and c.new_sha is None for c in changes)
+
+def _same_content(path, sha):
+    if sha is None or not os.path.isfile(path):
+        return False
+    with open(path, "rb") as f:
+        return object_hash(f, b"blob") == sha
@@ -0,0 +1,296 @@
+"""
+Line diff engine. Lines are interned to small integers first, so the
+algorithms only ever compare ints. Lines that occur on one side only
+can never match and are marked changed up front; the rest go through
+Myers' O(ND) algorithm in its linear-space form (bisecting on the
+middle snake) or through histogram diff, which anchors on the rarest
+common lines and falls back to Myers where there are none.
+
+The result is a pair of "changed" flag lists, one per side, from which
+unified hunks are built.
+"""
+
+import math
+
+ALGORITHMS = ("myers", "histogram")
+# bytes looked at for a NUL when deciding whether a blob is binary
+BINARY_PROBE = 8000
+# histogram diff ignores lines occurring more often than this
+HISTOGRAM_MAX_CHAIN = 64
+# edit cost after which a Myers bisection settles for the furthest
+# point reached instead of the optimal split (as xdiff does)
+MYERS_MAX_COST_MIN = 256
+
+
+def is_binary(data):
+    return b"\x00" in data[:BINARY_PROBE]
+
+
+def split_lines(data):
+    """
+    Lines of data with their line endings, so a missing final newline
+    is a difference like any other.
+    """
+    lines = data.split(b"\n")
+    if lines[-1] == b"":
+        lines.pop()
+        return [line + b"\n" for line in lines]
+    return [line + b"\n" for line in lines[:-1]] + [lines[-1]]
+
+
+def _intern(a_lines, b_lines):
+    ids = {}
+    a = [ids.setdefault(line, len(ids)) for line in a_lines]
+    b = [ids.setdefault(line, len(ids)) for line in b_lines]
+    return a, b
+
+
+def _bisect(a, b, alo, ahi, blo, bhi):
+    """
+    Split point (x, y) on an optimal path through a[alo:ahi] and
+    b[blo:bhi], found by running Myers forwards and backwards until the
+    two searches overlap; None if the ranges have nothing in common.
+    Past max_cost edits the furthest point of the forward search is
+    taken instead, so very different inputs stay cheap at the price of
+    a diff that may not be minimal.
+    """
+    n, m = ahi - alo, bhi - blo
+    max_d = (n + m + 1) // 2
+    max_cost = max(MYERS_MAX_COST_MIN, int(math.sqrt(n + m)))
+    offset = max_d
+    size = 2 * max_d + 2
+    v1 = [-1] * size
+    v2 = [-1] * size
+    v1[offset + 1] = 0
+    v2[offset + 1] = 0
+    delta = n - m
+    front = delta % 2 != 0
+    k1start = k1end = k2start = k2end = 0
+    for d in range(max_d):
+        for k1 in range(-d + k1start, d + 1 - k1end, 2):
+            i = offset + k1
+            if k1 == -d or (k1 != d and v1[i - 1] < v1[i + 1]):
+                x1 = v1[i + 1]
+            else:
+                x1 = v1[i - 1] + 1
+            y1 = x1 - k1
+            while x1 < n and y1 < m and a[alo + x1] == b[blo + y1]:
+                x1 += 1
+                y1 += 1
+            v1[i] = x1
+            if x1 > n:
+                k1end += 2
+            elif y1 > m:
+                k1start += 2
+            elif front:
+                j = offset + delta - k1
+                if 0 <= j < size and v2[j] != -1 and x1 >= n - v2[j]:
+                    return alo + x1, blo + y1
+        for k2 in range(-d + k2start, d + 1 - k2end, 2):
+            i = offset + k2
+            if k2 == -d or (k2 != d and v2[i - 1] < v2[i + 1]):
+                x2 = v2[i + 1]
+            else:
+                x2 = v2[i - 1] + 1
+            y2 = x2 - k2
+            while x2 < n and y2 < m and a[ahi - 1 - x2] == b[bhi - 1 - y2]:
+                x2 += 1
+                y2 += 1
+            v2[i] = x2
+            if x2 > n:
+                k2end += 2
+            elif y2 > m:
+                k2start += 2
+            elif not front:
+                j = offset + delta - k2
+                if 0 <= j < size and v1[j] != -1:
+                    x1 = v1[j]
+                    if x1 >= n - x2:
+                        return alo + x1, blo + x1 - (delta - k2)
+        if d >= max_cost:
+            best = None
+            for k in range(-d, d + 1, 2):
+                x = v1[offset + k]
+                y = x - k
+                if 0 <= x <= n and 0 <= y <= m and 0 < x + y < n + m:
+                    if best is None or x + y > best[0] + best[1]:
+                        best = (x, y)
+            if best is not None:
+                return alo + best[0], blo + best[1]
+    return None
+
+
+def _trim(a, b, alo, ahi, blo, bhi):
+    while alo < ahi and blo < bhi and a[alo] == b[blo]:
+        alo += 1
+        blo += 1
+    while alo < ahi and blo < bhi and a[ahi - 1] == b[bhi - 1]:
+        ahi -= 1
+        bhi -= 1
+    return alo, ahi, blo, bhi
+
+
+def _mark(ca, cb, alo, ahi, blo, bhi):
+    for i in range(alo, ahi):
+        ca[i] = True
+    for j in range(blo, bhi):
+        cb[j] = True
+
+
+def _myers(a, b, ca, cb, alo, ahi, blo, bhi):
+    stack = [(alo, ahi, blo, bhi)]
+    while stack:
+        alo, ahi, blo, bhi = _trim(a, b, *stack.pop())
+        if alo == ahi or blo == bhi:
+            _mark(ca, cb, alo, ahi, blo, bhi)
+            continue
+        split = _bisect(a, b, alo, ahi, blo, bhi)
+        if split is None:
+            _mark(ca, cb, alo, ahi, blo, bhi)
+            continue
+        x, y = split
+        stack.append((x, ahi, y, bhi))
+        stack.append((alo, x, blo, y))
+
+
+def _histogram(a, b, ca, cb, alo, ahi, blo, bhi):
+    stack = [(alo, ahi, blo, bhi)]
+    while stack:
+        alo, ahi, blo, bhi = _trim(a, b, *stack.pop())
+        if alo == ahi or blo == bhi:
+            _mark(ca, cb, alo, ahi, blo, bhi)
+            continue
+        where = {}
+        for i in range(alo, ahi):
+            where.setdefault(a[i], []).append(i)
+        # the common region whose rarest line is rarest, longest on ties
+        best = None
+        j = blo
+        while j < bhi:
+            positions = where.get(b[j])
+            next_j = j + 1
+            if positions is not None and len(positions) <= HISTOGRAM_MAX_CHAIN:
+                for i in positions:
+                    s, t = i, j
+                    while s > alo and t > blo and a[s - 1] == b[t - 1]:
+                        s -= 1
+                        t -= 1
+                    e, f = i + 1, j + 1
+                    while e < ahi and f < bhi and a[e] == b[f]:
+                        e += 1
+                        f += 1
+                    rarity = min(len(where[a[k]]) for k in range(s, e))
+                    key = (rarity, -(e - s))
+                    if best is None or key < best[0]:
+                        best = (key, s, e, t, f)
+                    next_j = max(next_j, f)
+            j = next_j
+        if best is None:
+            _myers(a, b, ca, cb, alo, ahi, blo, bhi)
+            continue
+        _, s, e, t, f = best
+        stack.append((e, ahi, f, bhi))
+        stack.append((alo, s, blo, t))
+
+
+def diff_lines(a_lines, b_lines, algorithm="myers"):
+    """
+    Compare two lists of lines. Returns (changed_a, changed_b): flags
+    telling which lines were deleted from a and inserted into b.
+    """
+    if algorithm not in ALGORITHMS:
+        raise Exception(f"Unknown diff algorithm: {algorithm}")
+    a, b = _intern(a_lines, b_lines)
+    ca = [False] * len(a)
+    cb = [False] * len(b)
+    # lines unique to one side are changed whatever else happens; diff
+    # only the lines that could match, then map the result back
+    in_a, in_b = set(a), set(b)
+    ka = [i for i, x in enumerate(a) if x in in_b]
+    kb = [j for j, x in enumerate(b) if x in in_a]
+    for i, x in enumerate(a):
+        if x not in in_b:
+            ca[i] = True
+    for j, x in enumerate(b):
+        if x not in in_a:
+            cb[j] = True
+    ra = [a[i] for i in ka]
+    rb = [b[j] for j in kb]
+    rca = [False] * len(ra)
+    rcb = [False] * len(rb)
+    run = _histogram if algorithm == "histogram" else _myers
+    run(ra, rb, rca, rcb, 0, len(ra), 0, len(rb))
+    for pos, i in enumerate(ka):
+        ca[i] = rca[pos]
+    for pos, j in enumerate(kb):
+        cb[j] = rcb[pos]
+    return ca, cb
+
+
+def change_blocks(ca, cb):
+    """
+    Yield (a_start, a_count, b_start, b_count) for each run of changes.
+    """
+    i = j = 0
+    n, m = len(ca), len(cb)
+    while i < n or j < m:
+        if i < n and j < m and not ca[i] and not cb[j]:
+            i += 1
+            j += 1
+            continue
+        si, sj = i, j
+        while i < n and ca[i]:
+            i += 1
+        while j < m and cb[j]:
+            j += 1
+        yield si, i - si, sj, j - sj
+
+
+def _range(start, count):
+    # as in unified diff headers: 1-based, ",1" implied, empty ranges
+    # named by the line before them
+    if count == 1:
+        return f"{start + 1}"
+    if count == 0:
+        return f"{start},0"
+    return f"{start + 1},{count}"
+
+
+def unified_hunks(a_lines, b_lines, ca, cb, context=3):
+    """
+    Unified diff hunks as a list of byte strings, one per output line.
+    """
+    out = []
+    blocks = list(change_blocks(ca, cb))
+    k = 0
+    while k < len(blocks):
+        # merge blocks whose context would touch or overlap
+        first = k
+        while (k + 1 < len(blocks)
+               and blocks[k + 1][0] - (blocks[k][0] + blocks[k][1]) <= 2 * context):
+            k += 1
+        last = blocks[k]
+        a_start = max(0, blocks[first][0] - context)
+        b_start = max(0, blocks[first][2] - context)
+        a_end = min(len(a_lines), last[0] + last[1] + context)
+        b_end = min(len(b_lines), last[2] + last[3] + context)
+        out.append(f"@@ -{_range(a_start, a_end - a_start)} +{_range(b_start, b_end - b_start)} @@\n".encode())
+        i, j = a_start, b_start
+        for ai, an, bj, bn in blocks[first:k + 1]:
+            for line in a_lines[i:ai]:
+                out.append(_line(b" ", line))
+            for line in a_lines[ai:ai + an]:
+                out.append(_line(b"-", line))
+            for line in b_lines[bj:bj + bn]:
+                out.append(_line(b"+", line))
+            i, j = ai + an, bj + bn
+        for line in a_lines[i:a_end]:
+            out.append(_line(b" ", line))
+        k += 1
+    return out
+
+
+def _line(prefix, line):
+    if line.endswith(b"\n"):
+        return prefix + line
+    return prefix + line + b"\n\\ No newline at end of file\n"
@@ -0,0 +1,92 @@
+"""
+Line-level three-way merge (diff3). Both sides are diffed against the
+base with the xdiff engine; changes that touch or overlap in the base
+form one region, taken from whichever side changed it, or written out
+between conflict markers when both sides changed it differently.
+Everything happens in memory.
+"""
+
+from .xdiff import change_blocks, diff_lines, split_lines
+
+MARKER_SIZE = 7
+
+
+def _hunks(base, side, algorithm):
+    ca, cb = diff_lines(base, side, algorithm)
+    return [(a, a + an, b, b + bn) for a, an, b, bn in change_blocks(ca, cb)]
+
+
+def _regions(ours, theirs):
+    """
+    Yield (base_start, base_end, our_hunks, their_hunks) for each group
+    of hunks that touch or overlap in base coordinates.
+    """
+    hunks = sorted([(h[0], h[1], 0, h) for h in ours] + [(h[0], h[1], 1, h) for h in theirs])
+    i = 0
+    while i < len(hunks):
+        start, end = hunks[i][0], hunks[i][1]
+        sides = ([], [])
+        while i < len(hunks) and hunks[i][0] <= end:
+            end = max(end, hunks[i][1])
+            sides[hunks[i][2]].append(hunks[i][3])
+            i += 1
+        yield start, end, sides[0], sides[1]
+
+
+def _side_range(start, end, hunks):
+    # outside its hunks a side equals the base, so the region maps to
+    # the side's lines by the offsets of its first and last hunk
+    first, last = hunks[0], hunks[-1]
+    return first[2] - (first[0] - start), last[3] + (end - last[1])
+
+
+def _block(lines):
+    # a marker must start on a line of its own
+    if lines and not lines[-1].endswith(b"\n"):
+        return lines[:-1] + [lines[-1] + b"\n"]
+    return lines
+
+
+def merge3(base, ours, theirs, ours_label="ours", theirs_label="theirs", algorithm="myers"):
+    """
+    Merge the byte strings ours and theirs, both descended from base.
+    Returns (merged bytes, number of conflicts).
+    """
+    base_lines, our_lines, their_lines = split_lines(base), split_lines(ours), split_lines(theirs)
+    out = []
+    conflicts = 0
+    pos = 0
+    for start, end, mine, yours in _regions(_hunks(base_lines, our_lines, algorithm),
+                                             _hunks(base_lines, their_lines, algorithm)):
+        out.extend(base_lines[pos:start])
+        pos = end
+        if not yours:
+            s, e = _side_range(start, end, mine)
+            out.extend(our_lines[s:e])
+            continue
+        if not mine:
+            s, e = _side_range(start, end, yours)
+            out.extend(their_lines[s:e])
+            continue
+        s, e = _side_range(start, end, mine)
+        a = our_lines[s:e]
+        s, e = _side_range(start, end, yours)
+        b = their_lines[s:e]
+        # lines both sides agree on stay outside the markers
+        head = 0
+        while head < len(a) and head < len(b) and a[head] == b[head]:
+            head += 1
+        tail = 0
+        while tail < len(a) - head and tail < len(b) - head and a[-1 - tail] == b[-1 - tail]:
+            tail += 1
+        out.extend(a[:head])
+        if head + tail < len(a) or head + tail < len(b):
+            conflicts += 1
+            out.append(b"<" * MARKER_SIZE + b" " + ours_label.encode() + b"\n")
+            out.extend(_block(a[head:len(a) - tail]))
+            out.append(b"=" * MARKER_SIZE + b"\n")
+            out.extend(_block(b[head:len(b) - tail]))
+            out.append(b">" * MARKER_SIZE + b" " + theirs_label.encode() + b"\n")
+        out.extend(a[len(a) - tail:])
+    out.extend(base_lines[pos:])
+    return b"".join(out), conflicts
@@ -0,0 +1,49 @@
+import os
+import shutil
+import tempfile
+import unittest
+from datetime import datetime, timezone
+
+from minigit.repository import repo_create
+from minigit.objects.base import object_write
+from minigit.objects.blob import GitBlob
+from minigit.objects.tree import tree_update
+from minigit.commands.commit import _commit_create
+from minigit.revwalk import rev_walk, ORDER_TOPO
+
+AUTHOR = "Test <test@example.com>"
+
+
+class SkewedHistoryTest(unittest.TestCase):
+    """
+    R <- A <- B <- C, where B claims to be older than everything else.
+    """
+
+    def setUp(self):
+        self.path = tempfile.mkdtemp(prefix="minigit-test-")
+        self.repo = repo_create(os.path.join(self.path, "repo"))
+        blob = object_write(GitBlob(b"x\n"), self.repo)
+        tree = tree_update(self.repo, None, {"x": (b"100644", blob)})
+        parents = []
+        for name, when in (("R", 100), ("A", 200), ("B", 50), ("C", 300)):
+            ts = datetime.fromtimestamp(when, timezone.utc)
+            sha = _commit_create(self.repo, tree, parents, AUTHOR, ts, name + "\n")
+            setattr(self, name, sha)
+            parents = [sha]
+
+    def tearDown(self):
+        shutil.rmtree(self.path)
+
+    def test_range_from_ancestor_is_empty(self):
+        # C is newer than A, but A is its ancestor all the same
+        self.assertEqual(list(rev_walk(self.repo, [self.A], [self.C])), [])
+
+    def test_range_keeps_children_ahead_of_parents(self):
+        self.assertEqual(list(rev_walk(self.repo, [self.C], [self.R])),
+                         [self.C, self.B, self.A])
+        self.assertEqual(list(rev_walk(self.repo, [self.C], [self.R], order=ORDER_TOPO)),
+                         [self.C, self.B, self.A])
+
+
+if __name__ == "__main__":
+    unittest.main()
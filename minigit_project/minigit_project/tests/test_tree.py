@@ -0,0 +1,39 @@
+import unittest
+
+from minigit.objects.tree import GitTree
+
+SHA = bytes(range(20))
+
+
+def _raw(*entries):
+    return b"".join(b"%s %s\x00%s" % (mode, name, SHA) for mode, name in entries)
+
+
+class LookupTest(unittest.TestCase):
+
+    def _tree(self, raw):
+        tree = GitTree()
+        tree.deserialize(raw)
+        return tree
+
+    def test_git_order(self):
+        # "a.d" sorts before the directory "a", which sorts as "a/"
+        tree = self._tree(_raw((b"100644", b"a-"), (b"100644", b"a.d"),
+                               (b"40000", b"a"), (b"100644", b"b")))
+        self.assertEqual(tree.lookup("a").mode, b"40000")
+        self.assertEqual(tree.lookup("a.d").sha, SHA.hex())
+        self.assertIsNone(tree.lookup("a0"))
+        self.assertTrue(tree._ordered)
+
+    def test_legacy_order(self):
+        # older minigit trees were sorted by plain name
+        tree = self._tree(_raw((b"100644", b"a-"), (b"040000", b"a"),
+                               (b"100644", b"a.d"), (b"100644", b"b")))
+        self.assertFalse(tree._ordered)
+        self.assertEqual(tree.lookup("a").mode, b"040000")
+        self.assertEqual(tree.lookup("a.d").path, "a.d")
+        self.assertIsNone(tree.lookup("c"))
+
+
+if __name__ == "__main__":
+    unittest.main()